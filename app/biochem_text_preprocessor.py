@@ -6,13 +6,119 @@ per modelli TTS, mantenendo pronuncia corretta in contesto accademico.
 """
 
 import re
+import threading
+from collections import OrderedDict
 from typing import Dict, List, Tuple
 
+# Pattern fissi precompilati una volta per modulo
+_GENERIC_RE = re.compile(r'([A-Z][a-z]?)(\d+)')
+_EXPONENT_RE = re.compile(r'(\d+|\w)\^(-?)(\d+)')
+
+
+def _is_word(ch: str) -> bool:
+    return ch.isalnum() or ch == '_'
+
+
+class _TableMatcher:
+    """Sostituzioni di un dizionario in una sola scansione.
+
+    Il comportamento di riferimento sono le passate `re.sub(r'\\b' + k + r'\\b')`
+    chiave per chiave, in ordine di inserimento: una sostituzione può cambiare
+    il confine di parola di un match adiacente (es. "Na+K+" -> "sodium ionK+",
+    il K+ non viene più toccato). L'alternanza unica si usa quando i match non
+    interagiscono (il caso normale); altrimenti si rifanno le passate per
+    chiave, con pattern già compilati e solo per le chiavi presenti nel testo."""
+
+    def __init__(self, table: Dict[str, str]):
+        self.table = dict(table)
+        self.keys = tuple(self.table)
+        # chiavi più lunghe prima: a parità di posizione vince il termine più lungo
+        alts = '|'.join(map(re.escape, sorted(self.keys, key=len, reverse=True)))
+        self.pattern = re.compile(r'\b(?:' + alts + r')\b') if self.keys else None
+        self.per_key = [(k, re.compile(r'\b' + re.escape(k) + r'\b'))
+                        for k in self.keys]
+        # bordi la cui sostituzione cambia classe (parola/non parola)
+        self.left_flip = {k for k, v in self.table.items()
+                          if not (k and v) or _is_word(k[0]) != _is_word(v[0])}
+        self.right_flip = {k for k, v in self.table.items()
+                           if not (k and v) or _is_word(k[-1]) != _is_word(v[-1])}
+        self.single_pass_safe = self._check_single_pass()
+
+    def _check_single_pass(self) -> bool:
+        """False se il dizionario ammette catene o precedenze che l'alternanza
+        non riproduce: sostituzioni che contengono o formano altre chiavi,
+        chiavi contenute in altre che vengono prima nell'ordine."""
+        for i, k1 in enumerate(self.keys):
+            for k2 in self.keys[i + 1:]:
+                if self._bounded_in(k1, k2):
+                    return False
+        for v in self.table.values():
+            if any(self._bounded_in(k, v) for k in self.keys):
+                return False
+        for v_key, v in self.table.items():
+            for k in self.keys:
+                for i in range(1, len(k)):
+                    cut = _is_word(k[i - 1]) != _is_word(k[i])
+                    if (cut or v_key in self.right_flip) and v.endswith(k[:i]):
+                        return False
+                    if (cut or v_key in self.left_flip) and v.startswith(k[i:]):
+                        return False
+        return True
+
+    @staticmethod
+    def _bounded_in(inner: str, outer: str) -> bool:
+        """inner compare dentro outer con confini di parola propri (ai bordi di
+        outer il confine lo decide il contesto: si assume presente)."""
+        j = outer.find(inner)
+        while j != -1:
+            end = j + len(inner)
+            if ((j == 0 or _is_word(outer[j - 1]) != _is_word(outer[j]))
+                    and (end == len(outer)
+                         or _is_word(outer[end - 1]) != _is_word(outer[end]))):
+                return True
+            j = outer.find(inner, j + 1)
+        return False
+
+    def _interacting(self, text: str, matches) -> bool:
+        for m in matches:
+            key = m.group(0)
+            if key in self.right_flip and text.startswith(self.keys, m.end()):
+                return True
+            if key in self.left_flip and text.endswith(self.keys, 0, m.start()):
+                return True
+            # un match che scavalca la fine di m (quelli contenuti li copre
+            # già _check_single_pass)
+            pos = m.start() + 1
+            while (nxt := self.pattern.search(text, pos)) and nxt.start() < m.end():
+                if nxt.end() > m.end():
+                    return True
+                pos = nxt.start() + 1
+        return False
+
+    def sub(self, text: str) -> str:
+        if self.pattern is None:
+            return text
+        matches = list(self.pattern.finditer(text))
+        if not matches:
+            return text
+        if self.single_pass_safe and not self._interacting(text, matches):
+            parts, pos = [], 0
+            for m in matches:
+                parts.append(text[pos:m.start()])
+                parts.append(self.table[m.group(0)])
+                pos = m.end()
+            parts.append(text[pos:])
+            return ''.join(parts)
+        for key, pattern in self.per_key:
+            if key in text:
+                text = pattern.sub(lambda _m, r=self.table[key]: r, text)
+        return text
+
 
 class BiochemTextPreprocessor:
     """Preprocessore specializzato per testi di biochimica."""
 
-    def __init__(self):
+    def __init__(self, cache_size: int = 0):
         # Dizionario formule chimiche comuni
         self.chemical_formulas = {
             # Molecole semplici
@@ -110,10 +216,55 @@ class BiochemTextPreprocessor:
             "IR": "I R",
         }
 
+        # Unità di misura
+        self.units = {
+            "mM": "millimolar",
+            "μM": "micromolar",
+            "nM": "nanomolar",
+            "M": " molar",  # Spazio per evitare conflitti con M in altre parole
+            "mg/mL": "milligrams per milliliter",
+            "μg/mL": "micrograms per milliliter",
+            "ng/mL": "nanograms per milliliter",
+            "kDa": "kilodaltons",
+            "Da": "daltons",
+            "bp": "base pairs",
+            "kb": "kilobase pairs",
+            "ºC": "degrees Celsius",
+            "°C": "degrees Celsius",
+            "nm": "nanometers",
+            "μm": "micrometers",
+            "mL": "milliliters",
+            "μL": "microliters",
+        }
+
         # Pattern per numeri con subscript/superscript
-        self.subscript_pattern = re.compile(r'([A-Z][a-z]?)(\d+)')
+        self.subscript_pattern = _GENERIC_RE
         self.superscript_pattern = re.compile(r'([A-Z][a-z]?)(\d+)\+')
 
+        # Matcher compilati per dizionario, ricostruiti solo se le tabelle cambiano
+        self._compiled = None
+        self._compile_lock = threading.Lock()
+
+        # Memo LRU testo -> testo processato (0 = disattivato): batch e scene
+        # ripetono spesso le stesse frasi
+        self.cache_size = cache_size
+        self._memo: OrderedDict[str, str] = OrderedDict()
+        self._memo_lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def _matchers(self):
+        """Matcher di ioni, formule, acronimi e unità (ordine di preprocess())."""
+        compiled = self._compiled
+        if compiled is None:
+            with self._compile_lock:
+                compiled = self._compiled
+                if compiled is None:
+                    tables = (self.ions, self.chemical_formulas, self.acronyms)
+                    compiled = [_TableMatcher(t) for t in tables]
+                    compiled.append(_TableMatcher(self.units))
+                    self._compiled = compiled
+        return compiled
+
     def preprocess(self, text: str) -> str:
         """
         Preprocessa testo biochimico per TTS.
@@ -124,24 +275,55 @@ class BiochemTextPreprocessor:
         Returns:
             Testo processato con pronuncia corretta
         """
+        if not self.cache_size:
+            return self._preprocess(text)
+        with self._memo_lock:
+            cached = self._memo.get(text)
+            if cached is not None:
+                self._memo.move_to_end(text)
+                self.hits += 1
+                return cached
+            self.misses += 1
+        result = self._preprocess(text)
+        with self._memo_lock:
+            self._memo[text] = result
+            while len(self._memo) > self.cache_size:
+                self._memo.popitem(last=False)
+        return result
+
+    def preprocess_many(self, texts: List[str]) -> List[str]:
+        """
+        Preprocessa una lista di testi (stesso ordine), una volta per testo distinto.
+
+        Args:
+            texts: Testi originali
+
+        Returns:
+            Testi processati
+        """
+        done: Dict[str, str] = {}
+        for text in texts:
+            if text not in done:
+                done[text] = self.preprocess(text)
+        return [done[t] for t in texts]
+
+    def _preprocess(self, text: str) -> str:
+        ions, formulas, acronyms, units = self._matchers()
+
         # 1. Sostituisci ioni (prima, perché contengono caratteri speciali)
-        for ion, pronunciation in self.ions.items():
-            # Usa word boundary per evitare sostituzioni parziali
-            text = re.sub(r'\b' + re.escape(ion) + r'\b', pronunciation, text)
+        text = ions.sub(text)
 
         # 2. Sostituisci formule chimiche comuni
-        for formula, pronunciation in self.chemical_formulas.items():
-            text = re.sub(r'\b' + re.escape(formula) + r'\b', pronunciation, text)
+        text = formulas.sub(text)
 
         # 3. Sostituisci acronimi
-        for acronym, pronunciation in self.acronyms.items():
-            text = re.sub(r'\b' + re.escape(acronym) + r'\b', pronunciation, text)
+        text = acronyms.sub(text)
 
         # 4. Gestisci pattern generici (es. H3PO4 -> H three P O four)
         text = self._process_generic_formulas(text)
 
         # 5. Gestisci unità di misura
-        text = self._process_units(text)
+        text = units.sub(text)
 
         # 6. Gestisci numeri con esponenti (es. 10^-7 -> 10 to the power of negative 7)
         text = self._process_exponents(text)
@@ -151,52 +333,13 @@ class BiochemTextPreprocessor:
     def _process_generic_formulas(self, text: str) -> str:
         """Processa formule chimiche generiche non nel dizionario."""
         # Pattern: Lettera maiuscola opzionalmente seguita da minuscola, poi numero
-        # Es: H2, Ca2, O3
-        def replace_subscript(match):
-            element = match.group(1)
-            number = match.group(2)
-            # Se non è già stata sostituita
-            return f"{element} {number}"
-
-        # Solo se non contiene spazi (per evitare di processare testo già processato)
-        words = text.split()
-        processed_words = []
-
-        for word in words:
-            # Controlla se è una formula chimica (contiene lettere maiuscole e numeri)
-            if re.search(r'[A-Z][a-z]?\d', word) and not ' ' in word:
-                # Processa subscript
-                word = self.subscript_pattern.sub(replace_subscript, word)
-            processed_words.append(word)
-
-        return ' '.join(processed_words)
+        # Es: H2, Ca2, O3. Il pattern non attraversa spazi, quindi una sola sub
+        # sul testo normalizzato equivale a processare parola per parola.
+        return self.subscript_pattern.sub(r'\1 \2', ' '.join(text.split()))
 
     def _process_units(self, text: str) -> str:
         """Processa unità di misura scientifiche."""
-        units = {
-            "mM": "millimolar",
-            "μM": "micromolar",
-            "nM": "nanomolar",
-            "M": " molar",  # Spazio per evitare conflitti con M in altre parole
-            "mg/mL": "milligrams per milliliter",
-            "μg/mL": "micrograms per milliliter",
-            "ng/mL": "nanograms per milliliter",
-            "kDa": "kilodaltons",
-            "Da": "daltons",
-            "bp": "base pairs",
-            "kb": "kilobase pairs",
-            "ºC": "degrees Celsius",
-            "°C": "degrees Celsius",
-            "nm": "nanometers",
-            "μm": "micrometers",
-            "mL": "milliliters",
-            "μL": "microliters",
-        }
-
-        for unit, pronunciation in units.items():
-            text = re.sub(r'\b' + re.escape(unit) + r'\b', pronunciation, text)
-
-        return text
+        return self._matchers()[3].sub(text)
 
     def _process_exponents(self, text: str) -> str:
         """Processa notazione esponenziale."""
@@ -210,7 +353,7 @@ class BiochemTextPreprocessor:
             return f"{base} to the power of {sign_word}{exp}"
 
         # Match: numero^(opzionale segno)numero
-        text = re.sub(r'(\d+|\w)\^(-?)(\d+)', replace_exponent, text)
+        text = _EXPONENT_RE.sub(replace_exponent, text)
 
         return text
 
@@ -233,6 +376,24 @@ class BiochemTextPreprocessor:
             if not hasattr(self, 'custom_mappings'):
                 self.custom_mappings = {}
             self.custom_mappings.update(mappings)
+        self._compiled = None  # ricompila al prossimo preprocess()
+        with self._memo_lock:
+            self._memo.clear()
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_preprocessor() -> BiochemTextPreprocessor:
+    """Istanza condivisa (tabelle, pattern compilati e memo una volta per processo)."""
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                from app import config as appconfig
+                _default = BiochemTextPreprocessor(cache_size=appconfig.BIOCHEM_CACHE_SIZE)
+    return _default
 
 
 def preprocess_biochem_text(text: str, custom_mappings: Dict[str, str] = None) -> str:
@@ -246,11 +407,12 @@ def preprocess_biochem_text(text: str, custom_mappings: Dict[str, str] = None) -
     Returns:
         Testo processato
     """
-    preprocessor = BiochemTextPreprocessor()
-
-    if custom_mappings:
-        preprocessor.add_custom_mappings(custom_mappings)
+    if not custom_mappings:
+        return get_preprocessor().preprocess(text)
 
+    # istanza dedicata: i mapping personalizzati non devono sporcare quella condivisa
+    preprocessor = BiochemTextPreprocessor()
+    preprocessor.add_custom_mappings(custom_mappings)
     return preprocessor.preprocess(text)
 
 
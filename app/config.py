@@ -1,4 +1,6 @@
-"""Path centralizzati del progetto, risolti rispetto alla root del repo."""
+"""Path e parametri centralizzati del progetto (path risolti rispetto alla root
+del repo, parametri sovrascrivibili da variabili d'ambiente GASSMANN_*)."""
+import os
 from pathlib import Path
 
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
@@ -8,3 +10,64 @@ SAMPLES_DIR = PROJECT_ROOT / "VOICE_SAMPLES"
 
 for _d in (OUTPUT_DIR, SAMPLES_DIR):
     _d.mkdir(parents=True, exist_ok=True)
+
+# Thread per il post-processing (DSP, trim, encode) in parallelo all'inferenza
+CPU_WORKERS = int(os.environ.get("GASSMANN_CPU_WORKERS", "2"))
+# Residenza dei modelli (design/base): budget di memoria (MB, 0 = nessun limite,
+# restano entrambi), scarico dopo N s senza generazioni (0 = mai), precaricamento
+# del modello che serve ai job in coda
+MODEL_BUDGET_BYTES = int(os.environ.get("GASSMANN_MODEL_BUDGET_MB", "0")) * 2**20
+MODEL_IDLE_S = float(os.environ.get("GASSMANN_MODEL_IDLE_S", "0"))
+MODEL_PREFETCH = os.environ.get("GASSMANN_MODEL_PREFETCH", "1") != "0"
+# Processi modello dietro l'API (ognuno col suo ModelManager, affinità per voce);
+# 0 = modelli nel processo del server
+MODEL_WORKERS = int(os.environ.get("GASSMANN_MODEL_WORKERS", "0"))
+# Modelli da scaldare allo startup (generazione sintetica minima, vedi
+# /api/health/ready), separati da virgola: "base", "design"; vuoto = nessuno
+WARMUP_MODELS = [m.strip() for m in os.environ.get("GASSMANN_WARMUP_MODELS", "base").split(",")
+                 if m.strip()]
+# App desktop: attesa massima del warm-up prima di aprire comunque la finestra
+READY_TIMEOUT_S = float(os.environ.get("GASSMANN_READY_TIMEOUT_S", "300"))
+# Processi per pitch/tempo (librosa) fuori dal processo server; 0 = in-process
+DSP_PROCESSES = int(os.environ.get("GASSMANN_DSP_PROCESSES", "2"))
+
+# Job: i finiti si tengono N ore (store SQLite in CACHE_DIR, o memoria), il
+# progress si scrive su disco a lotti ogni N secondi
+JOB_TTL_S = float(os.environ.get("GASSMANN_JOB_TTL_H", "24")) * 3600
+JOB_FLUSH_S = float(os.environ.get("GASSMANN_JOB_FLUSH_S", "1.0"))
+
+# Micro-batch di inferenza (/api/batch, scene): max testi per generate e max
+# quota di padding sprecato (1 - somma lunghezze / (lunghezza max * n))
+BATCH_MAX_SIZE = int(os.environ.get("GASSMANN_BATCH_MAX_SIZE", "8"))
+BATCH_MAX_PAD_WASTE = float(os.environ.get("GASSMANN_BATCH_MAX_PAD_WASTE", "0.35"))
+
+# Cache su disco (render già generati, ecc.): fuori da OUTPUT, si può cancellare
+CACHE_DIR = PROJECT_ROOT / "cache"
+RENDER_CACHE_MAX_BYTES = int(os.environ.get("GASSMANN_RENDER_CACHE_MB", "512")) * 2**20
+
+# Cache dei voice_clone_prompt codificati (memoria stimata dei tensori)
+CLONE_PROMPT_CACHE_BYTES = int(os.environ.get("GASSMANN_CLONE_PROMPT_CACHE_MB", "256")) * 2**20
+
+# Testi lunghi: segmenti di al più N caratteri (proxy dei token), retry per
+# segmento e crossfade alla giunta
+SEGMENT_MAX_CHARS = int(os.environ.get("GASSMANN_SEGMENT_MAX_CHARS", "400"))
+SEGMENT_RETRIES = int(os.environ.get("GASSMANN_SEGMENT_RETRIES", "1"))
+SEGMENT_CROSSFADE_MS = float(os.environ.get("GASSMANN_SEGMENT_CROSSFADE_MS", "30"))
+
+# Memo LRU dei testi già normalizzati dal preprocessore biochimico (n. di testi)
+BIOCHEM_CACHE_SIZE = int(os.environ.get("GASSMANN_BIOCHEM_CACHE_SIZE", "4096"))
+
+# Retention di OUTPUT: budget disco (MB) ed età massima dall'ultimo accesso
+# (giorni); 0 = nessun limite. I file pinnati (es. clip di una scena) restano.
+OUTPUT_MAX_MB = int(os.environ.get("GASSMANN_OUTPUT_MAX_MB", "0"))
+OUTPUT_MAX_AGE_DAYS = float(os.environ.get("GASSMANN_OUTPUT_MAX_AGE_DAYS", "0"))
+RETENTION_INTERVAL_S = float(os.environ.get("GASSMANN_RETENTION_INTERVAL_S", "600"))
+# file toccati da meno di così non si rimuovono (appena generati, non ancora scaricati)
+RETENTION_GRACE_S = float(os.environ.get("GASSMANN_RETENTION_GRACE_S", "300"))
+
+# Cache dei clip decodificati per lo stitch delle scene Teatro (MB di PCM in RAM)
+CLIP_CACHE_BYTES = int(os.environ.get("GASSMANN_CLIP_CACHE_MB", "256")) * 2**20
+
+# Scene mp3/ogg: encode in streaming (libsndfile in-process, o pipe a ffmpeg)
+# invece di scrivere il WAV intero e convertirlo dopo
+SCENE_STREAM_ENCODE = os.environ.get("GASSMANN_SCENE_STREAM_ENCODE", "1") != "0"
@@ -2,14 +2,19 @@
 
 Avvio: python -m app.desktop  (oppure doppio-click su GASSMANN.command)
 """
+import json
+import multiprocessing
 import socket
+import sys
 import threading
 import time
+import urllib.error
 import urllib.request
 
 import uvicorn
 import webview
 
+from app import config as appconfig
 from app.main import create_app
 
 HOST = "127.0.0.1"
@@ -24,16 +29,36 @@ def _free_port() -> int:
     return port
 
 
-def _wait_ready(url: str, timeout: float = 30.0) -> None:
-    """Aspetta che il server risponda, evita finestra bianca."""
+def _wait_ready(url: str, timeout: float = 30.0, ready_timeout: float = 300.0) -> dict:
+    """Aspetta che il server risponda (evita finestra bianca), poi che il warm-up
+    dei modelli sia finito (/api/health/ready → 200), al massimo ready_timeout:
+    oltre, la finestra si apre comunque e il modello finisce di caricare dopo.
+    Un componente in errore non diventerà mai pronto: si ritorna subito con
+    {componente: errore} (vuoto se tutto ok)."""
     deadline = time.time() + timeout
-    while time.time() < deadline:
+    up = False
+    while True:
         try:
-            urllib.request.urlopen(url, timeout=1)
-            return
+            urllib.request.urlopen(url + "/api/health/ready", timeout=1)
+            return {}  # 200: pronto
+        except urllib.error.HTTPError as e:  # 503: server su, warm-up in corso o fallito
+            if not up:
+                up, deadline = True, time.time() + ready_timeout
+            try:
+                components = json.loads(e.read())["components"]
+            except (ValueError, KeyError):
+                components = {}
+            failed = {k: c.get("error", "errore") for k, c in components.items()
+                      if c.get("status") == "error"}
+            if failed:
+                return failed
         except Exception:
-            time.sleep(0.2)
-    raise RuntimeError(f"Server non pronto entro {timeout}s su {url}")
+            pass
+        if time.time() >= deadline:
+            if up:
+                return {}
+            raise RuntimeError(f"Server non pronto entro {timeout}s su {url}")
+        time.sleep(0.2)
 
 
 def main() -> None:
@@ -43,10 +68,16 @@ def main() -> None:
     server = uvicorn.Server(uvicorn.Config(create_app(), host=HOST, port=port, log_level="warning"))
     threading.Thread(target=server.run, daemon=True).start()
 
-    _wait_ready(url)
-    webview.create_window("GASSMANN", url, width=1100, height=820)
+    failed = _wait_ready(url, ready_timeout=appconfig.READY_TIMEOUT_S)
+    title = "GASSMANN"
+    if failed:  # la UI si apre lo stesso: le voci non toccate dal guasto funzionano
+        for name, error in failed.items():
+            print(f"warm-up fallito ({name}): {error}", file=sys.stderr)
+        title += " — warm-up fallito: " + ", ".join(failed)
+    webview.create_window(title, url, width=1100, height=820)
     webview.start()  # blocca sul main thread (richiesto su macOS)
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # app impacchettata: worker del pool DSP
     main()
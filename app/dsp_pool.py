@@ -0,0 +1,134 @@
+"""DSP post-generazione (pitch/tempo + gain) in un pool di processi.
+
+Lo stretch/resample di librosa è CPU-bound e tiene il GIL a tratti: nel processo
+principale rallenta event loop e thread del modello. Qui gira in processi
+separati (start method "spawn": il processo server ha thread e torch, fork non è
+sicuro). L'audio non viene picklato: il chiamante crea due segmenti di
+shared memory, ingresso e uscita (la durata finale è nota, len/rate), il worker
+li apre per nome, calcola e scrive l'uscita in place. Il chiamante copia
+l'uscita in un array suo e libera i segmenti.
+
+GASSMANN_DSP_PROCESSES = 0 → tutto in-process come prima (debug, macchine
+piccole).
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from app import config as appconfig
+
+
+def out_length(n: int, rate: float) -> int:
+    """Campioni in uscita da pitch_tempo (librosa.time_stretch arrotonda così)."""
+    return int(round(n / rate))
+
+
+def _warm() -> None:
+    """Initializer del worker: import di librosa/numba fuori dal primo job."""
+    from app import pipeline  # noqa: F401
+    import librosa  # noqa: F401
+
+
+def _work(src_name, dst_name, shape, n_out, sr, n_steps, rate, gain) -> None:
+    """Nel worker: pitch_tempo + gain + clip da src a dst (shared memory)."""
+    import librosa
+    from app.pipeline import pitch_tempo
+    src = shared_memory.SharedMemory(name=src_name)
+    dst = shared_memory.SharedMemory(name=dst_name)
+    try:
+        audio = np.ndarray(shape, dtype="float32", buffer=src.buf)
+        y = librosa.util.fix_length(pitch_tempo(audio, sr, n_steps, rate), size=n_out)
+        out = np.ndarray(shape[:-1] + (n_out,), dtype="float32", buffer=dst.buf)
+        np.clip(y * gain, -1.0, 1.0, out=out)
+        del audio, out  # nessun puntatore ai buffer prima del close
+    finally:
+        src.close()
+        dst.close()
+
+
+def _local(audio, sr, n_steps, rate, gain):
+    from app.pipeline import pitch_tempo
+    return np.clip(pitch_tempo(audio, sr, n_steps, rate) * gain, -1.0, 1.0)
+
+
+class DSPPool:
+    def __init__(self, processes: int | None = None):
+        self._processes = processes
+        self._lock = threading.Lock()
+        self._executor: ProcessPoolExecutor | None = None
+        self.tasks = self.local_tasks = self.restarts = 0
+
+    @property
+    def processes(self) -> int:
+        return self._processes if self._processes is not None else appconfig.DSP_PROCESSES
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # tracker dei segmenti avviato qui: i worker lo ereditano invece
+                # di avviarne uno proprio (che li rimuoverebbe alla loro uscita)
+                resource_tracker.ensure_running()
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes, initializer=_warm,
+                    mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def start(self) -> None:
+        """Avvia i worker in anticipo (startup del server), così il primo job non
+        paga spawn + import di librosa. No-op con processes = 0."""
+        if self.processes > 0:
+            pool = self._pool()
+            for f in [pool.submit(int) for _ in range(self.processes)]:
+                f.result()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+    def pitch_tempo(self, audio, sr, n_steps=0.0, rate=1.0, gain=1.0):
+        """clip(pitch_tempo(audio) * gain) calcolato in un worker del pool.
+        Solo gain (niente stretch) resta in-process: è una moltiplicazione."""
+        audio = np.ascontiguousarray(audio, dtype="float32")
+        if not n_steps and rate == 1.0:
+            return np.clip(audio * gain, -1.0, 1.0)
+        if self.processes <= 0 or audio.shape[-1] == 0:
+            self.local_tasks += 1
+            return _local(audio, sr, n_steps, rate, gain)
+        n_out = out_length(audio.shape[-1], rate)
+        shape_out = audio.shape[:-1] + (n_out,)
+        src = shared_memory.SharedMemory(create=True, size=max(1, audio.nbytes))
+        dst = shared_memory.SharedMemory(create=True, size=max(1, 4 * int(np.prod(shape_out))))
+        try:
+            np.ndarray(audio.shape, dtype="float32", buffer=src.buf)[:] = audio
+            pool = self._pool()
+            try:
+                pool.submit(_work, src.name, dst.name, audio.shape, n_out, sr,
+                            float(n_steps), float(rate), float(gain)).result()
+            except BrokenProcessPool:
+                # un worker è morto (es. OOM): il pool non è più usabile, il
+                # prossimo job ne crea uno nuovo
+                with self._lock:
+                    if self._executor is pool:
+                        self._executor = None
+                        self.restarts += 1
+                raise
+            self.tasks += 1
+            return np.ndarray(shape_out, dtype="float32", buffer=dst.buf).copy()
+        finally:
+            for shm in (src, dst):
+                shm.close()
+                shm.unlink()
+
+    def stats(self) -> dict:
+        return {"processes": self.processes, "running": self._executor is not None,
+                "tasks": self.tasks, "local_tasks": self.local_tasks,
+                "restarts": self.restarts}
+
+
+default_pool = DSPPool()
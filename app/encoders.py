@@ -0,0 +1,111 @@
+"""Encoder audio: dall'array float in memoria al file finale, senza WAV intermedio.
+
+Backend, nell'ordine in cui si provano per un formato:
+- "soundfile": libsndfile in-process (mp3 da libsndfile 1.1, ogg vorbis/opus);
+- "ffmpeg": PCM float32 in pipe su stdin di ffmpeg, nessun file temporaneo;
+- "pydub": il vecchio percorso (WAV su disco → AudioSegment → ffmpeg → via il WAV).
+"""
+import functools
+import os
+import shutil
+import subprocess
+
+import numpy as np
+import soundfile as sf
+
+from app import tracing
+
+# formato -> (estensione, formato libsndfile, subtype, opzioni di scrittura)
+FORMATS = {
+    "wav": (".wav", "WAV", "PCM_16", {}),
+    # CBR al bitrate massimo ammesso dal sample rate (160 kbps a 24 kHz)
+    "mp3": (".mp3", "MP3", "MPEG_LAYER_III",
+            {"bitrate_mode": "CONSTANT", "compression_level": 0.0}),
+    "ogg": (".ogg", "OGG", "VORBIS", {}),
+    "opus": (".opus", "OGG", "OPUS", {}),
+}
+_FFMPEG_CODEC = {"mp3": ["-b:a", "192k"], "ogg": ["-c:a", "libvorbis"],
+                 "opus": ["-c:a", "libopus"]}
+
+
+def extension(fmt: str) -> str:
+    if fmt not in FORMATS:
+        raise ValueError(f"formato non supportato: {fmt}")
+    return FORMATS[fmt][0]
+
+
+@functools.lru_cache(maxsize=None)
+def native(fmt: str) -> bool:
+    """libsndfile sa scrivere il formato (mp3 richiede libsndfile >= 1.1)."""
+    if fmt not in FORMATS:
+        return False
+    _, major, subtype, _ = FORMATS[fmt]
+    return sf.check_format(major, subtype)
+
+
+def ffmpeg_cmd(sr: int, channels: int, path: str, fmt: str) -> list[str] | None:
+    """Comando ffmpeg che legge PCM float32 da stdin e scrive path, o None."""
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg or fmt not in _FFMPEG_CODEC:
+        return None
+    return [ffmpeg, "-y", "-loglevel", "error", "-f", "f32le", "-ar", str(sr),
+            "-ac", str(channels), "-i", "pipe:0", *_FFMPEG_CODEC[fmt], path]
+
+
+def backend(fmt: str) -> str | None:
+    """Backend che encode() userà per fmt, o None se nessuno è disponibile."""
+    if fmt == "wav" or native(fmt):
+        return "soundfile"
+    if ffmpeg_cmd(24000, 1, os.devnull, fmt):
+        return "ffmpeg"
+    try:
+        import pydub  # noqa: F401
+    except ImportError:
+        return None
+    return "pydub"
+
+
+def open_native(path: str, sr: int, channels: int, fmt: str) -> sf.SoundFile:
+    """sf.SoundFile in scrittura per fmt (scrittura a blocchi, es. scene)."""
+    _, major, subtype, opts = FORMATS[fmt]
+    return sf.SoundFile(path, "w", samplerate=sr, channels=channels,
+                        format=major, subtype=subtype, **opts)
+
+
+def _channels(audio) -> int:
+    return 1 if np.ndim(audio) == 1 else np.shape(audio)[1]
+
+
+def encode(audio, sr: int, base: str, fmt: str, via: str | None = None) -> str:
+    """Scrive audio in f"{base}.<ext>" nel formato fmt; ritorna il path.
+    via forza un backend (benchmark/test), altrimenti il migliore disponibile."""
+    path = str(base) + extension(fmt)
+    via = via or backend(fmt)
+    if via not in ("soundfile", "ffmpeg", "pydub"):
+        raise RuntimeError(f"nessun encoder disponibile per {fmt}")
+    with tracing.span(f"encode_{via}"):
+        if via == "soundfile":
+            with open_native(path, sr, _channels(audio), fmt) as f:
+                f.write(audio)
+        elif via == "ffmpeg":
+            cmd = ffmpeg_cmd(sr, _channels(audio), path, fmt)
+            pcm = np.ascontiguousarray(audio, dtype="<f4").tobytes()
+            res = subprocess.run(cmd, input=pcm, capture_output=True)
+            if res.returncode != 0:
+                raise RuntimeError(
+                    f"encode {fmt} fallito: {res.stderr.decode(errors='replace')}")
+        else:
+            wav = str(base) + ".wav"
+            sf.write(wav, audio, sr)
+            path = transcode(wav, fmt)
+    return path
+
+
+def transcode(wav_path: str, fmt: str) -> str:
+    """WAV su disco → fmt via pydub/ffmpeg, poi rimuove il WAV (percorso legacy)."""
+    from pydub import AudioSegment
+    path = wav_path[:-4] + extension(fmt)
+    kw = {"bitrate": "192k"} if fmt == "mp3" else {"codec": "libopus"} if fmt == "opus" else {}
+    AudioSegment.from_wav(wav_path).export(path, format="ogg" if fmt == "opus" else fmt, **kw)
+    os.remove(wav_path)
+    return path
@@ -0,0 +1,138 @@
+"""Store persistente dei job (SQLite in WAL): i job sopravvivono al riavvio.
+
+JobQueue scrive qui ogni job: subito all'invio e a ogni cambio di stato, a
+lotti per il progress (una transazione ogni JOB_FLUSH_S invece di una scrittura
+per callback). Al riavvio i job in coda o in corso con un `kind` noto vengono
+rimessi in coda dal loro payload (JSON); gli altri (es. stream, il cui client
+non c'è più) finiscono in errore. I job finiti si cancellano dopo JOB_TTL_H ore.
+Il database sta in CACHE_DIR e si può cancellare (si perde solo lo storico).
+"""
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT,
+    payload TEXT,
+    lane TEXT,
+    priority INTEGER,
+    status TEXT,
+    progress REAL,
+    result TEXT,
+    error TEXT,
+    wait REAL,
+    trace TEXT,
+    created REAL,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_created ON jobs (created DESC, id DESC);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, updated);
+"""
+_JSON = ("result", "trace")  # colonne serializzate in JSON
+_PUBLIC = ("id", "kind", "lane", "priority", "status", "progress", "result", "error",
+           "wait", "trace", "created", "updated")
+FINISHED = ("done", "error")
+
+
+def _row(cols, r) -> dict:
+    job = dict(zip(cols, r))
+    for c in _JSON:
+        if job.get(c) is not None:
+            job[c] = json.loads(job[c])
+    return job
+
+
+class JobStore:
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")  # WAL: durabile al checkpoint
+        self._db.executescript(_SCHEMA)
+
+    def insert(self, job: dict, payload=None) -> None:
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (id, kind, payload, lane, priority, status, "
+                "progress, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job["id"], job.get("kind"),
+                 None if payload is None else json.dumps(payload, ensure_ascii=False),
+                 job["lane"], job["priority"], job["status"], job["progress"],
+                 job.get("created", now), now))
+
+    def update(self, jid: str, **fields) -> None:
+        self.update_many({jid: fields})
+
+    def update_many(self, changes: dict[str, dict]) -> None:
+        """Più job in una transazione (flush del progress a lotti)."""
+        now = time.time()
+        with self._lock, self._db:
+            for jid, fields in changes.items():
+                fields = {k: json.dumps(v, ensure_ascii=False) if k in _JSON else v
+                          for k, v in fields.items() if k in _PUBLIC and k != "id"}
+                if not fields:
+                    continue
+                sets = ", ".join(f"{k} = ?" for k in fields)
+                self._db.execute(f"UPDATE jobs SET {sets}, updated = ? WHERE id = ?",
+                                 (*fields.values(), now, jid))
+
+    def get(self, jid: str) -> dict | None:
+        with self._lock:
+            r = self._db.execute(f"SELECT {', '.join(_PUBLIC)} FROM jobs WHERE id = ?",
+                                 (jid,)).fetchone()
+        return _row(_PUBLIC, r) if r else None
+
+    def unfinished(self) -> list[dict]:
+        """Job in coda o in corso (al riavvio: da rimettere in coda), in ordine d'invio."""
+        cols = _PUBLIC + ("payload",)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(cols)} FROM jobs WHERE status IN ('queued', 'running') "
+                "ORDER BY created, id").fetchall()
+        jobs = [_row(cols, r) for r in rows]
+        for j in jobs:
+            j["payload"] = json.loads(j["payload"]) if j["payload"] else None
+        return jobs
+
+    def list(self, limit: int = 50, cursor: str | None = None, status: str | None = None,
+             lane: str | None = None, kind: str | None = None) -> dict:
+        """Pagina di job dal più recente: {"items": [...], "next": cursor|None}.
+        Il cursore è "<created>|<id>" dell'ultimo elemento della pagina precedente."""
+        where, args = [], []
+        for col, value in (("status", status), ("lane", lane), ("kind", kind)):
+            if value:
+                where.append(f"{col} = ?")
+                args.append(value)
+        if cursor:
+            created, _, jid = cursor.partition("|")
+            where.append("(created < ? OR (created = ? AND id < ?))")
+            args += [float(created), float(created), jid]
+        sql = f"SELECT {', '.join(_PUBLIC)} FROM jobs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY created DESC, id DESC LIMIT ?"
+        limit = max(1, min(int(limit), 1000))
+        with self._lock:
+            rows = self._db.execute(sql, args + [limit + 1]).fetchall()
+        items = [_row(_PUBLIC, r) for r in rows[:limit]]
+        nxt = f"{items[-1]['created']!r}|{items[-1]['id']}" if len(rows) > limit else None
+        return {"items": items, "next": nxt}
+
+    def prune(self, finished_before: float) -> int:
+        """Cancella i job finiti prima di finished_before. Ritorna quanti."""
+        with self._lock, self._db:
+            cur = self._db.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'error') AND updated < ?",
+                (finished_before,))
+        return cur.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
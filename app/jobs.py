@@ -1,43 +1,298 @@
-"""Coda job in-process con un singolo worker (il modello non è concorrente)."""
+"""Coda job in-process a corsie (lane): ogni corsia ha il suo pool di worker.
+
+Le corsie separano il lavoro che contende risorse diverse: un modello non è
+concorrente con sé stesso ("design" e "base" hanno un worker ciascuno), mentre
+stitch/DSP/encode ("cpu") non deve aspettare una generazione da 40 s. Dentro
+una corsia i job escono per priorità (più bassa = prima), a parità in ordine
+FIFO.
+
+cancel() annulla un job: se è in coda non parte, se è in corso il job stesso
+controlla cancel_requested() nei punti in cui può fermarsi (es. tra micro-batch).
+
+Con uno JobStore i job sono persistenti (vedi job_store): in memoria restano
+solo quelli attivi, i finiti si leggono dallo store. Senza store restano in
+memoria fino a JOB_TTL_H dopo la fine.
+"""
+import contextvars
+import itertools
 import queue
 import threading
+import time
 import uuid
 
+from app import config as appconfig
+from app import tracing
+
+# Priorità: un "↻ Rigenera" interattivo scavalca i batch lunghi già in coda.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 5
+PRIORITY_BATCH = 10
+
+# corsia -> numero di worker
+DEFAULT_LANES = {"design": 1, "base": 1, "cpu": 2}
+DEFAULT_LANE = "base"
+
+_WAIT_WINDOW = 200  # campioni di attesa tenuti per le statistiche di corsia
+CANCELLED = "annullato"
+
+_current_job: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    "gassmann_job", default=None)
+
 
 class JobQueue:
-    def __init__(self):
+    def __init__(self, lanes: dict[str, int] | None = None, store=None):
+        self._store = store
         self._jobs: dict[str, dict] = {}
-        self._q: queue.Queue = queue.Queue()
+        self._dirty: set[str] = set()  # progress non ancora scritto nello store
+        self._finished: dict[str, float] = {}  # senza store: jid -> fine (per il TTL)
+        self._cancelled: set[str] = set()
         self._lock = threading.Lock()
-        self._worker = threading.Thread(target=self._run, daemon=True)
-        self._worker.start()
-
-    def submit(self, fn) -> str:
-        """fn riceve un callback progress(float) e ritorna il path risultato."""
-        jid = uuid.uuid4().hex[:12]
-        with self._lock:
-            self._jobs[jid] = {
-                "id": jid, "status": "queued", "progress": 0.0,
-                "result": None, "error": None,
-            }
-        self._q.put((jid, fn))
+        self._seq = itertools.count()  # tie-break FIFO a parità di priorità
+        self._subs: dict[str, list[queue.Queue]] = {}  # jid -> code degli stream SSE
+        self._lanes: dict[str, dict] = {}
+        self._listeners: list = []  # fn() dopo ogni submit e ogni job finito
+        for name, workers in (lanes or DEFAULT_LANES).items():
+            lane = {"q": queue.PriorityQueue(), "workers": max(1, int(workers)),
+                    "running": 0, "done": 0, "waits": []}
+            self._lanes[name] = lane
+            for _ in range(lane["workers"]):
+                threading.Thread(target=self._run, args=(name,), daemon=True).start()
+        threading.Thread(target=self._housekeeping, name="gassmann-jobs-flush",
+                         daemon=True).start()
+
+    def submit(self, fn, lane: str = DEFAULT_LANE, priority: int = PRIORITY_NORMAL,
+               kind: str | None = None, payload=None) -> str:
+        """fn riceve un callback progress(float) e ritorna il path risultato.
+        kind + payload (JSON) rendono il job ripristinabile dopo un riavvio:
+        resume() ricostruisce fn da payload con l'handler registrato per kind."""
+        if lane not in self._lanes:
+            raise ValueError(f"corsia sconosciuta: {lane}")
+        return self._enqueue(uuid.uuid4().hex[:12], fn, lane, priority, kind, payload)
+
+    def _enqueue(self, jid, fn, lane, priority, kind, payload, created=None) -> str:
+        job = {"id": jid, "status": "queued", "progress": 0.0,
+               "result": None, "error": None, "kind": kind,
+               "lane": lane, "priority": priority, "wait": None, "trace": None,
+               "created": created or time.time()}
+        with self._lock:
+            self._jobs[jid] = job
+        if self._store is not None:
+            self._store.insert(job, payload)
+        self._lanes[lane]["q"].put(
+            (priority, next(self._seq), jid, fn, time.monotonic()))
+        self._notify()
         return jid
 
+    def resume(self, handlers: dict) -> dict:
+        """Al riavvio: rimette in coda i job rimasti in coda/in corso il cui kind
+        ha un handler (kind -> fn(payload) che ritorna la funzione del job); gli
+        altri vanno in errore. Ritorna i conteggi."""
+        if self._store is None:
+            return {"resumed": 0, "failed": 0}
+        resumed = failed = 0
+        for job in self._store.unfinished():
+            handler = handlers.get(job["kind"])
+            if handler is None or job["payload"] is None or job["lane"] not in self._lanes:
+                self._store.update(job["id"], status="error", progress=1.0,
+                                   error="interrotto dal riavvio del server")
+                failed += 1
+                continue
+            self._enqueue(job["id"], handler(job["payload"]), job["lane"], job["priority"],
+                          job["kind"], job["payload"], created=job["created"])
+            resumed += 1
+        return {"resumed": resumed, "failed": failed}
+
+    def cancel(self, jid: str) -> bool:
+        """Annulla un job in coda o in corso. False se non esiste o è già finito."""
+        with self._lock:
+            job = self._jobs.get(jid)
+            if job is None or job["status"] not in ("queued", "running"):
+                return False
+            self._cancelled.add(jid)
+            queued = job["status"] == "queued"
+            if queued:
+                job["status"] = "error"  # il worker che lo estrae non lo avvia
+        if queued:  # resta nella coda della corsia: il worker lo salta
+            self._finish(jid, job["lane"], {"status": "error", "error": CANCELLED})
+        return True
+
+    def cancel_requested(self, jid: str | None = None) -> bool:
+        """True se il job jid (default: quello in esecuzione nel contesto
+        corrente) è stato annullato e non è ancora finito."""
+        jid = jid or _current_job.get()
+        with self._lock:
+            return jid in self._cancelled
+
+    def add_listener(self, fn) -> None:
+        """fn() chiamata (senza lock) a ogni cambiamento delle code: submit e fine
+        job. Es. precaricare il modello che serve ai job in attesa."""
+        self._listeners.append(fn)
+
+    def _notify(self):
+        for fn in self._listeners:
+            try:
+                fn()
+            except Exception:  # noqa: BLE001 — un listener non deve rompere la coda
+                pass
+
     def get(self, jid: str) -> dict | None:
         with self._lock:
             job = self._jobs.get(jid)
-            return dict(job) if job else None
+            if job:
+                return dict(job)
+        return self._store.get(jid) if self._store is not None else None
+
+    def list(self, limit: int = 50, cursor: str | None = None, status: str | None = None,
+             lane: str | None = None, kind: str | None = None) -> dict:
+        """Job dal più recente con filtri: {"items": [...], "next": cursor|None}."""
+        if self._store is not None:
+            with self._lock:
+                dirty = {jid: self._jobs[jid]["progress"] for jid in self._dirty
+                         if jid in self._jobs}
+            self._store.update_many({jid: {"progress": p} for jid, p in dirty.items()})
+            return self._store.list(limit=limit, cursor=cursor, status=status,
+                                    lane=lane, kind=kind)
+        with self._lock:
+            jobs = [dict(j) for j in self._jobs.values()
+                    if all(v is None or j[k] == v
+                           for k, v in (("status", status), ("lane", lane), ("kind", kind)))]
+        jobs.sort(key=lambda j: (j["created"], j["id"]), reverse=True)
+        if cursor:
+            created, _, jid = cursor.partition("|")
+            jobs = [j for j in jobs if (j["created"], j["id"]) < (float(created), jid)]
+        limit = max(1, min(int(limit), 1000))
+        nxt = f"{jobs[limit - 1]['created']!r}|{jobs[limit - 1]['id']}" \
+            if len(jobs) > limit else None
+        return {"items": jobs[:limit], "next": nxt}
+
+    def subscribe(self, jid: str) -> queue.Queue | None:
+        """Coda che riceve uno snapshot del job a ogni cambiamento (la prima
+        voce è lo stato attuale). None se il job non esiste."""
+        q: queue.Queue = queue.Queue()
+        with self._lock:
+            job = self._jobs.get(jid)
+            if job is not None:
+                q.put(dict(job))
+                self._subs.setdefault(jid, []).append(q)
+                return q
+        job = self._store.get(jid) if self._store is not None else None
+        if job is None:
+            return None
+        q.put(job)  # job finito (solo nello store): lo snapshot finale basta
+        return q
+
+    def unsubscribe(self, jid: str, q: queue.Queue) -> None:
+        with self._lock:
+            subs = self._subs.get(jid, [])
+            if q in subs:
+                subs.remove(q)
+            if not subs:
+                self._subs.pop(jid, None)
+
+    def stats(self) -> dict[str, dict]:
+        """Per corsia: worker, job in coda/in corso/finiti e attesa in coda (s)."""
+        out = {}
+        with self._lock:
+            for name, lane in self._lanes.items():
+                waits = lane["waits"]
+                out[name] = {
+                    "workers": lane["workers"], "queued": lane["q"].qsize(),
+                    "running": lane["running"], "done": lane["done"],
+                    "wait_avg": sum(waits) / len(waits) if waits else 0.0,
+                    "wait_max": max(waits) if waits else 0.0,
+                }
+        return out
 
     def _set(self, jid, **kw):
         with self._lock:
             self._jobs[jid].update(kw)
+            self._publish(jid)
+            progress_only = set(kw) == {"progress"}
+            if progress_only:
+                self._dirty.add(jid)
+        if self._store is not None and not progress_only:
+            self._store.update(jid, **kw)  # cambi di stato: subito su disco
+
+    def _flush(self) -> None:
+        """Scrive in una transazione il progress dei job cambiati dall'ultimo flush."""
+        with self._lock:
+            dirty = {jid: self._jobs[jid]["progress"] for jid in self._dirty
+                     if jid in self._jobs}
+            self._dirty.clear()
+        if dirty and self._store is not None:
+            self._store.update_many({jid: {"progress": p} for jid, p in dirty.items()})
+
+    def prune(self, now: float | None = None) -> int:
+        """Via i job finiti da più di JOB_TTL_H (store, o memoria senza store)."""
+        cutoff = (now or time.time()) - appconfig.JOB_TTL_S
+        if self._store is not None:
+            return self._store.prune(cutoff)
+        with self._lock:
+            old = [jid for jid, t in self._finished.items() if t < cutoff]
+            for jid in old:
+                self._jobs.pop(jid, None)
+                self._finished.pop(jid, None)
+        return len(old)
 
-    def _run(self):
+    def _housekeeping(self):
+        last_prune = 0.0
         while True:
-            jid, fn = self._q.get()
-            self._set(jid, status="running")
+            time.sleep(appconfig.JOB_FLUSH_S)
             try:
-                result = fn(lambda p: self._set(jid, progress=float(p)))
-                self._set(jid, status="done", progress=1.0, result=result)
-            except Exception as e:  # noqa: BLE001
-                self._set(jid, status="error", progress=1.0, error=str(e))
+                self._flush()
+                if time.monotonic() - last_prune > 60:
+                    self.prune()
+                    last_prune = time.monotonic()
+            except Exception:  # noqa: BLE001 — il flush riprova al giro dopo
+                pass
+
+    def _publish(self, jid):
+        """Push dello stato agli stream del job (chiamare col lock preso)."""
+        for q in self._subs.get(jid, ()):
+            q.put(dict(self._jobs[jid]))
+
+    def _run(self, name):
+        lane = self._lanes[name]
+        while True:
+            _, _, jid, fn, t_submit = lane["q"].get()
+            wait = time.monotonic() - t_submit
+            with self._lock:
+                job = self._jobs.get(jid)
+                if job is None or job["status"] != "queued":
+                    continue  # annullato mentre era in coda
+                lane["running"] += 1
+                lane["waits"] = (lane["waits"] + [wait])[-_WAIT_WINDOW:]
+            self._set(jid, status="running", wait=round(wait, 3))
+            t0 = time.monotonic()
+            token = _current_job.set(jid)
+            with tracing.trace() as tr:  # span delle fasi del job → job["trace"]
+                try:
+                    result = fn(lambda p: self._set(jid, progress=float(p)))
+                    final = {"status": "done", "result": result}
+                except Exception as e:  # noqa: BLE001
+                    final = {"status": "error", "error": str(e)}
+            _current_job.reset(token)
+            with self._lock:
+                if jid in self._cancelled:
+                    final = {"status": "error", "error": CANCELLED}
+            final["trace"] = tracing.finish_job(tr, name, final["status"],
+                                                time.monotonic() - t0)
+            self._finish(jid, name, final, running=True)
+
+    def _finish(self, jid, name, final, running=False):
+        lane = self._lanes[name]
+        if self._store is not None:  # prima su disco: get() dopo la fine lo trova
+            self._store.update(jid, **final, progress=1.0)
+        with self._lock:  # contatori e stato finale insieme: stats() coerente
+            if running:
+                lane["running"] -= 1
+            lane["done"] += 1
+            self._jobs[jid].update(final, progress=1.0)
+            self._publish(jid)
+            self._dirty.discard(jid)
+            self._cancelled.discard(jid)
+            if self._store is not None:
+                self._jobs.pop(jid)  # finito: da qui in poi lo serve lo store
+            else:
+                self._finished[jid] = time.time()
+        self._notify()
@@ -1,31 +1,37 @@
 """FastAPI app: REST API + serve la single-page UI."""
+import json
+import queue
+import threading
+import time
 from pathlib import Path
 from typing import Literal
 
-from fastapi import FastAPI, Form, HTTPException, UploadFile, File
-from fastapi.responses import FileResponse
+import anyio.from_thread
+from fastapi import Depends, FastAPI, Form, HTTPException, Request, UploadFile, File
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 
 from app import config as appconfig
-from app import voices, pipeline
-from app.jobs import JobQueue
+from app import voices, pipeline, render_cache, outputs_index, retention, tracing, warmup
+from app.job_store import JobStore
+from app.jobs import CANCELLED, DEFAULT_LANES, JobQueue, PRIORITY_BATCH, PRIORITY_INTERACTIVE
 from app.model_manager import ModelManager
+from app.model_workers import ModelWorkerPool
 
 STATIC_DIR = Path(__file__).resolve().parent / "static"
 
 
-def _warm(mm):
-    try:
-        mm.base()
-    except Exception:  # noqa: BLE001 — warmup best-effort, non deve mai bloccare l'app
-        pass
+def _model_lane(voice_id: str) -> str:
+    """Corsia del modello che servirà la voce: design e clone usano modelli diversi."""
+    info = voices.get_voice(voice_id)
+    return "design" if info and info["type"] == "design" else "base"
 
 
 class GenerateReq(BaseModel):
     text: str
     voice_id: str
-    format: Literal["wav", "mp3"] = "wav"
+    format: Literal["wav", "mp3", "ogg", "opus"] = "wav"
     biochem: bool = False
     speed: float = 1.0
     instruct: str | None = None
@@ -45,18 +51,30 @@ class UpdateVoiceReq(BaseModel):
 
 
 class BatchItem(BaseModel):
-    name: str
+    name: str | None = None         # None → nome da testo+voce (come /api/generate)
     text: str
+    # override per battuta (render di scena: voce/emozione diverse per riga)
+    voice_id: str | None = None
+    emotion: str | None = None
+    speed: float | None = None
+    instruct: str | None = None
+    temperature: float | None = None
+    pitch: float | None = None
+    gain: float | None = None
 
 
 class BatchReq(BaseModel):
     items: list[BatchItem]
-    voice_id: str
-    format: Literal["wav", "mp3"] = "wav"
+    voice_id: str | None = None     # voce di default degli item senza voice_id
+    format: Literal["wav", "mp3", "ogg", "opus"] = "wav"
     biochem: bool = False
     emotion: str | None = None
 
 
+class PreprocessReq(BaseModel):
+    texts: list[str]
+
+
 class TeatroBlock(BaseModel):
     character: str = ""
     voice_id: str
@@ -71,21 +89,43 @@ class TeatroBlock(BaseModel):
 
 class TeatroReq(BaseModel):
     blocks: list[TeatroBlock]
-    format: Literal["wav", "mp3"] = "wav"
+    format: Literal["wav", "mp3", "ogg", "opus"] = "wav"
     title: str = "scena"
 
 
 def create_app(model_manager=None, job_queue=None) -> FastAPI:
-    mm = model_manager or ModelManager()
-    jobs = job_queue or JobQueue()
+    lanes = None
+    if model_manager is None and appconfig.MODEL_WORKERS > 0:
+        # worker pool: N processi modello → fino a N generate per corsia modello
+        mm = ModelWorkerPool()
+        lanes = {**DEFAULT_LANES, "design": mm.workers, "base": mm.workers}
+    else:
+        mm = model_manager or ModelManager()
+    # job persistenti: un riavvio non perde i job in coda (rimessi in coda in fondo)
+    jobs = job_queue or JobQueue(lanes, store=JobStore(appconfig.CACHE_DIR / "jobs.sqlite"))
     app = FastAPI(title="GASSMANN")
 
-    # Pre-warm del modello Base (voce-clone) in background: la 1ª generazione paga
-    # il load lazy (~decine di s su MPS), così invece avviene allo startup.
-    # Solo per il ModelManager reale → i test (FakeMM) non caricano nulla.
-    if isinstance(mm, ModelManager):
-        import threading
-        threading.Thread(target=_warm, args=(mm,), daemon=True).start()
+    # Warm-up in background: la 1ª generazione pagherebbe load lazy (~decine di s
+    # su MPS), selezione dei kernel e import; così avviene allo startup e
+    # /api/health/ready dice quando è finito.
+    # Solo per il ModelManager reale (o il worker pool) → i test (FakeMM) non caricano nulla.
+    if isinstance(mm, (ModelManager, ModelWorkerPool)):
+        warm = warmup.Warmup(mm)
+        warm.start()
+        # job in coda per un modello non residente → precaricalo mentre l'altro genera
+        jobs.add_listener(lambda: mm.prefetch(
+            [lane for lane, st in jobs.stats().items()
+             if lane in ("design", "base") and st["queued"]]))
+        retention.default_manager.start()  # sweep di OUTPUT se budget/età configurati
+    else:
+        warm = warmup.Warmup(mm, models=(), pool=None)
+
+    @app.get("/api/health/ready")
+    def api_ready():
+        """Readiness: 200 a warm-up finito, 503 finché modelli/DSP non sono pronti
+        (o se uno è fallito). Il corpo ha stato e tempi per fase di ogni componente."""
+        report = warm.report()
+        return JSONResponse(report, status_code=200 if report["ready"] else 503)
 
     @app.get("/api/voices")
     def api_voices():
@@ -188,34 +228,165 @@ def create_app(model_manager=None, job_queue=None) -> FastAPI:
             raise HTTPException(400, "testo vuoto")
         if voices.get_voice(req.voice_id) is None:
             raise HTTPException(404, "voce non trovata")
-        jid = jobs.submit(lambda progress: pipeline.run_generation(
-            mm, text=req.text, voice_id=req.voice_id,
-            fmt=req.format, biochem=req.biochem, speed=req.speed,
-            instruct=req.instruct, emotion=req.emotion,
-            temperature=req.temperature, pitch=req.pitch, gain=req.gain,
-            progress=progress))
+        payload = req.model_dump()
+        jid = jobs.submit(_generate_job(payload), lane=_model_lane(req.voice_id),
+                          priority=PRIORITY_INTERACTIVE, kind="generate", payload=payload)
         return {"job_id": jid}
 
-    @app.post("/api/batch")
-    def api_batch(req: BatchReq):
-        if not req.items:
-            raise HTTPException(400, "nessun item")
+    # Funzioni dei job ricostruibili dal solo payload JSON: resume() le usa per
+    # rimettere in coda dopo un riavvio i job rimasti a metà.
+    def _generate_job(p: dict):
+        return lambda progress: pipeline.run_generation(
+            mm, text=p["text"], voice_id=p["voice_id"],
+            fmt=p["format"], biochem=p["biochem"], speed=p["speed"],
+            instruct=p["instruct"], emotion=p["emotion"],
+            temperature=p["temperature"], pitch=p["pitch"], gain=p["gain"],
+            progress=progress)
+
+    def _batch_job(p: dict):
+        # micro-batch sul modello, DSP/encode in parallelo sul pool CPU
+        # Stop dalla UI → /api/jobs/{id}/cancel: si ferma al micro-batch successivo
+        return lambda progress: pipeline.run_generation_many(
+            mm, p["requests"], fmt=p["format"], progress=progress,
+            should_stop=jobs.cancel_requested)
+
+    def _teatro_job(p: dict):
+        clips = p["clips"]
+
+        def work(progress):
+            scene = pipeline.stitch_scene(clips, p["pauses"], p["title"], fmt=p["format"])
+            # clip usati in una scena + la scena: esclusi dalla retention
+            outputs_index.default_index.set_pinned(
+                [Path(c).name for c in clips] + [Path(scene).name])
+            progress(1.0)
+            return {"scene": scene,
+                    "clips": [{"character": ch, "path": c}
+                              for ch, c in zip(p["characters"], clips)]}
+        return work
+
+    def _stream(req: GenerateReq, request: Request):
+        """WAV PCM16 in streaming, frase per frase. La generazione passa comunque
+        dalla corsia del modello (priorità interattiva); il job id è nell'header
+        X-Job-Id e il risultato del job riporta segmenti e time-to-first-audio.
+        La risposta parte alla prima frase pronta: un errore prima di quella è
+        un 500 (499 se il job è annullato o il client se ne va), non un 200 con
+        corpo vuoto."""
+        if not req.text.strip():
+            raise HTTPException(400, "testo vuoto")
         if voices.get_voice(req.voice_id) is None:
             raise HTTPException(404, "voce non trovata")
+        chunks: queue.Queue = queue.Queue()
+        stop = threading.Event()
 
         def work(progress):
-            results = []
-            total = len(req.items)
-            for i, item in enumerate(req.items):
-                path = pipeline.run_generation(
-                    mm, text=item.text, voice_id=req.voice_id,
-                    fmt=req.format, biochem=req.biochem, out_name=item.name,
-                    emotion=req.emotion)
-                results.append(path)
-                progress((i + 1) / total)
-            return results
-
-        return {"job_id": jobs.submit(work)}
+            t0, ttfa, n = time.monotonic(), None, 0
+            try:
+                for audio, sr in pipeline.iter_generation(
+                        mm, text=req.text, voice_id=req.voice_id, biochem=req.biochem,
+                        speed=req.speed, instruct=req.instruct, emotion=req.emotion,
+                        temperature=req.temperature, pitch=req.pitch, gain=req.gain,
+                        should_stop=lambda: stop.is_set() or jobs.cancel_requested()):
+                    if ttfa is None:
+                        ttfa = round(time.monotonic() - t0, 3)
+                    chunks.put((audio, sr))
+                    n += 1
+            except Exception as e:
+                chunks.put(e)
+                raise
+            finally:
+                chunks.put(None)
+            return {"segments": n, "ttfa": ttfa}
+
+        jid = jobs.submit(work, lane=_model_lane(req.voice_id),
+                          priority=PRIORITY_INTERACTIVE)
+
+        first = _first_chunk(jid, chunks, stop, request)
+
+        def body():
+            header, item = False, first
+            try:
+                while isinstance(item, tuple):  # None = fine, eccezione = errore a metà
+                    audio, sr = item
+                    if not header:
+                        yield pipeline.wav_stream_header(sr)
+                        header = True
+                    yield pipeline.pcm16(audio)
+                    item = chunks.get()
+            finally:
+                stop.set()  # client andato via: niente frasi generate per nessuno
+
+        return StreamingResponse(body(), media_type="audio/wav",
+                                 headers={"X-Job-Id": jid})
+
+    def _first_chunk(jid, chunks: queue.Queue, stop: threading.Event, request: Request):
+        """Aspetta la prima frase del job di streaming. Tra un'attesa e l'altra
+        controlla job e client: un job annullato in coda non mette mai nulla in
+        chunks, e un client andato via non deve tenere occupato il modello."""
+        while True:
+            try:
+                first = chunks.get(timeout=0.5)
+                break
+            except queue.Empty:
+                pass
+            job = jobs.get(jid)
+            if job is not None and job["status"] in ("done", "error"):
+                try:  # finito proprio ora: quello che ha messo in chunks vale
+                    first = chunks.get_nowait()
+                    break
+                except queue.Empty:
+                    raise HTTPException(499 if job["error"] == CANCELLED else 500,
+                                        f"generazione interrotta: {job['error']}")
+            if anyio.from_thread.run(request.is_disconnected):
+                stop.set()
+                jobs.cancel(jid)
+                raise HTTPException(499, "client disconnesso")
+        if isinstance(first, Exception):
+            raise HTTPException(500, f"generazione fallita: {first}")
+        if first is None:  # nessuna frase: annullato prima della prima, o niente da dire
+            job = jobs.get(jid)
+            if jobs.cancel_requested(jid) or (job and job["error"] == CANCELLED):
+                raise HTTPException(499, f"generazione interrotta: {CANCELLED}")
+            raise HTTPException(500, "nessun audio generato")
+        return first
+
+    @app.post("/api/stream")
+    def api_stream(req: GenerateReq, request: Request):
+        return _stream(req, request)
+
+    @app.get("/api/stream")
+    def api_stream_get(request: Request, req: GenerateReq = Depends()):
+        # GET con query string: usabile direttamente come src di <audio>
+        return _stream(req, request)
+
+    @app.post("/api/batch")
+    def api_batch(req: BatchReq):
+        if not req.items:
+            raise HTTPException(400, "nessun item")
+        voice_ids = [item.voice_id or req.voice_id for item in req.items]
+        for vid in set(voice_ids):
+            if not vid or voices.get_voice(vid) is None:
+                raise HTTPException(404, "voce non trovata")
+        # batch misto design+clone: corsia base (il lock per-modello serializza il resto)
+        lanes = {_model_lane(vid) for vid in voice_ids}
+        lane = "design" if lanes == {"design"} else "base"
+        # normalizzazione di tutti gli item in una volta (testi ripetuti: una sola)
+        texts = [item.text for item in req.items]
+        if req.biochem:
+            texts = pipeline.preprocess_many(texts)
+
+        payload = {"format": req.format, "requests": [
+            dict(text=text, voice_id=vid,
+                 out_name=item.name, emotion=item.emotion or req.emotion,
+                 speed=item.speed, instruct=item.instruct,
+                 temperature=item.temperature, pitch=item.pitch, gain=item.gain)
+            for item, vid, text in zip(req.items, voice_ids, texts)]}
+        return {"job_id": jobs.submit(_batch_job(payload), lane=lane, priority=PRIORITY_BATCH,
+                                      kind="batch", payload=payload)}
+
+    @app.post("/api/preprocess")
+    def api_preprocess(req: PreprocessReq):
+        # anteprima del testo normalizzato, senza passare dal modello
+        return {"texts": pipeline.preprocess_many(req.texts)}
 
     @app.post("/api/teatro")
     def api_teatro(req: TeatroReq):
@@ -232,16 +403,47 @@ def create_app(model_manager=None, job_queue=None) -> FastAPI:
             if not clip.exists():
                 raise HTTPException(400, f"clip mancante per battuta {i+1}: rigenerala")
             clips.append(str(clip))
-        pauses = [b.pause_after for b in blocks]
-
-        def work(progress):
-            scene = pipeline.stitch_scene(clips, pauses, req.title, fmt=req.format)
-            progress(1.0)
-            return {"scene": scene,
-                    "clips": [{"character": b.character, "path": c}
-                              for b, c in zip(blocks, clips)]}
-
-        return {"job_id": jobs.submit(work)}
+        payload = {"clips": clips, "pauses": [b.pause_after for b in blocks],
+                   "title": req.title, "format": req.format,
+                   "characters": [b.character for b in blocks]}
+        # stitch = solo CPU: non aspetta dietro le generazioni in corso
+        return {"job_id": jobs.submit(_teatro_job(payload), lane="cpu",
+                                      kind="teatro", payload=payload)}
+
+    @app.get("/api/queue")
+    def api_queue():
+        return jobs.stats()
+
+    @app.get("/api/metrics")
+    def api_metrics():
+        """Formato Prometheus: istogrammi per fase, durata dei job, real-time
+        factor per tipo di voce, load/evict dei modelli, più lo stato attuale
+        di corsie e modelli residenti."""
+        extra = []
+        for metric, field in (("gassmann_lane_queued", "queued"),
+                              ("gassmann_lane_running", "running")):
+            extra += [f"# TYPE {metric} gauge"]
+            extra += [f'{metric}{{lane="{lane}"}} {st[field]}'
+                      for lane, st in jobs.stats().items()]
+        if hasattr(mm, "residency"):
+            extra += ["# TYPE gassmann_model_resident_bytes gauge"]
+            extra += [f'gassmann_model_resident_bytes{{model="{kind}"}} {m["bytes"]}'
+                      for kind, m in mm.residency()["models"].items()]
+        return PlainTextResponse(tracing.render(extra),
+                                 media_type="text/plain; version=0.0.4")
+
+    @app.get("/api/cache")
+    def api_cache():
+        return render_cache.default_cache.stats()
+
+    @app.get("/api/jobs")
+    def api_jobs(limit: int = 50, cursor: str | None = None, status: str | None = None,
+                 lane: str | None = None, kind: str | None = None):
+        # dal più recente; i finiti restano JOB_TTL_H ore
+        try:
+            return jobs.list(limit=limit, cursor=cursor, status=status, lane=lane, kind=kind)
+        except ValueError as e:
+            raise HTTPException(400, f"parametro non valido: {e}")
 
     @app.get("/api/jobs/{jid}")
     def api_job(jid: str):
@@ -250,20 +452,90 @@ def create_app(model_manager=None, job_queue=None) -> FastAPI:
             raise HTTPException(404, "job non trovato")
         return job
 
+    @app.post("/api/jobs/{jid}/cancel")
+    def api_job_cancel(jid: str):
+        if jobs.get(jid) is None:
+            raise HTTPException(404, "job non trovato")
+        return {"cancelled": jobs.cancel(jid)}
+
+    @app.get("/api/jobs/{jid}/events")
+    def api_job_events(jid: str):
+        """Server-Sent Events: uno snapshot del job a ogni progress/fine, senza polling."""
+        sub = jobs.subscribe(jid)
+        if sub is None:
+            raise HTTPException(404, "job non trovato")
+
+        def events():
+            try:
+                while True:
+                    try:
+                        job = sub.get(timeout=15)
+                    except queue.Empty:
+                        yield ": ping\n\n"  # keep-alive per proxy/browser
+                        continue
+                    yield f"data: {json.dumps(job)}\n\n"
+                    if job["status"] in ("done", "error"):
+                        return
+            finally:
+                jobs.unsubscribe(jid, sub)
+
+        return StreamingResponse(events(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache"})
+
     @app.get("/api/outputs")
-    def api_outputs():
-        files = sorted(appconfig.OUTPUT_DIR.glob("*.*"),
-                       key=lambda p: p.stat().st_mtime, reverse=True)
-        return [{"name": p.name} for p in files
-                if p.suffix in (".wav", ".mp3")]
+    def api_outputs(limit: int = 50, cursor: str | None = None, voice: str | None = None,
+                    since: str | None = None, until: str | None = None):
+        # dall'indice, non da glob+stat di tutta OUTPUT; since/until: epoch o data ISO
+        try:
+            return outputs_index.default_index.list(
+                limit=limit, cursor=cursor, voice=voice, since=since, until=until)
+        except ValueError as e:
+            raise HTTPException(400, f"parametro non valido: {e}")
+
+    @app.post("/api/outputs/reconcile")
+    def api_outputs_reconcile():
+        return outputs_index.default_index.reconcile()
+
+    @app.post("/api/outputs/{filename}/pin")
+    def api_output_pin(filename: str):
+        if not outputs_index.default_index.set_pinned([Path(filename).name]):
+            raise HTTPException(404, "file non trovato")
+        return {"pinned": True}
+
+    @app.delete("/api/outputs/{filename}/pin")
+    def api_output_unpin(filename: str):
+        if not outputs_index.default_index.set_pinned([Path(filename).name], False):
+            raise HTTPException(404, "file non trovato")
+        return {"pinned": False}
+
+    @app.get("/api/admin/retention")
+    def api_retention():
+        return retention.default_manager.stats()
+
+    @app.get("/api/admin/models")
+    def api_models():
+        """Modelli residenti in memoria, budget e timeout di inattività."""
+        if not hasattr(mm, "residency"):
+            return {"models": {}, "budget_bytes": 0, "idle_s": 0}
+        return mm.residency()
+
+    @app.post("/api/admin/retention/sweep")
+    def api_retention_sweep():
+        # sweep immediato: file rimossi e byte recuperati
+        return retention.default_manager.sweep()
 
     @app.get("/api/outputs/{filename}")
     def api_output_file(filename: str):
         p = appconfig.OUTPUT_DIR / Path(filename).name
         if not p.exists():
             raise HTTPException(404, "file non trovato")
+        outputs_index.default_index.touch(p.name)  # ultimo accesso per la retention
         return FileResponse(p)
 
+    # job rimasti in coda/in corso all'ultimo arresto: di nuovo in coda (gli
+    # stream no, il loro client non c'è più)
+    jobs.resume({"generate": _generate_job, "batch": _batch_job, "teatro": _teatro_job})
+
     if STATIC_DIR.exists():
         app.mount("/", StaticFiles(directory=STATIC_DIR, html=True), name="ui")
 
@@ -1,50 +1,341 @@
 """Caricamento lazy dei modelli Qwen3-TTS e funzioni di generazione.
 
-I modelli restano residenti in RAM dopo il primo caricamento. L'import di
+I modelli restano residenti dopo il primo caricamento, entro una politica di
+residenza: budget di memoria (GASSMANN_MODEL_BUDGET_MB) con eviction LRU tra
+design e base, scarico dopo GASSMANN_MODEL_IDLE_S di inattività (con rilascio
+delle cache dell'acceleratore) e precaricamento del modello che serve ai job in
+coda. Un modello in generazione non viene mai scaricato. L'import di
 torch/qwen_tts avviene dentro i metodi così i test possono mockare l'istanza.
 """
 
+import copy
+import gc
+import os
+import sys
 import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from app import config as appconfig
+from app import tracing
 
 DESIGN_MODEL = "Qwen/Qwen3-TTS-12Hz-1.7B-VoiceDesign"
 BASE_MODEL = "Qwen/Qwen3-TTS-12Hz-1.7B-Base"
+_REPOS = {"design": DESIGN_MODEL, "base": BASE_MODEL}
+# stima prudente (pesi fp16 da 1.7B + speech tokenizer) finché un load non misura
+_DEFAULT_MODEL_BYTES = 4 * 2**30
+
+
+def _nbytes(obj, _depth=0) -> int:
+    """Stima della memoria di un prompt (tensori torch / array numpy annidati)."""
+    if _depth > 6:
+        return 0
+    if hasattr(obj, "element_size") and hasattr(obj, "nelement"):  # torch.Tensor
+        return obj.element_size() * obj.nelement()
+    if hasattr(obj, "nbytes"):  # numpy
+        return int(obj.nbytes)
+    if isinstance(obj, dict):
+        return sum(_nbytes(v, _depth + 1) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(_nbytes(v, _depth + 1) for v in obj)
+    if hasattr(obj, "__dict__"):  # dataclass/oggetto prompt item
+        return sum(_nbytes(v, _depth + 1) for v in vars(obj).values())
+    return 0
+
+
+def _model_bytes(model) -> int:
+    """Memoria dei parametri e buffer torch del modello (0 se non misurabile)."""
+    for m in (model, getattr(model, "model", None)):
+        if hasattr(m, "parameters"):
+            try:
+                tensors = list(m.parameters()) + list(getattr(m, "buffers", list)())
+                return sum(t.element_size() * t.nelement() for t in tensors)
+            except Exception:  # noqa: BLE001 — stima best-effort
+                return 0
+    return 0
+
+
+def _release_accelerator() -> None:
+    """Dopo uno scarico: gc + svuota le cache di MPS/CUDA (solo se torch è già
+    importato: i test con modelli finti non lo caricano)."""
+    gc.collect()
+    torch = sys.modules.get("torch")
+    if torch is None:
+        return
+    try:
+        if torch.backends.mps.is_available():
+            torch.mps.empty_cache()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except Exception:  # noqa: BLE001
+        pass
+
+
+class _PromptCache:
+    """LRU dei voice_clone_prompt per (campione, mtime, size, ref_text).
+
+    Il prompt item riusato si corrompe dopo la prima generate (la voce cambia
+    tra un rigenera e l'altro): la cache tiene una copia master mai passata al
+    modello e ogni generate riceve una deepcopy (copy-on-use). Eviction LRU per
+    memoria stimata dei tensori."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._items: OrderedDict[tuple, tuple] = OrderedDict()  # key -> (master, nbytes)
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def key(ref_audio, ref_text) -> tuple | None:
+        if not isinstance(ref_audio, (str, os.PathLike)) or not os.path.exists(ref_audio):
+            return None  # array/URL: nessuna identità stabile su cui cachare
+        st = os.stat(ref_audio)
+        return (os.path.abspath(ref_audio), st.st_mtime_ns, st.st_size, ref_text)
+
+    def get(self, key, encode, copies: int = 1) -> list:
+        """Lista di `copies` copie indipendenti del prompt (encode() se manca)."""
+        with self._lock:
+            hit = self._items.get(key)
+            if hit:
+                self._items.move_to_end(key)
+                self.hits += 1
+        if hit is None:
+            master = encode()
+            with self._lock:
+                self.misses += 1
+                self._items[key] = hit = (master, _nbytes(master))
+                total = sum(n for _, n in self._items.values())
+                while total > self.max_bytes and len(self._items) > 1:
+                    _, (_, n) = self._items.popitem(last=False)
+                    total -= n
+        master = hit[0]
+        return [copy.deepcopy(master) for _ in range(copies)]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
 
 
 class ModelManager:
-    def __init__(self):
-        self._design = None
-        self._base = None
-        self._lock = threading.Lock()  # il pre-warm in background non deve duplicare il load
+    def __init__(self, budget_bytes: int | None = None, idle_s: float | None = None):
+        # kind -> {"model", "bytes", "used"}; ordine LRU, più vecchio in testa
+        self._resident: OrderedDict[str, dict] = OrderedDict()
+        self._sizes: dict[str, int] = {}  # ultimo footprint misurato per modello
+        self._state = threading.Lock()    # protegge _resident (operazioni brevi)
+        self._lock = threading.Lock()  # un load alla volta (pre-warm/prefetch non duplicano)
+        # un modello non è concorrente con sé stesso: una generate alla volta per modello
+        # (le corsie di JobQueue già serializzano, questo copre batch con voci miste)
+        self._gen_locks = {"design": threading.Lock(), "base": threading.Lock()}
+        self.clone_prompts = _PromptCache(appconfig.CLONE_PROMPT_CACHE_BYTES)
+        self._budget = budget_bytes
+        self._idle_s = idle_s
+        self._prefetching: set[str] = set()
+        self._reaper: threading.Thread | None = None
+
+    @property
+    def budget_bytes(self) -> int:
+        return self._budget if self._budget is not None else appconfig.MODEL_BUDGET_BYTES
+
+    @property
+    def idle_s(self) -> float:
+        return self._idle_s if self._idle_s is not None else appconfig.MODEL_IDLE_S
 
     def _load(self, repo):
-        import torch
-        from qwen_tts import Qwen3TTSModel
+        with tracing.span("model_import"):
+            import torch
+            from qwen_tts import Qwen3TTSModel
         # float16, non bfloat16: su MPS lo speech-tokenizer encoder (STFT/conv del
         # voice-clone) non supporta bf16 → "BFloat16 is not supported on MPS". fp16 ok.
+        with tracing.span("model_load"):
+            try:
+                return Qwen3TTSModel.from_pretrained(
+                    repo, device_map="mps", dtype=torch.float16,
+                    attn_implementation="flash_attention_2",
+                )
+            except (RuntimeError, ImportError, ValueError):
+                # flash_attention_2 non disponibile: fallback a implementazione standard
+                return Qwen3TTSModel.from_pretrained(
+                    repo, device_map="mps", dtype=torch.float16,
+                )
+
+    # --- residenza ---
+
+    def _install(self, kind, model, nbytes=None) -> None:
+        with self._state:
+            self._resident[kind] = {"model": model, "used": time.monotonic(),
+                                    "bytes": nbytes or _model_bytes(model)
+                                    or _DEFAULT_MODEL_BYTES}
+            self._sizes[kind] = self._resident[kind]["bytes"]
+
+    # compatibilità: mm._base = modello (i test iniettano un finto senza load)
+    _design = property(lambda self: self._peek("design"),
+                       lambda self, m: self._install("design", m))
+    _base = property(lambda self: self._peek("base"),
+                     lambda self, m: self._install("base", m))
+
+    def _peek(self, kind):
+        e = self._resident.get(kind)
+        return e["model"] if e else None
+
+    def _evict(self, kind, reason) -> bool:
+        """Scarica kind se non sta generando. Ritorna True se scaricato."""
+        lock = self._gen_locks[kind]
+        if not lock.acquire(blocking=False):
+            return False
         try:
-            return Qwen3TTSModel.from_pretrained(
-                repo, device_map="mps", dtype=torch.float16,
-                attn_implementation="flash_attention_2",
-            )
-        except (RuntimeError, ImportError, ValueError):
-            # flash_attention_2 non disponibile: fallback a implementazione standard
-            return Qwen3TTSModel.from_pretrained(
-                repo, device_map="mps", dtype=torch.float16,
-            )
+            with self._state:
+                if self._resident.pop(kind, None) is None:
+                    return False
+        finally:
+            lock.release()
+        tracing.MODEL_EVICTIONS.inc(model=kind, reason=reason)
+        _release_accelerator()
+        return True
+
+    def _make_room(self, need: int, keep=()) -> bool:
+        """Scarica in ordine LRU i modelli inattivi (non in keep) finché need byte
+        in più stanno nel budget. Ritorna True se ci stanno."""
+        budget = self.budget_bytes
+        if budget <= 0:
+            return True
+        with self._state:
+            order = [(k, e["bytes"]) for k, e in self._resident.items()]
+        total = sum(b for _, b in order)
+        for kind, nbytes in order:
+            if total + need <= budget:
+                break
+            if kind not in keep and self._evict(kind, "budget"):
+                total -= nbytes
+        return total + need <= budget
+
+    def _get(self, kind, only_if_fits=False):
+        """Modello residente (caricato se serve, liberando spazio). Con
+        only_if_fits (prefetch) non carica se il budget non basta: None."""
+        with self._state:
+            e = self._resident.get(kind)
+            if e:
+                self._resident.move_to_end(kind)
+                e["used"] = time.monotonic()
+                return e["model"]
+        with self._lock:
+            e = self._resident.get(kind)
+            if e:  # caricato da un altro thread nel frattempo
+                return e["model"]
+            need = self._sizes.get(kind) or max(self._sizes.values(), default=0) \
+                or _DEFAULT_MODEL_BYTES
+            # un modello in generazione non si scarica: se non c'è posto si
+            # carica lo stesso (sopra budget) e si rientra a generazione finita
+            if not self._make_room(need, keep=(kind,)) and only_if_fits:
+                return None
+            model = self._load(_REPOS[kind])
+            self._install(kind, model)
+            tracing.MODEL_LOADS.inc(model=kind)
+        self._start_reaper()
+        return model
+
+    @contextmanager
+    def _using(self, kind):
+        """Lock di generazione + modello residente; a fine uso aggiorna l'LRU e,
+        se si è sopra budget, scarica i modelli ormai inattivi."""
+        with self._gen_locks[kind]:
+            model = self._get(kind)
+            try:
+                yield model
+            finally:
+                with self._state:
+                    if kind in self._resident:
+                        self._resident[kind]["used"] = time.monotonic()
+        self._make_room(0)
 
     def design(self):
-        if self._design is None:
-            with self._lock:
-                if self._design is None:
-                    self._design = self._load(DESIGN_MODEL)
-        return self._design
+        return self._get("design")
 
     def base(self):
-        if self._base is None:
-            with self._lock:
-                if self._base is None:
-                    self._base = self._load(BASE_MODEL)
-        return self._base
+        return self._get("base")
+
+    def prefetch(self, kinds) -> None:
+        """Precarica in background i modelli richiesti dai job in coda, se entrano
+        nel budget scaricando solo modelli inattivi che non servono alla coda."""
+        if not appconfig.MODEL_PREFETCH:
+            return
+        for kind in kinds:
+            with self._state:
+                if kind in self._resident or kind in self._prefetching:
+                    continue
+                self._prefetching.add(kind)
+            threading.Thread(target=self._prefetch, args=(kind, tuple(kinds)),
+                             name=f"gassmann-prefetch-{kind}", daemon=True).start()
+
+    def _prefetch(self, kind, keep) -> None:
+        try:
+            need = self._sizes.get(kind) or max(self._sizes.values(), default=0) \
+                or _DEFAULT_MODEL_BYTES
+            if self._make_room(need, keep=keep):
+                self._get(kind, only_if_fits=True)
+        except Exception:  # noqa: BLE001 — best-effort: il job caricherà da sé
+            pass
+        finally:
+            with self._state:
+                self._prefetching.discard(kind)
+
+    def reap_idle(self, now: float | None = None) -> list[str]:
+        """Scarica i modelli inattivi da più di idle_s. Ritorna quelli scaricati."""
+        idle = self.idle_s
+        if idle <= 0:
+            return []
+        now = time.monotonic() if now is None else now
+        with self._state:
+            stale = [k for k, e in self._resident.items() if now - e["used"] > idle]
+        return [k for k in stale if self._evict(k, "idle")]
+
+    def _start_reaper(self) -> None:
+        if self.idle_s <= 0 or self._reaper is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(max(1.0, min(self.idle_s / 4, 30.0)))
+                self.reap_idle()
+
+        self._reaper = threading.Thread(target=loop, name="gassmann-model-reaper", daemon=True)
+        self._reaper.start()
+
+    def residency(self) -> dict:
+        """Modelli residenti (byte stimati, secondi di inattività) e budget."""
+        now = time.monotonic()
+        with self._state:
+            models = {k: {"bytes": e["bytes"], "idle_s": round(now - e["used"], 1)}
+                      for k, e in self._resident.items()}
+        return {"models": models, "budget_bytes": self.budget_bytes, "idle_s": self.idle_s}
+
+    def warmup(self, kind: str) -> dict:
+        """Prepara il modello `kind` ("base"/"design") con una generazione sintetica
+        minima: la prima generate reale non paga più selezione dei kernel,
+        allocazione delle cache e import lazy. Ritorna i secondi per fase."""
+        import numpy as np
+        phases = {}
+        t0 = time.perf_counter()
+        import torch  # noqa: F401
+        import qwen_tts  # noqa: F401
+        phases["import"] = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        getattr(self, kind)()  # self.base() / self.design()
+        phases["load"] = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        if kind == "base":
+            # riferimento sintetico (1 s di tono): non tocca la cache dei prompt
+            sr = 24000
+            t = np.arange(sr, dtype="float32") / sr
+            ref = ((0.1 * np.sin(2 * np.pi * 160 * t)).astype("float32"), sr)
+            self.generate_clone("Pronto.", "Italian", ref, "Prova.")
+        else:
+            self.generate_design("Pronto.", "Italian", "voce neutra")
+        phases["first_inference"] = time.perf_counter() - t0
+        return phases
 
     @staticmethod
     def _sampling_kwargs(temperature):
@@ -54,26 +345,67 @@ class ModelManager:
         return {"do_sample": True, "temperature": float(temperature)}
 
     def generate_design(self, text, language, voice_description, temperature=None):
-        wavs, sr = self.design().generate_voice_design(
-            text=text, language=language, instruct=voice_description,
-            **self._sampling_kwargs(temperature),
-        )
+        with self._using("design") as model:
+            wavs, sr = model.generate_voice_design(
+                text=text, language=language, instruct=voice_description,
+                **self._sampling_kwargs(temperature),
+            )
         return wavs[0], sr
 
+    def generate_design_batch(self, texts, language, voice_description, temperature=None):
+        """Più testi con la stessa voce in una sola generate (liste allineate)."""
+        n = len(texts)
+        with self._using("design") as model:
+            wavs, sr = model.generate_voice_design(
+                text=list(texts), language=[language] * n,
+                instruct=[voice_description] * n,
+                **self._sampling_kwargs(temperature),
+            )
+        return list(wavs), sr
+
+    def _ref_kwargs(self, model, ref_audio, ref_text, n=None):
+        """Riferimento per generate_voice_clone: prompt dalla cache (una copia
+        fresca per testo) se il campione è un file, altrimenti ref grezzo.
+        Va chiamato col lock del modello base già preso."""
+        key = self.clone_prompts.key(ref_audio, ref_text)
+        if key is None or not hasattr(model, "create_voice_clone_prompt"):
+            if n is None:
+                return {"ref_audio": ref_audio, "ref_text": ref_text}
+            return {"ref_audio": [ref_audio] * n, "ref_text": [ref_text] * n}
+
+        def encode():
+            with tracing.span("ref_encode"):
+                return model.create_voice_clone_prompt(ref_audio=ref_audio, ref_text=ref_text)
+        copies = self.clone_prompts.get(key, encode, copies=n or 1)
+        if n is None:
+            return {"voice_clone_prompt": copies[0]}
+        # un prompt item per testo (create_voice_clone_prompt → lista di item)
+        return {"voice_clone_prompt": [item for c in copies for item in c]}
+
     def generate_clone(self, text, language, ref_audio, ref_text,
                        speed_factor=1.0, temperature=None):
         # NB: il modello Base (clone) NON supporta `instruct`: l'emozione si ottiene
         # dal campione di riferimento o in post-processing (vedi pipeline).
-        # ponytail: niente cache del voice_clone_prompt — il prompt item riusato si
-        # corrompe dopo la prima generate (la voce cambia tra un rigenera e l'altro).
-        # Ri-encoding del ref per battuta è trascurabile vs il generate del talker.
-        wavs, sr = self.base().generate_voice_clone(
-            text=text, language=language, ref_audio=ref_audio, ref_text=ref_text,
-            **self._sampling_kwargs(temperature),
-        )
+        with self._using("base") as model:
+            wavs, sr = model.generate_voice_clone(
+                text=text, language=language,
+                **self._ref_kwargs(model, ref_audio, ref_text),
+                **self._sampling_kwargs(temperature),
+            )
         audio = wavs[0]
         if speed_factor and speed_factor != 1.0:
-            import librosa
-            audio = librosa.effects.time_stretch(
-                audio.astype("float32"), rate=speed_factor)
+            from app import dsp_pool
+            audio = dsp_pool.default_pool.pitch_tempo(audio, sr, rate=speed_factor)
         return audio, sr
+
+    def generate_clone_batch(self, texts, language, ref_audio, ref_text, temperature=None):
+        """Più testi con lo stesso campione in una sola generate. Niente speed:
+        il time-stretch lo fa la pipeline in post-processing."""
+        n = len(texts)
+        with self._using("base") as model:
+            wavs, sr = model.generate_voice_clone(
+                text=list(texts), language=[language] * n,
+                **self._ref_kwargs(model, ref_audio, ref_text, n=n),
+                **self._sampling_kwargs(temperature),
+            )
+        return list(wavs), sr
@@ -0,0 +1,195 @@
+"""Modalità worker pool: N processi modello dietro l'API (GASSMANN_MODEL_WORKERS).
+
+Ogni worker è un processo (spawn) con il suo ModelManager; il processo API ha un
+ModelWorkerPool con la stessa interfaccia (generate_*, warmup, prefetch,
+residency), quindi pipeline e JobQueue non cambiano. Le chiamate viaggiano su
+una coda IPC locale (un ProcessPoolExecutor a un processo per worker), l'audio
+torna in shared memory: il worker crea il segmento e ne passa il nome, il
+processo API copia e rimuove il segmento.
+
+Affinità: le generate della stessa voce (campione di riferimento per il clone,
+descrizione per il design) vanno sempre allo stesso worker, così cache dei
+prompt e modello già caricato restano caldi in quel processo.
+"""
+import importlib
+import multiprocessing
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from app import config as appconfig
+
+DEFAULT_FACTORY = "app.model_manager:ModelManager"
+
+_worker_mm = None  # ModelManager del processo worker
+
+
+@dataclass(frozen=True)
+class _Shared:
+    """Array lasciato in shared memory dal worker (nome, shape, dtype)."""
+    name: str
+    shape: tuple
+    dtype: str
+
+
+def _init(factory: str) -> None:
+    global _worker_mm
+    module, _, attr = factory.partition(":")
+    _worker_mm = getattr(importlib.import_module(module), attr)()
+
+
+def _export(obj):
+    """Nel worker: array numpy → _Shared (ricorsivo su tuple/liste/dict)."""
+    if isinstance(obj, np.ndarray):
+        arr = np.ascontiguousarray(obj)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+        shm.close()  # il segmento resta finché il processo API non fa unlink
+        return _Shared(shm.name, arr.shape, arr.dtype.str)
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_export(x) for x in obj)
+    if isinstance(obj, dict):
+        return {k: _export(v) for k, v in obj.items()}
+    return obj
+
+
+def _import(obj):
+    """Nel processo API: _Shared → array numpy proprio, segmento rimosso."""
+    if isinstance(obj, _Shared):
+        shm = shared_memory.SharedMemory(name=obj.name)
+        try:
+            return np.ndarray(obj.shape, dtype=obj.dtype, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_import(x) for x in obj)
+    if isinstance(obj, dict):
+        return {k: _import(v) for k, v in obj.items()}
+    return obj
+
+
+def _call(method: str, kwargs: dict):
+    """Esegue il metodo sul ModelManager del worker; ritorna anche lo stato di
+    residenza, così il processo API lo conosce senza interrogare un worker
+    occupato in una generate."""
+    result = _export(getattr(_worker_mm, method)(**kwargs))
+    residency = _worker_mm.residency() if hasattr(_worker_mm, "residency") else None
+    return result, residency
+
+
+class ModelWorkerPool:
+    def __init__(self, workers: int | None = None, factory: str = DEFAULT_FACTORY):
+        self.workers = max(1, workers if workers is not None else appconfig.MODEL_WORKERS)
+        self.factory = factory
+        self._lock = threading.Lock()
+        self._pools: list[ProcessPoolExecutor | None] = [None] * self.workers
+        self.calls = [0] * self.workers
+        self._residency: list[dict | None] = [None] * self.workers  # ultimo noto
+        self.restarts = 0
+
+    def _pool(self, i: int) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pools[i] is None:
+                # tracker dei segmenti condiviso: i worker non ne avviano uno proprio
+                resource_tracker.ensure_running()
+                self._pools[i] = ProcessPoolExecutor(
+                    max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init, initargs=(self.factory,))
+            return self._pools[i]
+
+    def worker_for(self, key) -> int:
+        """Worker che serve la voce identificata da key (hash stabile tra riavvii)."""
+        return zlib.crc32(repr(key).encode("utf-8")) % self.workers
+
+    def _submit(self, i: int, method: str, **kwargs):
+        pool = self._pool(i)
+        try:
+            result, residency = pool.submit(_call, method, kwargs).result()
+        except BrokenProcessPool:
+            # worker morto (es. OOM): la prossima chiamata ne avvia uno nuovo
+            with self._lock:
+                if self._pools[i] is pool:
+                    self._pools[i] = None
+                    self.restarts += 1
+            raise
+        with self._lock:
+            self.calls[i] += 1
+            self._residency[i] = residency
+        return _import(result)
+
+    def _broadcast(self, method: str, **kwargs) -> list:
+        futures = [self._pool(i).submit(_call, method, kwargs) for i in range(self.workers)]
+        out = []
+        for i, f in enumerate(futures):
+            result, residency = f.result()
+            with self._lock:
+                self._residency[i] = residency
+            out.append(_import(result))
+        return out
+
+    # --- interfaccia di ModelManager ---
+
+    def generate_design(self, text, language, voice_description, temperature=None):
+        return self._submit(self.worker_for(("design", voice_description)), "generate_design",
+                            text=text, language=language,
+                            voice_description=voice_description, temperature=temperature)
+
+    def generate_design_batch(self, texts, language, voice_description, temperature=None):
+        return self._submit(self.worker_for(("design", voice_description)),
+                            "generate_design_batch", texts=list(texts), language=language,
+                            voice_description=voice_description, temperature=temperature)
+
+    def generate_clone(self, text, language, ref_audio, ref_text,
+                       speed_factor=1.0, temperature=None):
+        return self._submit(self.worker_for(("clone", ref_audio, ref_text)), "generate_clone",
+                            text=text, language=language, ref_audio=ref_audio,
+                            ref_text=ref_text, speed_factor=speed_factor,
+                            temperature=temperature)
+
+    def generate_clone_batch(self, texts, language, ref_audio, ref_text, temperature=None):
+        return self._submit(self.worker_for(("clone", ref_audio, ref_text)),
+                            "generate_clone_batch", texts=list(texts), language=language,
+                            ref_audio=ref_audio, ref_text=ref_text, temperature=temperature)
+
+    def warmup(self, kind: str) -> dict:
+        """Warm-up di kind su tutti i worker in parallelo; per fase il più lento."""
+        phases: dict[str, float] = {}
+        for p in self._broadcast("warmup", kind=kind):
+            for k, v in p.items():
+                phases[k] = max(phases.get(k, 0.0), v)
+        return phases
+
+    def prefetch(self, kinds) -> None:
+        # ogni worker decide col suo budget; non si aspetta il risultato
+        if not kinds:
+            return
+        for i in range(self.workers):
+            self._pool(i).submit(_call, "prefetch", {"kinds": list(kinds)})
+
+    def residency(self) -> dict:
+        """Residenza per worker ("<modello>@<worker>") all'ultima chiamata di
+        ciascuno: non aspetta i worker occupati."""
+        models, budget, idle = {}, 0, 0
+        with self._lock:
+            snapshots = list(self._residency)
+        for i, r in enumerate(snapshots):
+            if r is None:
+                continue
+            models.update({f"{kind}@{i}": m for kind, m in r["models"].items()})
+            budget, idle = r["budget_bytes"], r["idle_s"]
+        return {"models": models, "budget_bytes": budget, "idle_s": idle,
+                "workers": self.workers, "calls": list(self.calls),
+                "restarts": self.restarts}
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pools, self._pools = self._pools, [None] * self.workers
+        for p in pools:
+            if p is not None:
+                p.shutdown(wait=True, cancel_futures=True)
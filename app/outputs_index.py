@@ -0,0 +1,235 @@
+"""Indice persistente dei file in OUTPUT (SQLite): la lista dell'UI non fa più
+glob + stat + sort di tutta la cartella a ogni richiesta.
+
+Le voci si scrivono quando la pipeline produce un file (generate, batch, scena,
+hit della render cache) con voce, hash del testo, durata, formato e dimensione.
+reconcile() riallinea l'indice ai file cambiati fuori dall'app (copiati,
+cancellati, sovrascritti): gira da solo al primo uso e su richiesta. Il database
+sta in CACHE_DIR, si può cancellare: si ricostruisce dai file (tranne ultimo
+accesso e pin, usati dalla retention).
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from app import config as appconfig
+
+AUDIO_SUFFIXES = (".wav", ".mp3", ".ogg", ".opus")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outputs (
+    name TEXT PRIMARY KEY,
+    voice_id TEXT,
+    text_hash TEXT,
+    duration REAL,
+    format TEXT,
+    size INTEGER,
+    mtime REAL,
+    accessed REAL,
+    pinned INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS outputs_by_mtime ON outputs (mtime DESC, name DESC);
+CREATE INDEX IF NOT EXISTS outputs_by_voice ON outputs (voice_id, mtime DESC, name DESC);
+"""
+# colonne aggiunte dopo la prima versione dello schema (db già esistenti)
+_MIGRATIONS = {"accessed": "REAL", "pinned": "INTEGER NOT NULL DEFAULT 0"}
+_COLUMNS = ("name", "voice_id", "text_hash", "duration", "format", "size", "mtime",
+            "accessed", "pinned")
+# upsert che non tocca pinned (e accessed se non passato) delle righe esistenti
+_UPSERT = """
+INSERT INTO outputs (name, voice_id, text_hash, duration, format, size, mtime, accessed)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (name) DO UPDATE SET
+    voice_id = excluded.voice_id, text_hash = excluded.text_hash,
+    duration = excluded.duration, format = excluded.format, size = excluded.size,
+    mtime = excluded.mtime, accessed = COALESCE(excluded.accessed, outputs.accessed)
+"""
+
+
+def text_hash(text: str | None) -> str | None:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16] if text else None
+
+
+def _voice_from_name(name: str) -> str | None:
+    """Voce dal nome file "<testo>_by_<voce>.<ext>" (file senza voce registrata)."""
+    stem = Path(name).stem
+    return stem.rsplit("_by_", 1)[1] if "_by_" in stem else None
+
+
+def _duration(path: Path) -> float | None:
+    try:
+        import soundfile as sf
+        return sf.info(str(path)).duration
+    except Exception:
+        return None
+
+
+def _timestamp(value: str | float | None) -> float | None:
+    """Epoch o data/ora ISO (es. "2026-10-17", "2026-10-17T12:00") → epoch."""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(str(value)).timestamp()
+
+
+class OutputsIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        self._path: Path | None = None
+
+    def _conn(self) -> sqlite3.Connection:
+        """Connessione al db corrente (CACHE_DIR può cambiare, es. nei test).
+        Indice nuovo → reconcile iniziale dai file già in OUTPUT."""
+        path = appconfig.CACHE_DIR / "outputs.sqlite"
+        if path != self._path or self._db is None:
+            if self._db is not None:
+                self._db.close()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fresh = not path.exists()
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+            self._db.executescript(_SCHEMA)
+            cols = {r[1] for r in self._db.execute("PRAGMA table_info(outputs)")}
+            with self._db:
+                for col, decl in _MIGRATIONS.items():
+                    if col not in cols:
+                        self._db.execute(f"ALTER TABLE outputs ADD COLUMN {col} {decl}")
+                self._db.execute("CREATE INDEX IF NOT EXISTS outputs_by_access "
+                                 "ON outputs (pinned, accessed)")
+            self._path = path
+            if fresh:
+                self._reconcile()
+        return self._db
+
+    def record(self, path: str | Path, voice_id: str | None = None,
+               text: str | None = None, duration: float | None = None) -> None:
+        """Registra (o aggiorna) un file appena scritto in OUTPUT."""
+        p = Path(path)
+        try:
+            st = p.stat()
+        except OSError:
+            return
+        if duration is None:
+            duration = _duration(p)
+        row = (p.name, voice_id or _voice_from_name(p.name), text_hash(text), duration,
+               p.suffix.lstrip("."), st.st_size, st.st_mtime, time.time())
+        with self._lock:
+            db = self._conn()
+            with db:
+                db.execute(_UPSERT, row)
+
+    def remove(self, name: str) -> None:
+        with self._lock:
+            db = self._conn()
+            with db:
+                db.execute("DELETE FROM outputs WHERE name = ?", (name,))
+
+    def touch(self, name: str) -> None:
+        """Segna l'accesso a un file (servito all'UI): base dell'eviction LRU."""
+        with self._lock:
+            db = self._conn()
+            with db:
+                db.execute("UPDATE outputs SET accessed = ? WHERE name = ?",
+                           (time.time(), name))
+
+    def set_pinned(self, names, pinned: bool = True) -> int:
+        """Pin/unpin (i file pinnati non vengono mai rimossi dalla retention).
+        Ritorna quanti file indicizzati sono stati aggiornati."""
+        with self._lock:
+            db = self._conn()
+            with db:
+                cur = db.executemany("UPDATE outputs SET pinned = ? WHERE name = ?",
+                                     [(int(pinned), n) for n in names])
+            return cur.rowcount
+
+    def usage(self) -> dict:
+        with self._lock:
+            files, size, pinned, pinned_size = self._conn().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(pinned), 0), "
+                "COALESCE(SUM(size * pinned), 0) FROM outputs").fetchone()
+        return {"files": files, "bytes": size, "pinned": pinned, "pinned_bytes": pinned_size}
+
+    def least_recent(self, accessed_before: float) -> list[dict]:
+        """File non pinnati con ultimo accesso prima di accessed_before, dal più vecchio."""
+        with self._lock:
+            rows = self._conn().execute(
+                "SELECT * FROM outputs WHERE pinned = 0 AND COALESCE(accessed, mtime) < ? "
+                "ORDER BY COALESCE(accessed, mtime), name", (accessed_before,)).fetchall()
+        return [dict(zip(_COLUMNS, r)) for r in rows]
+
+    def list(self, limit: int = 50, cursor: str | None = None, voice: str | None = None,
+             since: str | float | None = None, until: str | float | None = None) -> dict:
+        """Pagina di file dal più recente: {"items": [...], "next": cursor|None}.
+        Il cursore è "<mtime>|<nome>" dell'ultimo elemento della pagina precedente."""
+        where, args = [], []
+        if voice:
+            where.append("voice_id = ?")
+            args.append(voice)
+        if (t := _timestamp(since)) is not None:
+            where.append("mtime >= ?")
+            args.append(t)
+        if (t := _timestamp(until)) is not None:
+            where.append("mtime < ?")
+            args.append(t)
+        if cursor:
+            mtime, _, name = cursor.partition("|")
+            where.append("(mtime < ? OR (mtime = ? AND name < ?))")
+            args += [float(mtime), float(mtime), name]
+        sql = "SELECT * FROM outputs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY mtime DESC, name DESC LIMIT ?"
+        limit = max(1, min(int(limit), 1000))
+        with self._lock:
+            rows = self._conn().execute(sql, args + [limit + 1]).fetchall()
+        items = [dict(zip(_COLUMNS, r)) for r in rows[:limit]]
+        nxt = f"{items[-1]['mtime']!r}|{items[-1]['name']}" if len(rows) > limit else None
+        return {"items": items, "next": nxt}
+
+    def reconcile(self) -> dict:
+        """Riallinea l'indice a OUTPUT: aggiunge i file nuovi o cambiati (size/mtime),
+        toglie quelli spariti. Ritorna i conteggi."""
+        with self._lock:
+            self._conn()
+            return self._reconcile()
+
+    def _reconcile(self) -> dict:
+        db = self._db
+        known = {name: (size, mtime) for name, size, mtime
+                 in db.execute("SELECT name, size, mtime FROM outputs")}
+        added = updated = 0
+        seen = set()
+        out = appconfig.OUTPUT_DIR
+        entries = os.scandir(out) if out.is_dir() else ()
+        with db:
+            for e in entries:
+                if not e.is_file() or not e.name.endswith(AUDIO_SUFFIXES):
+                    continue
+                seen.add(e.name)
+                st = e.stat()
+                if known.get(e.name) == (st.st_size, st.st_mtime):
+                    continue
+                old = db.execute("SELECT voice_id, text_hash FROM outputs WHERE name = ?",
+                                 (e.name,)).fetchone()
+                voice_id, thash = old if old else (_voice_from_name(e.name), None)
+                # file nuovo: l'ultimo accesso noto è la sua scrittura
+                db.execute(_UPSERT, (e.name, voice_id, thash, _duration(Path(e.path)),
+                                     Path(e.name).suffix.lstrip("."), st.st_size,
+                                     st.st_mtime, None if old else st.st_mtime))
+                if old:
+                    updated += 1
+                else:
+                    added += 1
+            gone = [n for n in known if n not in seen]
+            db.executemany("DELETE FROM outputs WHERE name = ?", [(n,) for n in gone])
+        return {"added": added, "updated": updated, "removed": len(gone),
+                "total": len(seen)}
+
+
+default_index = OutputsIndex()
@@ -1,8 +1,13 @@
 """Collega voci + preprocessing + modello + salvataggio file."""
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import soundfile as sf
 
 from app import config as appconfig
-from app import voices
+from app import dsp_pool, encoders, outputs_index, render_cache, tracing, voices
 
 
 # Frasi instruct per il modello VoiceDesign (le voci clone le ignorano)
@@ -30,44 +35,53 @@ EMOTION_DSP = {
 }
 
 
+def pitch_tempo(audio, sr, n_steps=0.0, rate=1.0):
+    """Pitch-shift (semitoni) + time-stretch (rate>1 = più veloce) con UNA sola
+    STFT/phase vocoder. pitch_shift di librosa = stretch di 2^(-n/12) + resample;
+    qui lo stretch del pitch e quello del tempo diventano un solo stretch
+    (rate·2^(-n/12)), poi il resample riporta il pitch. Durata finale = len/rate."""
+    import librosa
+    y = audio.astype("float32")
+    if not n_steps:
+        return y if rate == 1.0 else librosa.effects.time_stretch(y, rate=rate)
+    ratio = 2.0 ** (-float(n_steps) / 12)
+    y = librosa.effects.time_stretch(y, rate=ratio * rate)
+    y = librosa.resample(y, orig_sr=float(sr) / ratio, target_sr=sr, res_type="soxr_hq")
+    return librosa.util.fix_length(y, size=int(round(len(audio) / rate)))
+
+
 def apply_emotion_dsp(audio, sr, emotion):
     """Approssima l'emozione con pitch/tempo/gain. Crudo ma controllabile."""
     preset = EMOTION_DSP.get(emotion)
     if not preset:
         return audio
-    import numpy as np
-    import librosa
     n_steps, tempo, gain = preset
-    y = audio.astype("float32")
-    if n_steps:
-        y = librosa.effects.pitch_shift(y, sr=sr, n_steps=n_steps)
-    if tempo and tempo != 1.0:
-        y = librosa.effects.time_stretch(y, rate=tempo)
-    y = y * gain
-    return np.clip(y, -1.0, 1.0)
+    return dsp_pool.default_pool.pitch_tempo(audio, sr, n_steps, tempo or 1.0, gain)
 
 
 def _preprocess_biochem(text: str) -> str:
     try:
-        from app.biochem_text_preprocessor import BiochemTextPreprocessor
-        return BiochemTextPreprocessor().process_text(text)
+        from app.biochem_text_preprocessor import get_preprocessor
+        return get_preprocessor().preprocess(text)
     except Exception:
         return text
 
 
-def _safe_name(text: str) -> str:
-    return voices.slugify(text, maxlen=30, default="audio")
+def preprocess_many(texts: list[str]) -> list[str]:
+    """Normalizzazione biochimica di più testi (memo condiviso con le generate);
+    un testo che fa fallire il preprocessore resta invariato, come in _plan."""
+    try:
+        from app.biochem_text_preprocessor import get_preprocessor
+        return get_preprocessor().preprocess_many(texts)
+    except Exception:
+        return [_preprocess_biochem(t) for t in texts]
 
 
-def _to_mp3(wav_path: str) -> str:
-    from pydub import AudioSegment
-    mp3_path = wav_path[:-4] + ".mp3"
-    AudioSegment.from_wav(wav_path).export(mp3_path, format="mp3", bitrate="192k")
-    import os
-    os.remove(wav_path)
-    return mp3_path
+def _safe_name(text: str) -> str:
+    return voices.slugify(text, maxlen=30, default="audio")
 
 
+@tracing.traced("trim")
 def _trim_onset_blip(audio, sr, frame_ms=10, thr=0.02, gap_ms=30, max_cut_ms=90):
     """Rimuove il transiente di warm-up del modello a inizio clip: un blip corto
     seguito da un gap di silenzio prima della voce vera. Conservativo — taglia solo
@@ -75,23 +89,26 @@ def _trim_onset_blip(audio, sr, frame_ms=10, thr=0.02, gap_ms=30, max_cut_ms=90)
     # ponytail: euristico su energia; se mai mangiasse la prima sillaba alza
     # max_cut_ms/thr (o mettilo dietro un flag)."""
     import numpy as np
-    y = audio.astype("float32")
+    y = np.asarray(audio, dtype="float32")
     w = max(1, int(sr * frame_ms / 1000))
     n = min(len(y) // w, int(400 / frame_ms))
     if n < 4:
         return audio
-    rms = np.array([np.sqrt((y[i*w:(i+1)*w]**2).mean()) for i in range(n)])
+    frames = y[:n * w].reshape(n, w)  # vista, niente copia
+    rms = np.sqrt(np.einsum("ij,ij->i", frames, frames) / w)
     if rms[0] <= thr and rms[1] <= thr:
         return audio  # parte già in silenzio: nessun blip da togliere
-    quiet = rms <= thr
     gapf = max(1, int(gap_ms / frame_ms))
-    run = 0
-    for i in range(1, n):
-        run = run + 1 if quiet[i] else 0
-        if run >= gapf:                       # primo gap di silenzio dopo l'inizio
-            cut = (i - run + 1) * w
-            return y[cut:] if cut <= max_cut_ms / 1000 * sr else audio
-    return audio  # nessun gap precoce: probabilmente parte subito a parlare
+    # frame silenziosi in ogni finestra di gapf frame a partire dal frame 1:
+    # la prima finestra tutta silenziosa è il primo gap dopo l'inizio
+    quiet = (rms[1:] <= thr).astype(np.int32)
+    if len(quiet) < gapf:
+        return audio
+    full = np.flatnonzero(np.convolve(quiet, np.ones(gapf, np.int32), "valid") == gapf)
+    if not full.size:
+        return audio  # nessun gap precoce: probabilmente parte subito a parlare
+    cut = (int(full[0]) + 1) * w
+    return y[cut:] if cut <= max_cut_ms / 1000 * sr else audio
 
 
 def apply_dsp(audio, sr, semitones=0.0, gain_db=0.0):
@@ -100,20 +117,20 @@ def apply_dsp(audio, sr, semitones=0.0, gain_db=0.0):
     # (±4 semitoni / ±6 dB). Per controllo "vero" sulle design usa instruct/temperature."""
     if not semitones and not gain_db:
         return audio
-    import numpy as np
-    import librosa
-    y = audio.astype("float32")
-    if semitones:
-        y = librosa.effects.pitch_shift(y, sr=sr, n_steps=float(semitones))
-    if gain_db:
-        y = y * (10 ** (float(gain_db) / 20))
-    return np.clip(y, -1.0, 1.0)
+    return dsp_pool.default_pool.pitch_tempo(audio, sr, float(semitones or 0.0),
+                                             gain=10 ** (float(gain_db or 0.0) / 20))
 
 
-def run_generation(model_manager, text, voice_id, fmt="wav",
-                   biochem=False, out_name=None, progress=None, speed=None,
-                   instruct=None, emotion=None, temperature=None,
-                   pitch=None, gain=None):
+# --- Generazione a stadi ---
+# 1) inferenza (modello)  2) DSP + trim  3) encode + scrittura.
+# run_generation li esegue in fila; run_generation_many tiene occupato il modello
+# mandando gli stadi 2-3 di ogni battuta a un pool CPU mentre genera la successiva.
+# Il pitch/tempo dello stadio 2 gira a sua volta nel pool di processi DSP (dsp_pool).
+
+@tracing.traced("plan")
+def _plan(text, voice_id, biochem=False, out_name=None, speed=None,
+          instruct=None, emotion=None, temperature=None, pitch=None, gain=None):
+    """Risolve voce, emozione e parametri di una generazione (nessun modello)."""
     info = voices.get_voice(voice_id)
     if info is None:
         raise ValueError(f"voce non trovata: {voice_id}")
@@ -121,68 +138,647 @@ def run_generation(model_manager, text, voice_id, fmt="wav",
         raise ValueError("testo vuoto")
     if biochem:
         text = _preprocess_biochem(text)
-    if progress:
-        progress(0.3)
-
+    cfg = voices.load_config(voice_id)
+    plan = {"type": info["type"], "voice_id": voice_id, "text": text,
+            "language": info["language"], "temperature": temperature, "emotion": emotion,
+            "pitch": pitch or 0.0, "gain": gain or 0.0, "dsp_emotion": None}
     if info["type"] == "design":
-        cfg = voices.load_config(voice_id)
         # design: l'emozione passa per instruct (frase + istruzione libera)
-        instruct_final = ", ".join(x for x in [
+        plan["voice_description"] = ", ".join(x for x in [
             cfg.get("voice_description", ""), EMOTION_PHRASES.get(emotion, ""), instruct
         ] if x)
-        audio, sr = model_manager.generate_design(
-            text=text, language=info["language"],
-            voice_description=instruct_final, temperature=temperature)
-        # generate_design non accetta speed → time-stretch qui (come il clone),
+        # generate_design non accetta speed → time-stretch in post (come il clone),
         # così la Velocità del Teatro-Emozioni funziona anche sulle voci design
-        speed_factor = speed if speed is not None else 1.0
-        if speed_factor and speed_factor != 1.0:
-            import librosa
-            audio = librosa.effects.time_stretch(audio.astype("float32"), rate=speed_factor)
+        plan["speed"] = speed if speed is not None else 1.0
     else:
-        cfg = voices.load_config(voice_id)
         # cascata emozione: campione emotivo (qualità reale) → altrimenti DSP fallback
         emo_sample, emo_ref = voices.get_emotion_sample(voice_id, emotion)
         if emo_sample is not None:
-            ref_audio, ref_text, dsp_emotion = str(emo_sample), emo_ref, None
+            plan["ref_audio"], plan["ref_text"] = str(emo_sample), emo_ref
         else:
             base = voices.get_sample_path(voice_id)
             if base is None:
                 raise ValueError("campione audio mancante per la voce clonata")
-            ref_audio, ref_text, dsp_emotion = str(base), cfg.get("ref_text", ""), emotion
-        speed_factor = speed if speed is not None else cfg.get("speed_factor", 1.0)
-        audio, sr = model_manager.generate_clone(
-            text=text, language=info["language"], ref_audio=ref_audio,
-            ref_text=ref_text, speed_factor=speed_factor, temperature=temperature)
-        if dsp_emotion:
-            audio = apply_emotion_dsp(audio, sr, dsp_emotion)
+            plan["ref_audio"], plan["ref_text"] = str(base), cfg.get("ref_text", "")
+            plan["dsp_emotion"] = emotion
+        plan["speed"] = speed if speed is not None else cfg.get("speed_factor", 1.0)
+    plan["name"] = _safe_name(out_name) if out_name else f"{_safe_name(text)}_by_{voice_id}"
+    return plan
+
+
+@tracing.traced("inference")
+def _infer(model_manager, plan):
+    """Stadio 1: solo la chiamata al modello."""
+    if plan["type"] == "design":
+        return model_manager.generate_design(
+            text=plan["text"], language=plan["language"],
+            voice_description=plan["voice_description"],
+            temperature=plan["temperature"])
+    # speed_factor=1.0: il time-stretch lo fa lo stadio 2, fuori dal thread del modello
+    return model_manager.generate_clone(
+        text=plan["text"], language=plan["language"], ref_audio=plan["ref_audio"],
+        ref_text=plan["ref_text"], speed_factor=1.0, temperature=plan["temperature"])
+
+
+def _batch_key(plan):
+    """Battute con la stessa chiave possono condividere una generate."""
+    if plan["type"] == "design":
+        voice = (plan["voice_description"],)
+    else:
+        voice = (plan["ref_audio"], plan["ref_text"])
+    return (plan["type"], plan["language"], plan["temperature"]) + voice
+
+
+def _micro_batches(plans, max_size=None, max_waste=None):
+    """Raggruppa gli indici di plans per _batch_key in micro-batch: dentro un
+    gruppo ordina per lunghezza del testo (proxy dei token) e chiude il batch
+    quando supera max_size o la quota di padding sprecato supera max_waste."""
+    max_size = max_size or appconfig.BATCH_MAX_SIZE
+    max_waste = appconfig.BATCH_MAX_PAD_WASTE if max_waste is None else max_waste
+    groups: dict[tuple, list[int]] = {}
+    for i, plan in enumerate(plans):
+        groups.setdefault(_batch_key(plan), []).append(i)
+    batches = []
+    for idxs in groups.values():
+        idxs.sort(key=lambda i: len(plans[i]["text"]))
+        cur = []
+        for i in idxs:
+            lens = [len(plans[j]["text"]) for j in cur] + [len(plans[i]["text"])]
+            waste = 1 - sum(lens) / (max(lens) * len(lens) or 1)
+            if cur and (len(cur) >= max_size or waste > max_waste):
+                batches.append(cur)
+                cur = []
+            cur.append(i)
+        if cur:
+            batches.append(cur)
+    return batches
+
+
+def _can_batch(model_manager, plan):
+    method = "generate_design_batch" if plan["type"] == "design" else "generate_clone_batch"
+    return hasattr(model_manager, method)
+
+
+def _infer_batch(model_manager, plans):
+    """Stadio 1 su un micro-batch. Ricade sulla generate singola se il batch ha
+    un solo testo o il model manager non espone le entry point batch."""
+    first = plans[0]
+    if len(plans) == 1 or not _can_batch(model_manager, first):
+        return [_infer(model_manager, p) for p in plans]
+    texts = [p["text"] for p in plans]
+    with tracing.span("inference_batch"):
+        if first["type"] == "design":
+            wavs, sr = model_manager.generate_design_batch(
+                texts, language=first["language"],
+                voice_description=first["voice_description"],
+                temperature=first["temperature"])
+        else:
+            wavs, sr = model_manager.generate_clone_batch(
+                texts, language=first["language"], ref_audio=first["ref_audio"],
+                ref_text=first["ref_text"], temperature=first["temperature"])
+    return [(w, sr) for w in wavs]
+
+
+def _postprocess(audio, sr, plan):
+    """Stadio 2: trim del blip di warm-up sull'uscita grezza del modello, poi
+    velocità + emozione DSP (clone senza campione) + DSP manuale fusi in un solo
+    passaggio pitch/tempo e un solo gain, sul pool di processi DSP."""
     audio = _trim_onset_blip(audio, sr)  # via il rumore di warm-up iniziale
-    # DSP manuale (pitch/gain) sopra a tutto: vale design e clone
-    audio = apply_dsp(audio, sr, pitch or 0.0, gain or 0.0)
+    n_steps, tempo, gain = EMOTION_DSP.get(plan["dsp_emotion"], (0.0, 1.0, 1.0))
+    n_steps += plan["pitch"]  # DSP manuale sopra a tutto: vale design e clone
+    rate = (plan["speed"] or 1.0) * (tempo or 1.0)
+    gain *= 10 ** (plan["gain"] / 20)
+    if not n_steps and rate == 1.0 and gain == 1.0:
+        return audio
+    with tracing.span("dsp"):
+        return dsp_pool.default_pool.pitch_tempo(audio, sr, n_steps, rate, gain)
+
+
+def _encode(audio, sr, plan, fmt):
+    """Stadio 3: encode dall'array in memoria nel formato richiesto."""
+    path = encoders.encode(audio, sr, appconfig.OUTPUT_DIR / plan["name"], fmt)
+    with tracing.span("index"):
+        outputs_index.default_index.record(path, voice_id=plan["voice_id"],
+                                           text=plan["text"], duration=len(audio) / sr)
+    tracing.record_audio(plan["type"], len(audio) / sr)
+    return path
+
+
+@tracing.traced("cache_key")
+def _cache_key(plan, fmt):
+    from app.model_manager import BASE_MODEL, DESIGN_MODEL
+    model_id = DESIGN_MODEL if plan["type"] == "design" else BASE_MODEL
+    return render_cache.render_key(
+        plan, voices.load_config(plan["voice_id"]), model_id, fmt)
+
+
+@tracing.traced("cache_lookup")
+def _cached(plan, key):
+    """Path in OUTPUT del render già in cache, o None."""
+    path = render_cache.default_cache.get(
+        key, appconfig.OUTPUT_DIR / f"{plan['name']}.wav")
+    if path:
+        outputs_index.default_index.record(path, voice_id=plan["voice_id"], text=plan["text"])
+    return path
+
+
+# --- Segmentazione testi lunghi ---
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+_CLAUSE_END = re.compile(r"(?<=[,;:])\s+")
+
+
+def split_sentences(text: str) -> list[str]:
+    """Spezza su fine frase (. ! ? …) seguito da spazio; niente frasi vuote."""
+    return [s.strip() for s in _SENTENCE_END.split(text) if s.strip()]
+
+
+def _split_words(text: str, budget: int) -> list[str]:
+    out, cur = [], ""
+    for w in text.split():
+        if cur and len(cur) + 1 + len(w) > budget:
+            out.append(cur)
+            cur = w
+        else:
+            cur = f"{cur} {w}" if cur else w
+    return out + [cur] if cur else out
+
+
+def segment_text(text: str, max_chars: int | None = None, merge: bool = True) -> list[str]:
+    """Segmenti di al più max_chars (proxy dei token del talker): frasi intere,
+    una frase troppo lunga si spezza su , ; : e in ultima istanza tra parole.
+    merge=True riaccorpa i pezzi consecutivi finché stanno nel budget (meno
+    generate); merge=False li lascia corti (streaming: primo audio prima)."""
+    budget = max_chars or appconfig.SEGMENT_MAX_CHARS
+    pieces = []
+    for sent in split_sentences(text):
+        if len(sent) <= budget:
+            pieces.append(sent)
+            continue
+        for clause in _CLAUSE_END.split(sent):
+            pieces.extend([clause] if len(clause) <= budget else _split_words(clause, budget))
+    if not merge:
+        return pieces or [text.strip()]
+    segs = []
+    for piece in pieces:
+        if segs and len(segs[-1]) + 1 + len(piece) <= budget:
+            segs[-1] += " " + piece
+        else:
+            segs.append(piece)
+    return segs or [text.strip()]
+
+
+@tracing.traced("join")
+def join_segments(audios, sr, crossfade_ms=None):
+    """Unisce i segmenti con un crossfade lineare corto (niente click alla giunta)."""
+    import numpy as np
+    ms = appconfig.SEGMENT_CROSSFADE_MS if crossfade_ms is None else crossfade_ms
+    out = np.asarray(audios[0], dtype="float32")
+    for nxt in audios[1:]:
+        nxt = np.asarray(nxt, dtype="float32")
+        n = min(int(sr * ms / 1000), len(out), len(nxt))
+        if n:
+            ramp = np.linspace(0.0, 1.0, n, dtype="float32")
+            mixed = out[-n:] * (1 - ramp) + nxt[:n] * ramp
+            out = np.concatenate([out[:-n], mixed, nxt[n:]])
+        else:
+            out = np.concatenate([out, nxt])
+    return out
+
+
+def _infer_segments(model_manager, plans, retries):
+    """Stadio 1 su un micro-batch di segmenti. Se fallisce, ogni segmento
+    riprova da solo (fino a `retries` volte): un errore non butta il lavoro
+    degli altri segmenti."""
+    if len(plans) > 1 and not _can_batch(model_manager, plans[0]):
+        return [out for p in plans for out in _infer_segments(model_manager, [p], retries)]
+    try:
+        return _infer_batch(model_manager, plans)
+    except Exception:
+        if len(plans) == 1:
+            if retries <= 0:
+                raise
+            return _infer_segments(model_manager, plans, retries - 1)
+        return [out for p in plans for out in _infer_segments(model_manager, [p], retries)]
+
+
+_cpu_pool_inst = None
+_cpu_pool_lock = threading.Lock()
+
+
+def _cpu_pool() -> ThreadPoolExecutor:
+    global _cpu_pool_inst
+    with _cpu_pool_lock:
+        if _cpu_pool_inst is None:
+            _cpu_pool_inst = ThreadPoolExecutor(
+                max_workers=max(1, appconfig.CPU_WORKERS), thread_name_prefix="gassmann-cpu")
+        return _cpu_pool_inst
+
+
+def _render(model_manager, plans, keys, fmt, progress=None, should_stop=None):
+    """Motore comune: ogni piano è spezzato in segmenti, i segmenti di tutti i
+    piani vanno al modello a micro-batch (thread chiamante), trim/DSP per
+    segmento gira sul pool CPU e l'ultimo segmento di un piano innesca unione
+    (crossfade) + encode. Progress per segmento. Ritorna i path nell'ordine.
+    should_stop() True (job annullato) interrompe tra un micro-batch e l'altro."""
+    pool = _cpu_pool()
+    # backpressure: al massimo 2 segmenti per worker in attesa di post-processing
+    inflight = threading.BoundedSemaphore(2 * max(1, appconfig.CPU_WORKERS))
+    segs, parts = [], []  # segs: (piano, posizione nel piano, piano del segmento)
+    for i, plan in enumerate(plans):
+        texts = segment_text(plan["text"])
+        parts.append([None] * len(texts))
+        segs += [(i, j, dict(plan, text=t)) for j, t in enumerate(texts)]
+    left = [len(p) for p in parts]
+    lock, done, results = threading.Lock(), [0], [None] * len(plans)
+
+    def _stage23(k, audio, sr):
+        i, j, seg = segs[k]
+        try:
+            parts[i][j] = _postprocess(audio, sr, seg)
+            with lock:
+                left[i] -= 1
+                last = left[i] == 0
+            if last:  # tutti i segmenti del piano pronti → unione + encode
+                whole = join_segments(parts[i], sr) if len(parts[i]) > 1 else parts[i][0]
+                results[i] = _encode(whole, sr, plans[i], fmt)
+                parts[i] = None
+                render_cache.default_cache.put(keys[i], results[i])
+        finally:
+            inflight.release()
+            with lock:
+                done[0] += 1
+                if progress:
+                    progress(done[0] / len(segs))
+
+    futures = []
+    try:
+        for batch in _micro_batches([seg for _, _, seg in segs]):
+            if should_stop and should_stop():
+                raise RuntimeError("annullato")  # il modello si libera per gli altri job
+            outs = _infer_segments(model_manager, [segs[k][2] for k in batch],
+                                   appconfig.SEGMENT_RETRIES)
+            for k, (audio, sr) in zip(batch, outs):
+                inflight.acquire()
+                futures.append(pool.submit(tracing.bind(_stage23), k, audio, sr))
+        for f in futures:
+            f.result()
+        return results
+    finally:
+        for f in futures:
+            f.cancel()  # errore a metà: non sprecare CPU sui segmenti rimasti
+
+
+def run_generation(model_manager, text, voice_id, fmt="wav",
+                   biochem=False, out_name=None, progress=None, speed=None,
+                   instruct=None, emotion=None, temperature=None,
+                   pitch=None, gain=None):
+    plan = _plan(text, voice_id, biochem=biochem, out_name=out_name, speed=speed,
+                 instruct=instruct, emotion=emotion, temperature=temperature,
+                 pitch=pitch, gain=gain)
+    key = _cache_key(plan, fmt)
+    hit = _cached(plan, key)
+    if hit:
+        return hit  # stessa battuta, stessi parametri: niente modello
+    if len(segment_text(plan["text"])) > 1:
+        # testo lungo: segmenti a micro-batch, retry per segmento, crossfade
+        return _render(model_manager, [plan], [key], fmt, progress)[0]
+    if progress:
+        progress(0.3)
+    audio, sr = _infer(model_manager, plan)
+    audio = _postprocess(audio, sr, plan)
     if progress:
         progress(0.8)
+    path = _encode(audio, sr, plan, fmt)
+    render_cache.default_cache.put(key, path)
+    return path
+
+
+def run_generation_many(model_manager, requests, fmt="wav", progress=None,
+                        should_stop=None):
+    """Come run_generation su più richieste (kwargs di run_generation, senza
+    model_manager/fmt/progress), in pipeline: il thread chiamante fa solo
+    inferenza, a micro-batch di segmenti con stessa voce/campione/lingua, gli
+    stadi 2-3 girano sul pool CPU. Ritorna i path nell'ordine delle richieste.
+    should_stop come in _render."""
+    plans = [_plan(**r) for r in requests]  # errori di voce/testo prima di generare
+    keys = [_cache_key(p, fmt) for p in plans]
+    results = [_cached(p, k) for p, k in zip(plans, keys)]
+    todo = [i for i, r in enumerate(results) if not r]
+    if todo:
+        def _progress(p):
+            if progress:  # i render in cache contano già come fatti
+                progress((len(plans) - len(todo) + p * len(todo)) / len(plans))
+        rendered = _render(model_manager, [plans[i] for i in todo],
+                           [keys[i] for i in todo], fmt, _progress, should_stop)
+        for i, path in zip(todo, rendered):
+            results[i] = path
+    elif progress:
+        progress(1.0)
+    return results
+
 
-    name = _safe_name(out_name) if out_name else f"{_safe_name(text)}_by_{voice_id}"
-    wav_path = str(appconfig.OUTPUT_DIR / f"{name}.wav")
-    sf.write(wav_path, audio, sr)
-    return _to_mp3(wav_path) if fmt == "mp3" else wav_path
+# --- Streaming: frase per frase, chunk PCM appena post-processato ---
+
+def iter_generation(model_manager, text, voice_id, biochem=False, speed=None,
+                    instruct=None, emotion=None, temperature=None,
+                    pitch=None, gain=None, should_stop=None):
+    """Genera frase per frase e restituisce (audio, sr) di ciascuna già passato
+    per trim + DSP: il primo chunk è pronto dopo la prima frase, non dopo tutto
+    il testo. should_stop() True (es. client disconnesso) interrompe tra frasi."""
+    plan = _plan(text, voice_id, biochem=biochem, speed=speed, instruct=instruct,
+                 emotion=emotion, temperature=temperature, pitch=pitch, gain=gain)
+    for sentence in segment_text(plan["text"], merge=False):
+        if should_stop and should_stop():
+            return
+        seg = dict(plan, text=sentence)
+        audio, sr = _infer(model_manager, seg)
+        yield _postprocess(audio, sr, seg), sr
+
+
+def wav_stream_header(sr: int, channels: int = 1) -> bytes:
+    """Header WAV PCM16 a lunghezza ignota (0xFFFFFFFF): i player lo leggono in
+    streaming fino a fine connessione."""
+    import struct
+    block = channels * 2
+    return (b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sr, sr * block, block, 16)
+            + b"data" + struct.pack("<I", 0xFFFFFFFF))
+
+
+def pcm16(audio) -> bytes:
+    import numpy as np
+    y = np.clip(np.asarray(audio, dtype="float32"), -1.0, 1.0)
+    return (y * 32767).astype("<i2").tobytes()
+
+
+class _ClipCache:
+    """LRU dei clip decodificati per (path, mtime, size), limite in byte.
+
+    Rigenerare una battuta riscrive solo il suo file: al re-render della scena
+    si rilegge quel clip, gli altri arrivano dalla cache. Gli array sono
+    read-only (condivisi tra stitch)."""
+
+    def __init__(self, max_bytes: int | None = None):
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._items: dict = {}  # key -> (audio, sr), in ordine LRU (dict è ordinato)
+        self._bytes = 0
+        self.hits = self.misses = 0
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes if self._max_bytes is not None else appconfig.CLIP_CACHE_BYTES
+
+    def read(self, path) -> tuple:
+        st = os.stat(path)
+        key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+        with self._lock:
+            hit = self._items.pop(key, None)
+            if hit is not None:
+                self._items[key] = hit  # in coda: usato di recente
+                self.hits += 1
+                return hit
+            self.misses += 1
+        audio, sr = sf.read(path, dtype="float32")
+        audio.setflags(write=False)
+        with self._lock:
+            if key not in self._items:
+                self._items[key] = (audio, sr)
+                self._bytes += audio.nbytes
+            while self._bytes > self.max_bytes and len(self._items) > 1:
+                old = next(iter(self._items))
+                self._bytes -= self._items.pop(old)[0].nbytes
+        return audio, sr
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+
+clip_cache = _ClipCache()
+
+
+class _SceneWriter:
+    """Scrive la scena a blocchi: un clip o un blocco di silenzio alla volta,
+    su un sf.SoundFile aperto una volta sola (WAV o encoder in-process) o in
+    pipe a ffmpeg. In memoria c'è al più un clip più un blocco di silenzio da 1 s."""
+
+    def __init__(self, path: str, sr: int, channels: int, cmd: list[str] | None = None,
+                 fmt: str = "wav"):
+        import numpy as np
+        import subprocess
+        self.path, self.sr, self.channels, self.frames = path, sr, channels, 0
+        shape = (sr,) if channels == 1 else (sr, channels)
+        self._zeros = np.zeros(shape, dtype="float32")
+        self._proc = self._file = None
+        if cmd:
+            self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        else:
+            self._file = encoders.open_native(path, sr, channels, fmt)
+
+    def write(self, audio) -> None:
+        import numpy as np
+        if self._proc:
+            self._proc.stdin.write(np.ascontiguousarray(audio, dtype="<f4").tobytes())
+        else:
+            self._file.write(audio)
+        self.frames += len(audio)
+
+    def copy(self, src: "sf.SoundFile", start: int, n: int) -> None:
+        """Copia n frame di un WAV PCM16 esistente così come sono (int16 → int16,
+        nessuna riconversione), a blocchi da 1 s."""
+        src.seek(start)
+        while n > 0:
+            block = src.read(min(n, self.sr), dtype="int16", always_2d=self.channels > 1)
+            if not len(block):
+                raise ValueError("scena precedente più corta del manifest")
+            self._file.write(block)
+            self.frames += len(block)
+            n -= len(block)
+
+    def silence(self, n: int) -> None:
+        while n > 0:
+            block = self._zeros[:min(n, len(self._zeros))]
+            self.write(block)
+            n -= len(block)
+
+    def close(self) -> None:
+        if self._proc:
+            self._proc.stdin.close()
+            if self._proc.wait() != 0:
+                raise RuntimeError(f"encode mp3 fallito (ffmpeg exit {self._proc.returncode})")
+        else:
+            self._file.close()
+
+    def abort(self) -> None:
+        if self._proc:
+            self._proc.kill()
+            self._proc.wait()
+        else:
+            self._file.close()
+
+
+_MANIFEST_VERSION = 1
+
+
+def _manifest_path(wav_path: str):
+    from pathlib import Path
+    return appconfig.CACHE_DIR / "scenes" / (Path(wav_path).name + ".json")
+
+
+def _load_manifest(wav_path: str, sr: int, channels: int) -> dict | None:
+    """Manifest del render precedente, solo se il WAV è ancora quello descritto."""
+    import json
+    try:
+        m = json.loads(_manifest_path(wav_path).read_text(encoding="utf-8"))
+        st = os.stat(wav_path)
+    except (OSError, ValueError):
+        return None
+    if (m.get("v") != _MANIFEST_VERSION or m.get("sr") != sr
+            or m.get("channels") != channels
+            or (m.get("size"), m.get("mtime_ns")) != (st.st_size, st.st_mtime_ns)):
+        return None
+    return m
+
+
+def _save_manifest(wav_path: str, sr: int, channels: int, clips: list[dict],
+                   reused: int) -> None:
+    import json
+    st = os.stat(wav_path)
+    path = _manifest_path(wav_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps({
+        "v": _MANIFEST_VERSION, "sr": sr, "channels": channels,
+        "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+        "frames": sum(c["frames"] + c["pause"] for c in clips),
+        "reused": reused, "clips": clips}), encoding="utf-8")
+    tmp.replace(path)
+
+
+_scene_locks: dict[str, threading.Lock] = {}
+_scene_locks_guard = threading.Lock()
+
+
+def _scene_lock(out_name) -> threading.Lock:
+    """Lock per scena (file di uscita): la corsia cpu ha più worker e due stitch
+    della stessa scena scriverebbero gli stessi file (.tmp, WAV, manifest)."""
+    key = str(appconfig.OUTPUT_DIR / _safe_name(out_name))
+    with _scene_locks_guard:
+        return _scene_locks.setdefault(key, threading.Lock())
 
 
 def stitch_scene(clip_wavs, pauses, out_name, fmt="wav"):
     """Concatena i clip wav in una traccia unica, con silenzio (pauses[i] sec)
-    dopo ogni clip. Ritorna il path della scena (wav o mp3)."""
-    import numpy as np
-    parts, sr = [], None
-    for i, p in enumerate(clip_wavs):
-        audio, sr = sf.read(p)
-        parts.append(audio)
-        pause = pauses[i] if i < len(pauses) else 0.0
-        if pause > 0:
-            silence_shape = (int(pause * sr),) + audio.shape[1:]
-            parts.append(np.zeros(silence_shape, dtype=audio.dtype))
-    scene = np.concatenate(parts) if parts else np.zeros(0)
-    wav_path = str(appconfig.OUTPUT_DIR / f"{_safe_name(out_name)}.wav")
-    sf.write(wav_path, scene, sr or 24000)
-    return _to_mp3(wav_path) if fmt == "mp3" else wav_path
-# ponytail: assume sr uniforme (24kHz dal modello) e lettura clip da disco;
-# passare a stitch in-memory solo se i tempi lo richiedono (TTS domina comunque).
+    dopo ogni clip. Ritorna il path della scena (wav o mp3).
+
+    Scrittura in streaming: il file di uscita è aperto una volta e riceve clip e
+    silenzi in sequenza, quindi il picco di memoria è il clip più lungo, non la
+    scena. I clip arrivano dalla cache dei decodificati (si rilegge solo ciò che
+    è cambiato su disco). Per mp3/ogg l'encode avviene durante la scrittura
+    (in-process, o in pipe a ffmpeg) invece che da un WAV intermedio.
+
+    Scene WAV: accanto al render si salva un manifest (ordine, hash del
+    contenuto, frame e pause di ogni clip). Al render successivo della stessa
+    scena il prefisso e il suffisso di battute invariate si copiano dal WAV
+    precedente così come sono; si riscrivono solo le battute cambiate in mezzo.
+    Il risultato è identico byte per byte a un render completo.
+
+    Due stitch della stessa scena (stesso out_name) si serializzano."""
+    with _scene_lock(out_name):
+        return _stitch_scene(clip_wavs, pauses, out_name, fmt)
+
+
+def _stitch_scene(clip_wavs, pauses, out_name, fmt):
+    from pathlib import Path
+    base = appconfig.OUTPUT_DIR / _safe_name(out_name)
+    if clip_wavs:
+        info = sf.info(clip_wavs[0])
+        sr, channels = info.samplerate, info.channels
+    else:
+        sr, channels = 24000, 1
+    gaps = [max(0, int((pauses[i] if i < len(pauses) else 0.0) * sr))
+            for i in range(len(clip_wavs))]
+
+    wav_path = f"{base}.wav"
+    entries, old, head, tail = None, None, 0, 0
+    if fmt == "wav":
+        with tracing.span("stitch_hash"):
+            entries = [{"name": Path(p).name, "hash": render_cache.file_digest(Path(p)),
+                        "pause": gap, "frames": None} for p, gap in zip(clip_wavs, gaps)]
+            old = _load_manifest(wav_path, sr, channels)
+    if old:
+        prev = old["clips"]
+        same = lambda a, b: (a["hash"], a["pause"]) == (b["hash"], b["pause"])  # noqa: E731
+        limit = min(len(entries), len(prev))
+        while head < limit and same(entries[head], prev[head]):
+            head += 1
+        while tail < limit - head and same(entries[-1 - tail], prev[-1 - tail]):
+            tail += 1
+        for j in range(head):
+            entries[j]["frames"] = prev[j]["frames"]
+        for j in range(1, tail + 1):
+            entries[-j]["frames"] = prev[-j]["frames"]
+        if head + tail == len(entries) == len(prev):  # niente da rifare
+            outputs_index.default_index.record(wav_path, duration=old["frames"] / sr)
+            return wav_path
+        if not (head or tail):
+            old = None
+
+    # formato compresso: encode in streaming (in-process, o pipe a ffmpeg);
+    # altrimenti WAV completo e conversione alla fine
+    cmd, stream_fmt = None, "wav"
+    if fmt != "wav" and appconfig.SCENE_STREAM_ENCODE:
+        if encoders.native(fmt):
+            stream_fmt = fmt
+        else:
+            cmd = encoders.ffmpeg_cmd(sr, channels, f"{base}{encoders.extension(fmt)}", fmt)
+    out_path = f"{base}{encoders.extension(fmt)}" if (cmd or stream_fmt != "wav") else wav_path
+    # render incrementale su file temporaneo: il WAV precedente serve da sorgente
+    writer = _SceneWriter(wav_path + ".tmp" if old else out_path, sr, channels, cmd,
+                          fmt=stream_fmt)
+    try:
+        src = sf.SoundFile(wav_path) if old else None
+        try:
+            if head:
+                with tracing.span("stitch_copy"):
+                    writer.copy(src, 0, sum(c["frames"] + c["pause"] for c in entries[:head]))
+            for i in range(head, len(clip_wavs) - tail):
+                with tracing.span("stitch_read"):
+                    audio, clip_sr = clip_cache.read(clip_wavs[i])
+                if clip_sr != sr:
+                    raise ValueError(
+                        f"sample rate diverso nei clip: {clip_wavs[i]} ({clip_sr} ≠ {sr})")
+                with tracing.span("stitch_write"):
+                    writer.write(audio)
+                    writer.silence(gaps[i])
+                if entries:
+                    entries[i]["frames"] = len(audio)
+            if tail:
+                n = sum(c["frames"] + c["pause"] for c in old["clips"][-tail:])
+                with tracing.span("stitch_copy"):
+                    writer.copy(src, old["frames"] - n, n)
+        finally:
+            if src is not None:
+                src.close()
+    except BaseException:
+        writer.abort()
+        if old:
+            os.remove(writer.path)
+        raise
+    with tracing.span("stitch_close"):  # flush dell'encoder in streaming
+        writer.close()
+    if old:
+        os.replace(writer.path, wav_path)
+    if entries is not None:
+        _save_manifest(wav_path, sr, channels, entries,
+                       reused=sum(c["frames"] + c["pause"] for c in entries[:head])
+                       + sum(c["frames"] + c["pause"] for c in entries[len(entries) - tail:]))
+    path = out_path
+    if fmt != "wav" and path == wav_path:
+        with tracing.span("encode_pydub"):
+            path = encoders.transcode(path, fmt)
+    outputs_index.default_index.record(path, duration=writer.frames / sr)
+    return path
@@ -0,0 +1,167 @@
+"""Cache dei render: stessa battuta con stessi parametri → stesso file, senza modello.
+
+Chiave = hash di testo (già preprocessato), config della voce, contenuto dei
+campioni referenziati, emozione, velocità, pitch, gain, modello e formato. Solo
+le generazioni deterministiche (temperature None) sono cachabili. I file stanno
+in CACHE_DIR/renders (copie, non link: OUTPUT viene sovrascritto in place) con
+eviction LRU per dimensione totale; un hit copia il file nel path di OUTPUT.
+Un hit aggiorna l'ordine LRU solo in memoria: index.json si riscrive a ogni put
+e, per i soli hit, al più ogni _FLUSH_S secondi (o con flush()).
+"""
+import atexit
+import hashlib
+import json
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from app import config as appconfig
+
+_KEY_VERSION = 3  # bump se cambia la pipeline (DSP/trim/encode) → invalida i render vecchi
+# 2: trim prima del DSP, pitch+tempo in un solo passo (resample soxr)
+# 3: encoder mp3/ogg/opus in-process (libsndfile, mp3 CBR 160 kbps)
+
+
+_FLUSH_S = 30.0  # hit senza put: ordine LRU su disco al più ogni N secondi
+_DIGEST_MEMO = 1024  # digest memoizzati (LRU): campioni voce + clip delle scene
+
+_digests: OrderedDict[tuple, str] = OrderedDict()
+_digests_lock = threading.Lock()
+
+
+def file_digest(path: Path) -> str:
+    """sha256 del contenuto, memoizzato su (path, mtime, size)."""
+    st = path.stat()
+    k = (str(path), st.st_mtime_ns, st.st_size)
+    with _digests_lock:
+        if k in _digests:
+            _digests.move_to_end(k)
+            return _digests[k]
+    h = hashlib.sha256()  # fuori dal lock: file grandi non bloccano gli altri
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 18), b""):
+            h.update(block)
+    with _digests_lock:
+        _digests[k] = h.hexdigest()
+        while len(_digests) > _DIGEST_MEMO:
+            _digests.popitem(last=False)
+    return h.hexdigest()
+
+
+def render_key(plan: dict, voice_cfg: dict, model_id: str, fmt: str) -> str | None:
+    """Chiave del render, o None se non è cachabile (sampling non deterministico)."""
+    if plan.get("temperature") is not None:
+        return None
+    samples = {}
+    if plan.get("ref_audio"):
+        p = Path(plan["ref_audio"])
+        samples[str(p)] = file_digest(p) if p.exists() else None
+    payload = {
+        "v": _KEY_VERSION, "model": model_id, "fmt": fmt, "config": voice_cfg,
+        "samples": samples,
+        **{k: plan.get(k) for k in ("text", "type", "language", "voice_description",
+                                    "ref_text", "emotion", "dsp_emotion", "speed",
+                                    "pitch", "gain")},
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    def __init__(self, max_bytes: int | None = None):
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._root: Path | None = None
+        self._index: OrderedDict[str, dict] = OrderedDict()  # LRU: più vecchio in testa
+        self._dirty = False  # hit non ancora scritti in index.json
+        self._saved = time.monotonic()
+        self.hits = self.misses = self.evictions = 0
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes if self._max_bytes is not None \
+            else appconfig.RENDER_CACHE_MAX_BYTES
+
+    def _load(self) -> Path:
+        """Root corrente (CACHE_DIR può cambiare, es. nei test) + indice su disco."""
+        root = appconfig.CACHE_DIR / "renders"
+        if root != self._root:
+            if self._dirty and self._root is not None:
+                self._save(self._root)
+            self._root, self._index = root, OrderedDict()
+            try:
+                entries = json.loads((root / "index.json").read_text(encoding="utf-8"))
+            except (OSError, json.JSONDecodeError):
+                entries = {}
+            for key, e in sorted(entries.items(), key=lambda kv: kv[1].get("used", 0)):
+                if (root / e["file"]).exists():
+                    self._index[key] = e
+        return root
+
+    def _save(self, root: Path) -> None:
+        root.mkdir(parents=True, exist_ok=True)
+        tmp = root / "index.json.tmp"
+        tmp.write_text(json.dumps(self._index), encoding="utf-8")
+        tmp.replace(root / "index.json")
+        self._dirty, self._saved = False, time.monotonic()
+
+    def flush(self) -> None:
+        """Scrive l'ordine LRU dei hit non ancora salvati (es. allo shutdown)."""
+        with self._lock:
+            if self._dirty and self._root is not None:
+                self._save(self._root)
+
+    def get(self, key: str | None, dest: Path) -> str | None:
+        """Se key è in cache copia il render in dest e ne ritorna il path."""
+        if key is None:
+            return None
+        with self._lock:
+            root = self._load()
+            e = self._index.get(key)
+            if e is None or not (root / e["file"]).exists():
+                self._index.pop(key, None)
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+            e["used"] = time.time()
+            self.hits += 1
+            self._dirty = True
+            if time.monotonic() - self._saved > _FLUSH_S:
+                self._save(root)
+            src = root / e["file"]
+        dest = dest.with_suffix(src.suffix)
+        shutil.copyfile(src, dest)
+        return str(dest)
+
+    def put(self, key: str | None, path: str) -> None:
+        if key is None:
+            return
+        src = Path(path)
+        with self._lock:
+            root = self._load()
+            root.mkdir(parents=True, exist_ok=True)
+            name = f"{key}{src.suffix}"
+            shutil.copyfile(src, root / name)
+            self._index[key] = {"file": name, "size": src.stat().st_size, "used": time.time()}
+            self._index.move_to_end(key)
+            total = sum(e["size"] for e in self._index.values())
+            while total > self.max_bytes and len(self._index) > 1:
+                _, old = self._index.popitem(last=False)
+                (root / old["file"]).unlink(missing_ok=True)
+                total -= old["size"]
+                self.evictions += 1
+            self._save(root)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._load()
+            return {"hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "entries": len(self._index),
+                    "bytes": sum(e["size"] for e in self._index.values()),
+                    "max_bytes": self.max_bytes}
+
+
+default_cache = RenderCache()
+atexit.register(default_cache.flush)
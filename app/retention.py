@@ -0,0 +1,94 @@
+"""Retention di OUTPUT: budget disco, età massima e file pinnati.
+
+Un sweep toglie prima i file non pinnati con ultimo accesso più vecchio di
+OUTPUT_MAX_AGE_DAYS, poi, se OUTPUT supera OUTPUT_MAX_MB, i meno usati di
+recente finché rientra nel budget. L'ultimo accesso viene dall'indice di OUTPUT
+(scrittura o download dall'UI). I file toccati negli ultimi RETENTION_GRACE_S
+secondi non si toccano: un render appena finito non sparisce prima del download.
+Gira in background ogni RETENTION_INTERVAL_S secondi e su richiesta (admin).
+"""
+import threading
+import time
+
+from app import config as appconfig
+from app import outputs_index
+
+
+class RetentionManager:
+    def __init__(self, index: outputs_index.OutputsIndex | None = None,
+                 max_bytes: int | None = None, max_age: float | None = None):
+        self._index = index or outputs_index.default_index
+        self._max_bytes = max_bytes   # None → da config (letto a ogni sweep)
+        self._max_age = max_age       # secondi; None → da config
+        self._lock = threading.Lock()  # un solo sweep alla volta
+        self._thread: threading.Thread | None = None
+        self.removed = self.reclaimed = self.sweeps = 0
+        self.last: dict | None = None
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes if self._max_bytes is not None \
+            else appconfig.OUTPUT_MAX_MB * 2**20
+
+    @property
+    def max_age(self) -> float:
+        return self._max_age if self._max_age is not None \
+            else appconfig.OUTPUT_MAX_AGE_DAYS * 86400
+
+    def sweep(self, now: float | None = None) -> dict:
+        """Rimuove i file fuori retention; ritorna file rimossi e byte recuperati."""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._index.reconcile()  # file sparsi o cancellati a mano contano anche loro
+            candidates = self._index.least_recent(now - appconfig.RETENTION_GRACE_S)
+            used = self._index.usage()["bytes"]
+            victims = []
+            for e in candidates:
+                too_old = self.max_age and (e["accessed"] or e["mtime"]) < now - self.max_age
+                over = self.max_bytes and used > self.max_bytes
+                if not (too_old or over):
+                    continue
+                victims.append(e)
+                used -= e["size"] or 0
+            removed, reclaimed = [], 0
+            for e in victims:
+                try:
+                    (appconfig.OUTPUT_DIR / e["name"]).unlink(missing_ok=True)
+                except OSError:
+                    continue  # file in uso/permessi: riprova al prossimo sweep
+                self._index.remove(e["name"])
+                removed.append(e["name"])
+                reclaimed += e["size"] or 0
+            self.sweeps += 1
+            self.removed += len(removed)
+            self.reclaimed += reclaimed
+            self.last = {"at": now, "removed": len(removed), "reclaimed": reclaimed,
+                         "files": removed[:50]}
+            return dict(self.last)
+
+    def stats(self) -> dict:
+        return {"max_bytes": self.max_bytes, "max_age": self.max_age,
+                "grace": appconfig.RETENTION_GRACE_S,
+                "interval": appconfig.RETENTION_INTERVAL_S,
+                "usage": self._index.usage(), "sweeps": self.sweeps,
+                "removed": self.removed, "reclaimed": self.reclaimed,
+                "last": self.last, "running": bool(self._thread)}
+
+    def start(self) -> None:
+        """Sweep periodico in background (no-op se nessun limite è configurato)."""
+        if self._thread or not (self.max_bytes or self.max_age):
+            return
+
+        def loop():
+            while True:
+                time.sleep(appconfig.RETENTION_INTERVAL_S)
+                try:
+                    self.sweep()
+                except Exception as e:  # noqa: BLE001 — il thread non deve morire
+                    self.last = {"at": time.time(), "error": str(e)}
+
+        self._thread = threading.Thread(target=loop, daemon=True, name="gassmann-retention")
+        self._thread.start()
+
+
+default_manager = RetentionManager()
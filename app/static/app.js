@@ -200,7 +200,7 @@ function updateGenPreview() {
 }
 $("#g-voice").onchange = updateGenPreview;
 
-// --- Polling job ---
+// --- Attesa job: eventi SSE push, polling come fallback ---
 async function pollJob(jid, shouldStop) {
   while (true) {
     const job = await (await fetch(`/api/jobs/${jid}`)).json();
@@ -210,6 +210,22 @@ async function pollJob(jid, shouldStop) {
   }
 }
 
+function watchJob(jid, shouldStop) {
+  if (!window.EventSource) return pollJob(jid, shouldStop);
+  return new Promise((resolve) => {
+    const es = new EventSource(`/api/jobs/${jid}/events`);
+    // lo stop è un flag locale: controllarlo non costa richieste HTTP
+    const timer = shouldStop && setInterval(() => shouldStop() && finish({ status: "aborted" }), 400);
+    function finish(job) { es.close(); clearInterval(timer); resolve(job); }
+    es.onmessage = (e) => {
+      const job = JSON.parse(e.data);
+      if (job.status === "done" || job.status === "error") finish(job);
+    };
+    // stream caduto (proxy, server vecchio…): si ricade sul polling
+    es.onerror = () => { es.close(); clearInterval(timer); resolve(pollJob(jid, shouldStop)); };
+  });
+}
+
 // --- Genera ---
 $("#g-run").onclick = async () => {
   const text = $("#g-text").value.trim();
@@ -217,6 +233,18 @@ $("#g-run").onclick = async () => {
   setStatus("#g-status", "Invio…", "");
   $("#g-player").classList.add("hidden");
   $("#g-download").classList.add("hidden");
+  if ($("#g-stream").checked) {
+    // streaming: l'audio parte alla prima frase pronta; nessun file in OUTPUT
+    const v = parseVoice($("#g-voice").value);
+    const q = new URLSearchParams({ text, voice_id: v.voice_id, biochem: $("#g-biochem").checked,
+                                    speed: $("#g-speed").value });
+    if (v.emotion) q.set("emotion", v.emotion);
+    $("#g-player").src = "/api/stream?" + q;
+    $("#g-player").classList.remove("hidden");
+    $("#g-player").play();
+    setStatus("#g-status", "In streaming…", "ok");
+    return;
+  }
   const r = await fetch("/api/generate", {
     method: "POST", headers: { "Content-Type": "application/json" },
     body: JSON.stringify({
@@ -227,7 +255,7 @@ $("#g-run").onclick = async () => {
   if (!r.ok) { setStatus("#g-status", "Errore: " + (await r.text()), "err"); return; }
   const { job_id } = await r.json();
   setStatus("#g-status", "Generazione in corso…", "");
-  const job = await pollJob(job_id);
+  const job = await watchJob(job_id);
   if (job.status === "error") { setStatus("#g-status", "Errore: " + job.error, "err"); return; }
   const file = job.result.split("/").pop();
   const url = `/api/outputs/${file}`;
@@ -236,6 +264,19 @@ $("#g-run").onclick = async () => {
   setStatus("#g-status", "Completato ✓", "ok");
 };
 
+// anteprima del testo come lo leggerà il modello (normalizzazione biochimica)
+$("#g-norm").onclick = async () => {
+  const text = $("#g-text").value.trim();
+  if (!text) { setStatus("#g-normalized", "Inserisci del testo", "err"); return; }
+  const r = await fetch("/api/preprocess", {
+    method: "POST", headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ texts: [text] }),
+  });
+  if (!r.ok) { setStatus("#g-normalized", "Errore: " + (await r.text()), "err"); return; }
+  const { texts } = await r.json();
+  setStatus("#g-normalized", texts[0], "");
+};
+
 // --- Batch ---
 function addBatchItem(name = "", text = "") {
   const div = document.createElement("div");
@@ -261,7 +302,7 @@ $("#b-run").onclick = async () => {
   });
   const { job_id } = await r.json();
   setStatus("#b-status", "Batch in corso…", "");
-  const job = await pollJob(job_id);
+  const job = await watchJob(job_id);
   if (job.status === "error") { setStatus("#b-status", "Errore: " + job.error, "err"); return; }
   $("#b-results").innerHTML = job.result.map((p) => {
     const f = p.split("/").pop();
@@ -359,7 +400,7 @@ function makeTeatro({ prefix, fillVoiceUI, readVoice }) {
     });
     if (!r.ok) { prog.classList.add("hidden"); setStatus(P("status"), "Errore: " + (await r.text()), "err"); return false; }
     const { job_id } = await r.json();
-    const job = await pollJob(job_id, shouldStop);
+    const job = await watchJob(job_id, shouldStop);
     if (job.status !== "done") {
       prog.classList.add("hidden");
       setStatus(P("status"), job.status === "aborted" ? "Interrotto ⏹" : "Errore: " + job.error,
@@ -367,10 +408,7 @@ function makeTeatro({ prefix, fillVoiceUI, readVoice }) {
       return false;
     }
     prog.classList.add("hidden");
-    const fname = job.result.split("/").pop();
-    clip.dataset.file = fname;  // nome file deterministico → ?t= forza il refetch
-    clip.src = "/api/outputs/" + fname + "?t=" + Date.now();
-    clip.classList.remove("hidden");
+    showClip(div, job.result.split("/").pop());
     setStatus(P("status"), "Battuta pronta ✓", "ok");
     return true;
   }
@@ -404,27 +442,57 @@ function makeTeatro({ prefix, fillVoiceUI, readVoice }) {
     setStatus(P("status"), `Voce "${voice.id}" salvata ✓ — ora disponibile in Teatro`, "ok");
   }
 
+  // Scena completa = UN job /api/batch: il server raggruppa le battute per voce
+  // in micro-batch sul modello, poi i clip tornano ai blocchi e si unisce.
+  // Stop annulla il job: il server si ferma al micro-batch successivo.
   async function genAll() {
     const divs = [...P("blocks").querySelectorAll(`.${prefix}-block`)].filter((d) => readBlock(d).text);
     if (!divs.length) { setStatus(P("status"), "Nessuna battuta", "err"); return; }
+    const items = divs.map((d) => {
+      const b = readBlock(d);
+      return { text: b.text, voice_id: b.voice_id, emotion: b.emotion, speed: b.speed,
+               instruct: b.instruct || null, temperature: b.temperature,
+               pitch: b.pitch, gain: b.gain };
+    });
+    if (items.some((it) => !it.voice_id)) { setStatus(P("status"), "Assegna una voce a ogni battuta", "err"); return; }
     stopScene = false;
     const prog = P("progress");
     P("scene").classList.add("hidden"); P("download").classList.add("hidden");
     prog.classList.remove("hidden");
     P("stop").classList.remove("hidden"); P("genall").disabled = true;
+    divs.forEach((d) => { cls(d, "clip").classList.add("hidden"); cls(d, "prog").classList.remove("hidden"); });
     try {
-      for (let i = 0; i < divs.length; i++) {
-        if (stopScene) { setStatus(P("status"), "Interrotto ⏹", ""); return; }
-        setStatus(P("status"), `Genero battuta ${i + 1}/${divs.length}…`, "");
-        if (!await regenBlock(divs[i], () => stopScene)) return;
+      setStatus(P("status"), `Genero ${divs.length} battute…`, "");
+      const r = await fetch("/api/batch", {
+        method: "POST", headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ items, format: "wav" }),
+      });
+      if (!r.ok) { setStatus(P("status"), "Errore: " + (await r.text()), "err"); return; }
+      const { job_id } = await r.json();
+      const job = await watchJob(job_id, () => stopScene);
+      // Stop: annulla anche sul server, così il modello si libera per i "↻ Rigenera"
+      if (job.status === "aborted") await fetch(`/api/jobs/${job_id}/cancel`, { method: "POST" });
+      if (job.status !== "done") {
+        setStatus(P("status"), job.status === "aborted" ? "Interrotto ⏹" : "Errore: " + job.error,
+          job.status === "aborted" ? "" : "err");
+        return;
       }
+      job.result.forEach((path, i) => showClip(divs[i], path.split("/").pop()));
       await stitchScene();
     } finally {
+      divs.forEach((d) => cls(d, "prog").classList.add("hidden"));
       prog.classList.add("hidden");
       P("stop").classList.add("hidden"); P("genall").disabled = false;
     }
   }
 
+  function showClip(div, fname) {
+    const clip = cls(div, "clip");
+    clip.dataset.file = fname;  // nome file deterministico → ?t= forza il refetch
+    clip.src = "/api/outputs/" + fname + "?t=" + Date.now();
+    clip.classList.remove("hidden");
+  }
+
   async function stitchScene() {
     const blocks = [...P("blocks").querySelectorAll(`.${prefix}-block`)].map(readBlock).filter((b) => b.text);
     if (!blocks.length) { setStatus(P("status"), "Nessuna battuta", "err"); return; }
@@ -441,7 +509,7 @@ function makeTeatro({ prefix, fillVoiceUI, readVoice }) {
     });
     if (!r.ok) { prog.classList.add("hidden"); setStatus(P("status"), "Errore: " + (await r.text()), "err"); return; }
     const { job_id } = await r.json();
-    const job = await pollJob(job_id);
+    const job = await watchJob(job_id);
     if (job.status === "error") { prog.classList.add("hidden"); setStatus(P("status"), "Errore: " + job.error, "err"); return; }
     prog.classList.add("hidden");
     const name = job.result.scene.split("/").pop();
@@ -452,8 +520,7 @@ function makeTeatro({ prefix, fillVoiceUI, readVoice }) {
     P("download").classList.remove("hidden");
     const divs = [...P("blocks").querySelectorAll(`.${prefix}-block`)].filter((d) => readBlock(d).text);
     job.result.clips.forEach((c, i) => {
-      const clip = divs[i] && cls(divs[i], "clip");
-      if (clip) { const fn = c.path.split("/").pop(); clip.dataset.file = fn; clip.src = "/api/outputs/" + fn + "?t=" + Date.now(); clip.classList.remove("hidden"); }
+      if (divs[i]) showClip(divs[i], c.path.split("/").pop());
     });
     setStatus(P("status"), "Scena pronta ✓", "ok");
   }
@@ -0,0 +1,206 @@
+"""Tracing leggero: span cronometrati per fase e istogrammi Prometheus (/api/metrics).
+
+Ogni span (`with span("dsp"):` o `@traced("plan")`) finisce nell'istogramma
+gassmann_phase_seconds{phase=...} e, se gira dentro un job di JobQueue, anche
+nel trace del job (fase → conteggio e secondi), visibile in /api/jobs/{id}. Il
+trace corrente sta in una ContextVar: i thread del pool CPU lo ricevono con
+bind(). Gli span si possono annidare (es. "inference" contiene "ref_encode").
+Costo: due perf_counter, un lock e una bisect per span.
+"""
+import bisect
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+_PHASE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                  10.0, 30.0, 60.0, 120.0, 300.0)
+_RTF_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0)
+
+
+def _labels(names, values, extra="") -> str:
+    parts = ['%s="%s"' % (n, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+             for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames=(), buckets=_PHASE_BUCKETS):
+        self.name, self.help = name, help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series: dict[tuple, list] = {}  # labels -> [conteggi per bucket, somma, n]
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            if i < len(self.buckets):
+                s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((k, [list(v[0]), v[1], v[2]]) for k, v in self._series.items())
+        for key, (counts, total, n) in series:
+            acc = 0
+            for le, c in zip(self.buckets, counts):
+                acc += c
+                lab = _labels(self.labelnames, key, 'le="%g"' % le)
+                lines.append(f"{self.name}_bucket{lab} {acc}")
+            lab = _labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{lab} {n}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {n}")
+        return lines
+
+    def count(self, **labels) -> int:
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            s = self._series.get(key)
+            return s[2] if s else 0
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name, self.help = name, help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines += [f"{self.name}{_labels(self.labelnames, k)} {v:g}" for k, v in values]
+        return lines
+
+
+PHASES = Histogram("gassmann_phase_seconds",
+                   "Durata delle fasi di generazione/scena (s)", ("phase",))
+JOBS = Histogram("gassmann_job_seconds", "Durata dei job in esecuzione (s)",
+                 ("lane", "status"))
+RTF = Histogram("gassmann_realtime_factor",
+                "Secondi di audio prodotti per secondo di job", ("voice_type",),
+                buckets=_RTF_BUCKETS)
+MODEL_LOADS = Counter("gassmann_model_loads_total", "Caricamenti dei modelli", ("model",))
+MODEL_EVICTIONS = Counter("gassmann_model_evictions_total",
+                          "Modelli scaricati dalla memoria", ("model", "reason"))
+HISTOGRAMS = (PHASES, JOBS, RTF)
+COUNTERS = (MODEL_LOADS, MODEL_EVICTIONS)
+
+
+class Trace:
+    """Fasi di un job: nome → [conteggio, secondi] e audio prodotto per tipo di voce."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans: dict[str, list] = {}
+        self.audio: dict[str, float] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            s = self.spans.setdefault(name, [0, 0.0])
+            s[0] += 1
+            s[1] += seconds
+
+    def add_audio(self, voice_type: str, seconds: float) -> None:
+        with self._lock:
+            self.audio[voice_type] = self.audio.get(voice_type, 0.0) + seconds
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {"spans": {k: {"count": c, "seconds": round(t, 4)}
+                              for k, (c, t) in self.spans.items()},
+                    "audio_seconds": {k: round(v, 3) for k, v in self.audio.items()}}
+
+
+_current: contextvars.ContextVar[Trace | None] = contextvars.ContextVar(
+    "gassmann_trace", default=None)
+
+
+@contextmanager
+def trace():
+    """Trace nuovo come corrente per la durata del blocco (un job)."""
+    tr = Trace()
+    token = _current.set(tr)
+    try:
+        yield tr
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        PHASES.observe(dt, phase=name)
+        tr = _current.get()
+        if tr is not None:
+            tr.add(name, dt)
+
+
+def traced(name: str):
+    """Decoratore: tutta la funzione è uno span."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def bind(fn):
+    """fn che gira nel contesto corrente (trace incluso), per submit a un pool.
+    Un bind per submit: lo stesso contesto non può girare su due thread insieme."""
+    ctx = contextvars.copy_context()
+    return functools.partial(ctx.run, fn)
+
+
+def record_audio(voice_type: str, seconds: float) -> None:
+    """Audio prodotto dal job corrente (base del real-time factor)."""
+    tr = _current.get()
+    if tr is not None:
+        tr.add_audio(voice_type, seconds)
+
+
+def finish_job(tr: Trace, lane: str, status: str, seconds: float) -> dict:
+    """Chiude il trace di un job: istogrammi di durata e RTF, ritorna il riassunto."""
+    JOBS.observe(seconds, lane=lane, status=status)
+    summary = tr.summary()
+    if status == "done" and seconds > 0:
+        for voice_type, audio in summary["audio_seconds"].items():
+            RTF.observe(audio / seconds, voice_type=voice_type)
+    summary["seconds"] = round(seconds, 4)
+    return summary
+
+
+def render(extra: list[str] = ()) -> str:
+    """Testo Prometheus (exposition format 0.0.4) di istogrammi e contatori."""
+    lines = []
+    for m in HISTOGRAMS + COUNTERS:
+        lines += m.render()
+    return "\n".join(lines + list(extra)) + "\n"
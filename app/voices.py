@@ -1,9 +1,11 @@
 """CRUD sulle voci, basato sui file JSON in config/."""
 import base64
 import binascii
+import copy
 import io
 import json
 import re
+import threading
 from pathlib import Path
 
 from app import config as appconfig
@@ -30,12 +32,7 @@ def _derive_tags(name: str, data: dict) -> list[str]:
     return tags
 
 
-def _voice_info(path: Path) -> dict | None:
-    try:
-        data = json.loads(path.read_text(encoding="utf-8"))
-    except (json.JSONDecodeError, OSError):
-        return None
-    name = path.stem
+def _info_from(name: str, data: dict) -> dict:
     is_clone = data.get("mode") == "voice_clone" or "prompt_speech_path" in data
     return {
         "id": name,
@@ -55,13 +52,139 @@ def _voice_info(path: Path) -> dict | None:
     }
 
 
+def _sig(st) -> tuple:
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class VoiceRegistry:
+    """Indice in memoria dei config in CONFIG_DIR: ogni JSON è letto una volta e
+    riletto solo se cambia (mtime/size/inode). Indici per tag, lingua e campione
+    referenziato. Le funzioni CRUD qui sotto lo aggiornano in place dopo ogni
+    scrittura; le modifiche esterne (editor, git pull) le rileva lo stat."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._dir: Path | None = None
+        self._dir_sig = None
+        self._entries: dict[str, dict] = {}  # id -> {"sig", "cfg", "info"}; cfg None = JSON rotto
+        self.by_tag: dict[str, set[str]] = {}
+        self.by_language: dict[str, set[str]] = {}
+        self.by_sample: dict[str, set[str]] = {}
+
+    def _index(self, voice_id, entry, add):
+        info, cfg = entry["info"], entry["cfg"]
+        if info is None:
+            return
+        keys = [(self.by_tag, t) for t in info["tags"]] + [(self.by_language, info["language"])]
+        keys += [(self.by_sample, rel) for rel in _sample_rels(cfg)]
+        for idx, k in keys:
+            if add:
+                idx.setdefault(k, set()).add(voice_id)
+            else:
+                idx.get(k, set()).discard(voice_id)
+
+    def _load(self, voice_id, path, sig):
+        old = self._entries.pop(voice_id, None)
+        if old:
+            self._index(voice_id, old, add=False)
+        try:
+            cfg = json.loads(path.read_text(encoding="utf-8"))
+            info = _info_from(voice_id, cfg)
+        except (json.JSONDecodeError, OSError):
+            cfg = info = None
+        entry = self._entries[voice_id] = {"sig": sig, "cfg": cfg, "info": info}
+        self._index(voice_id, entry, add=True)
+        return entry
+
+    def drop(self, voice_id) -> None:
+        with self._lock:
+            old = self._entries.pop(voice_id, None)
+            if old:
+                self._index(voice_id, old, add=False)
+
+    def _root(self) -> Path:
+        """CONFIG_DIR può cambiare (test): in quel caso si riparte da zero."""
+        root = appconfig.CONFIG_DIR
+        if root != self._dir:
+            self._dir, self._dir_sig = root, None
+            self._entries.clear()
+            self.by_tag.clear()
+            self.by_language.clear()
+            self.by_sample.clear()
+        return root
+
+    def _entry(self, voice_id) -> dict | None:
+        """Entry aggiornata per un id (uno stat, parse solo se il file è cambiato)."""
+        path = self._root() / f"{voice_id}.json"
+        try:
+            sig = _sig(path.stat())
+        except OSError:
+            self.drop(voice_id)
+            return None
+        entry = self._entries.get(voice_id)
+        return entry if entry and entry["sig"] == sig else self._load(voice_id, path, sig)
+
+    def sync(self) -> None:
+        """Allinea l'indice a tutta la directory (file aggiunti/rimossi/modificati)."""
+        with self._lock:
+            root = self._root()
+            try:
+                dir_sig = _sig(root.stat())
+            except OSError:
+                return
+            if dir_sig != self._dir_sig:
+                ids = {p.stem for p in root.glob("*.json")}
+                for gone in set(self._entries) - ids:
+                    self.drop(gone)
+                for voice_id in ids:
+                    self._entry(voice_id)
+                self._dir_sig = dir_sig
+            else:
+                for voice_id in list(self._entries):
+                    self._entry(voice_id)
+
+    def info(self, voice_id) -> dict | None:
+        with self._lock:
+            entry = self._entry(voice_id)
+            return copy.deepcopy(entry["info"]) if entry and entry["info"] else None
+
+    def config(self, voice_id) -> dict | None:
+        """Copia del config (il chiamante può modificarla), None se manca/rotto."""
+        with self._lock:
+            entry = self._entry(voice_id)
+            return copy.deepcopy(entry["cfg"]) if entry and entry["cfg"] is not None else None
+
+    def all(self) -> list[dict]:
+        with self._lock:
+            self.sync()
+            return [copy.deepcopy(self._entries[v]["info"]) for v in sorted(self._entries)
+                    if self._entries[v]["info"]]
+
+    def ids(self, tag=None, language=None, sample=None) -> set[str]:
+        """Id delle voci che hanno quel tag / lingua / campione referenziato."""
+        with self._lock:
+            self.sync()
+            sets = [idx.get(k, set()) for idx, k in ((self.by_tag, tag),
+                    (self.by_language, language), (self.by_sample, sample)) if k is not None]
+            return set.intersection(*sets) if sets else set(self._entries)
+
+    def put(self, voice_id, cfg) -> None:
+        """Scrive il config su disco e aggiorna l'indice (niente rilettura)."""
+        with self._lock:
+            path = self._root() / f"{voice_id}.json"
+            path.write_text(json.dumps(cfg, ensure_ascii=False, indent=2), encoding="utf-8")
+            self.drop(voice_id)
+            entry = self._entries[voice_id] = {
+                "sig": _sig(path.stat()), "cfg": copy.deepcopy(cfg),
+                "info": _info_from(voice_id, cfg)}
+            self._index(voice_id, entry, add=True)
+
+
+registry = VoiceRegistry()
+
+
 def list_voices() -> list[dict]:
-    out = []
-    for path in sorted(appconfig.CONFIG_DIR.glob("*.json")):
-        info = _voice_info(path)
-        if info:
-            out.append(info)
-    return out
+    return registry.all()
 
 
 def _safe_voice_id(voice_id: str) -> bool:
@@ -72,15 +195,17 @@ def _safe_voice_id(voice_id: str) -> bool:
 def get_voice(voice_id: str) -> dict | None:
     if not _safe_voice_id(voice_id):
         return None
-    path = appconfig.CONFIG_DIR / f"{voice_id}.json"
-    return _voice_info(path) if path.exists() else None
+    return registry.info(voice_id)
 
 
 def load_config(voice_id: str) -> dict:
     if not _safe_voice_id(voice_id):
         raise ValueError(f"voice_id non valido: {voice_id}")
-    path = appconfig.CONFIG_DIR / f"{voice_id}.json"
-    return json.loads(path.read_text(encoding="utf-8"))
+    cfg = registry.config(voice_id)
+    if cfg is None:  # mancante o JSON rotto: lascia sollevare l'errore originale
+        path = appconfig.CONFIG_DIR / f"{voice_id}.json"
+        return json.loads(path.read_text(encoding="utf-8"))
+    return cfg
 
 
 def get_sample_path(voice_id: str) -> Path | None:
@@ -133,8 +258,7 @@ def add_emotion_sample(voice_id, emotion, audio_bytes, ref_text):
     cfg = load_config(voice_id)
     cfg.setdefault("emotion_samples", {})[emotion] = stored
     cfg.setdefault("emotion_ref_texts", {})[emotion] = ref_text.strip()
-    (appconfig.CONFIG_DIR / f"{voice_id}.json").write_text(
-        json.dumps(cfg, ensure_ascii=False, indent=2), encoding="utf-8")
+    registry.put(voice_id, cfg)
     return {"voice_id": voice_id, "emotion": emotion,
             "emotions": sorted(cfg["emotion_samples"])}
 
@@ -152,8 +276,7 @@ def replace_sample(voice_id: str, audio_bytes: bytes) -> dict:
         cfg["prompt_speech_path"] = str(sample_path.relative_to(appconfig.PROJECT_ROOT))
     except ValueError:
         cfg["prompt_speech_path"] = str(sample_path)
-    (appconfig.CONFIG_DIR / f"{voice_id}.json").write_text(
-        json.dumps(cfg, ensure_ascii=False, indent=2), encoding="utf-8")
+    registry.put(voice_id, cfg)
     return get_voice(voice_id)
 
 
@@ -208,9 +331,7 @@ def create_clone(name, language, audio_bytes, ref_text, instruct="", tags=None):
     }
     if instruct:
         cfg["instruct"] = instruct
-    (appconfig.CONFIG_DIR / f"{slug}.json").write_text(
-        json.dumps(cfg, ensure_ascii=False, indent=2), encoding="utf-8"
-    )
+    registry.put(slug, cfg)
     return get_voice(slug)
 
 
@@ -220,10 +341,9 @@ def get_voice_edit(voice_id: str) -> dict | None:
     """Campi editabili (per pre-popolare l'editor della UI)."""
     if not _safe_voice_id(voice_id):
         return None
-    path = appconfig.CONFIG_DIR / f"{voice_id}.json"
-    if not path.exists():
+    cfg = registry.config(voice_id)
+    if cfg is None:
         return None
-    cfg = json.loads(path.read_text(encoding="utf-8"))
     is_clone = cfg.get("mode") == "voice_clone" or "prompt_speech_path" in cfg
     return {
         "id": voice_id,
@@ -245,7 +365,7 @@ def update_voice(voice_id, *, new_id=None, language=None, tags=None,
     path = appconfig.CONFIG_DIR / f"{voice_id}.json"
     if not path.exists():
         raise ValueError("voce non trovata")
-    cfg = json.loads(path.read_text(encoding="utf-8"))
+    cfg = load_config(voice_id)
     is_clone = cfg.get("mode") == "voice_clone" or "prompt_speech_path" in cfg
 
     if language is not None:
@@ -273,10 +393,11 @@ def update_voice(voice_id, *, new_id=None, language=None, tags=None,
             raise ValueError("esiste già una voce con questo nome")
         cfg["voice_name"] = slug
         path.rename(dest)
-        dest.write_text(json.dumps(cfg, ensure_ascii=False, indent=2), encoding="utf-8")
+        registry.drop(voice_id)
+        registry.put(slug, cfg)
         return get_voice(slug)
 
-    path.write_text(json.dumps(cfg, ensure_ascii=False, indent=2), encoding="utf-8")
+    registry.put(voice_id, cfg)
     return get_voice(voice_id)
 
 
@@ -289,17 +410,13 @@ def delete_voice(voice_id: str) -> None:
     path = appconfig.CONFIG_DIR / f"{voice_id}.json"
     if not path.exists():
         raise ValueError("voce non trovata")
-    cfg = json.loads(path.read_text(encoding="utf-8"))
+    cfg = load_config(voice_id)
     path.unlink()
-    # campioni ancora usati da un'altra voce → non toccare
-    in_use = set()
-    for other in appconfig.CONFIG_DIR.glob("*.json"):
-        try:
-            in_use.update(_sample_rels(json.loads(other.read_text(encoding="utf-8"))))
-        except (json.JSONDecodeError, OSError):
-            continue  # config illeggibile: per prudenza lo trattiamo come referenziante nulla
+    registry.drop(voice_id)
     for rel in _sample_rels(cfg):
-        if rel in in_use:
+        # campioni ancora usati da un'altra voce → non toccare (config illeggibili
+        # non sono nell'indice: per prudenza non referenziano nulla)
+        if registry.ids(sample=rel):
             continue
         p = _resolve(rel)
         try:
@@ -322,7 +439,7 @@ def export_voice(voice_id: str) -> dict:
     path = appconfig.CONFIG_DIR / f"{voice_id}.json"
     if not path.exists():
         raise ValueError("voce non trovata")
-    cfg = json.loads(path.read_text(encoding="utf-8"))
+    cfg = load_config(voice_id)
     samples = {}
     for rel in _sample_rels(cfg):
         p = _resolve(rel)
@@ -372,6 +489,5 @@ def import_voice(bundle: dict) -> dict:
     if em:
         cfg["emotion_samples"] = em
 
-    (appconfig.CONFIG_DIR / f"{slug}.json").write_text(
-        json.dumps(cfg, ensure_ascii=False, indent=2), encoding="utf-8")
+    registry.put(slug, cfg)
     return get_voice(slug)
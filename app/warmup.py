@@ -0,0 +1,71 @@
+"""Warm-up allo startup e stato di readiness (/api/health/ready).
+
+Per ogni modello configurato (GASSMANN_WARMUP_MODELS) una generazione sintetica
+minima, cronometrata per fase (import, load dei pesi, prima inferenza), poi
+l'avvio dei worker DSP. Finché non è finito il server risponde ma non è
+"ready": desktop e load balancer aspettano il 200.
+"""
+import threading
+import time
+
+from app import config as appconfig
+from app import dsp_pool
+
+
+class Warmup:
+    def __init__(self, model_manager, models=None,
+                 pool: dsp_pool.DSPPool | None = dsp_pool.default_pool):
+        """models None = GASSMANN_WARMUP_MODELS; pool None = niente pool DSP.
+        Senza componenti (es. modello finto nei test) è subito ready."""
+        self._mm = model_manager
+        self.models = list(appconfig.WARMUP_MODELS if models is None else models)
+        self._pool = pool
+        self._lock = threading.Lock()
+        names = self.models + (["dsp"] if pool is not None else [])
+        self._state = {n: {"status": "pending", "phases": {}} for n in names}
+        self._started = self._finished = None
+
+    def start(self) -> threading.Thread:
+        t = threading.Thread(target=self.run, name="gassmann-warmup", daemon=True)
+        t.start()
+        return t
+
+    def _set(self, name, **kw) -> None:
+        with self._lock:
+            self._state[name].update(kw)
+
+    def run(self) -> None:
+        """Scalda modelli e pool DSP in fila. Un errore segna il componente come
+        fallito (readiness resta false) ma non ferma gli altri né l'app."""
+        self._started = time.time()
+        for kind in self.models:
+            self._set(kind, status="warming")
+            try:
+                phases = self._mm.warmup(kind)
+                self._set(kind, status="ready",
+                          phases={k: round(v, 3) for k, v in phases.items()})
+            except Exception as e:  # noqa: BLE001 — warm-up best-effort
+                self._set(kind, status="error", error=f"{type(e).__name__}: {e}")
+        if self._pool is not None:
+            self._set("dsp", status="warming")
+            try:
+                t0 = time.perf_counter()
+                self._pool.start()
+                self._set("dsp", status="ready",
+                          phases={"spawn": round(time.perf_counter() - t0, 3)})
+            except Exception as e:  # noqa: BLE001
+                self._set("dsp", status="error", error=f"{type(e).__name__}: {e}")
+        self._finished = time.time()
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return all(s["status"] == "ready" for s in self._state.values())
+
+    def report(self) -> dict:
+        with self._lock:
+            components = {k: dict(v, phases=dict(v["phases"])) for k, v in self._state.items()}
+        return {"ready": all(c["status"] == "ready" for c in components.values()),
+                "components": components, "started": self._started,
+                "finished": self._finished}
+
@@ -0,0 +1,94 @@
+"""Benchmark del post-processing audio (trim, DSP emozione/manuale, pitch+tempo,
+post-processing completo, unione segmenti) su clip sintetici di varia durata.
+Misura tempo (migliore di N ripetizioni) e picco di memoria (tracemalloc).
+
+Uso: python -m scripts.bench_dsp [--durations 5 60 600] [--repeat 3] [--out bench.json]
+     --legacy aggiunge il vecchio percorso a due passate (pitch_shift + time_stretch)
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import pipeline  # noqa: E402
+
+SR = 24000
+
+
+def _clip(seconds: float) -> np.ndarray:
+    """Voce finta: blip iniziale + gap + tono modulato con rumore."""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * SR), dtype="float32") / SR
+    y = 0.3 * np.sin(2 * np.pi * 180 * t * (1 + 0.05 * np.sin(2 * np.pi * 3 * t)))
+    y = (y + 0.01 * rng.standard_normal(len(t))).astype("float32")
+    y[int(0.04 * SR):int(0.12 * SR)] = 0.0  # blip 40 ms + gap 80 ms
+    return y
+
+
+def _legacy_pitch_tempo(y, sr, n_steps, rate):
+    import librosa
+    y = librosa.effects.pitch_shift(y, sr=sr, n_steps=n_steps)
+    return librosa.effects.time_stretch(y, rate=rate)
+
+
+_PLAN = {"speed": 1.1, "dsp_emotion": "felice", "pitch": 1.0, "gain": 2.0}
+
+CASES = {
+    "trim_onset_blip": lambda y: pipeline._trim_onset_blip(y, SR),
+    "apply_emotion_dsp": lambda y: pipeline.apply_emotion_dsp(y, SR, "felice"),
+    "apply_dsp": lambda y: pipeline.apply_dsp(y, SR, 2.0, 3.0),
+    "pitch_tempo": lambda y: pipeline.pitch_tempo(y, SR, 1.5, 1.05),
+    "postprocess": lambda y: pipeline._postprocess(y, SR, _PLAN),
+    "join_segments": lambda y: pipeline.join_segments(np.array_split(y, 8), SR),
+}
+
+
+def _measure(fn, y, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(y)
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    fn(y)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"seconds": round(best, 4), "peak_mb": round(peak / 2**20, 2),
+            "x_realtime": round(len(y) / SR / best, 1) if best else None}
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--durations", type=float, nargs="+", default=[5, 60, 600])
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--legacy", action="store_true")
+    ap.add_argument("--only", nargs="+", choices=sorted(CASES) + ["legacy_pitch_tempo"])
+    ap.add_argument("--out", type=Path)
+    args = ap.parse_args(argv)
+
+    cases = dict(CASES)
+    if args.legacy:
+        cases["legacy_pitch_tempo"] = lambda y: _legacy_pitch_tempo(y, SR, 1.5, 1.05)
+    if args.only:
+        cases = {k: v for k, v in cases.items() if k in args.only}
+    pipeline._postprocess(_clip(0.5), SR, _PLAN)  # warm-up: import librosa/numba fuori misura
+    results = {}
+    for secs in args.durations:
+        y = _clip(secs)
+        for name, fn in cases.items():
+            r = _measure(fn, y, args.repeat)
+            results.setdefault(name, {})[f"{secs:g}s"] = r
+            print(f"{name:20s} {secs:>6g}s  {r['seconds']:>8.4f}s  "
+                  f"{r['peak_mb']:>8.2f} MB  {r['x_realtime']}x rt", flush=True)
+    if args.out:
+        args.out.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Benchmark dell'encode finale: percorso legacy (WAV su disco → pydub → ffmpeg →
+rimozione del WAV) contro l'encoder in-process (libsndfile) e la pipe PCM a ffmpeg.
+Misura tempo (migliore di N ripetizioni) e dimensione del file; i backend non
+disponibili (es. ffmpeg assente) vengono saltati.
+
+Uso: python -m scripts.bench_encode [--durations 5 60 600] [--formats mp3 ogg opus]
+                                    [--repeat 3] [--out bench.json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import encoders  # noqa: E402
+
+SR = 24000
+
+
+def _clip(seconds: float) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * SR), dtype="float32") / SR
+    y = 0.3 * np.sin(2 * np.pi * 180 * t * (1 + 0.05 * np.sin(2 * np.pi * 3 * t)))
+    return (y + 0.01 * rng.standard_normal(len(t))).astype("float32")
+
+
+def _legacy(y, base, fmt):
+    wav = str(base) + ".wav"
+    sf.write(wav, y, SR)
+    return encoders.transcode(wav, fmt)
+
+
+def _available(fmt: str) -> dict:
+    paths = {}
+    if encoders.native(fmt):
+        paths["soundfile"] = lambda y, base: encoders.encode(y, SR, base, fmt, via="soundfile")
+    if encoders.ffmpeg_cmd(SR, 1, os.devnull, fmt):
+        paths["ffmpeg_pipe"] = lambda y, base: encoders.encode(y, SR, base, fmt, via="ffmpeg")
+        paths["legacy_pydub"] = lambda y, base: _legacy(y, base, fmt)
+    return paths
+
+
+def _measure(fn, y, tmp: Path, repeat):
+    best, size = float("inf"), 0
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        path = fn(y, tmp / f"bench{i}")
+        best = min(best, time.perf_counter() - t0)
+        size = os.path.getsize(path)
+        os.remove(path)
+    return {"seconds": round(best, 4), "kb": round(size / 1024, 1),
+            "x_realtime": round(len(y) / SR / best, 1) if best else None}
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--durations", type=float, nargs="+", default=[5, 60, 600])
+    ap.add_argument("--formats", nargs="+", default=["mp3", "ogg", "opus"],
+                    choices=[f for f in encoders.FORMATS if f != "wav"])
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--out", type=Path)
+    args = ap.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in args.formats:
+            paths = _available(fmt)
+            if not paths:
+                print(f"{fmt}: nessun backend disponibile", flush=True)
+                continue
+            for secs in args.durations:
+                y = _clip(secs)
+                for name, fn in paths.items():
+                    r = _measure(fn, y, Path(tmp), args.repeat)
+                    results.setdefault(fmt, {}).setdefault(name, {})[f"{secs:g}s"] = r
+                    print(f"{fmt:5s} {name:13s} {secs:>6g}s  {r['seconds']:>8.4f}s  "
+                          f"{r['kb']:>9.1f} KB  {r['x_realtime']}x rt", flush=True)
+    if args.out:
+        args.out.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
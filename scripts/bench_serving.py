@@ -0,0 +1,266 @@
+"""Benchmark end-to-end dello stack di serving (HTTP, coda, DSP, encode, stitch)
+con un modello finto: latenza e real-time factor del modello sono parametri, il
+resto è il codice vero. Avvia create_app su uvicorn in locale e lo martella con
+client concorrenti su /api/generate, /api/batch e /api/teatro usando le voci
+Teatro di config/ (campioni mancanti → tono sintetico). OUTPUT, cache e config
+stanno in una cartella temporanea: il repo non viene toccato.
+
+Riporta per workload latenza p50/p95/p99 (submit → job finito), job/s, attesa in
+coda (campo "wait" del job) ed errori, più il picco di RSS del processo e dei
+worker DSP. Il JSON (--out) serve a confrontare run diversi.
+
+Uso: python -m scripts.bench_serving [--workloads generate batch teatro]
+         [--requests 40] [--clients 4] [--latency 0.2] [--rtf 8] [--out bench.json]
+"""
+import argparse
+import json
+import random
+import resource
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import config as appconfig  # noqa: E402
+
+SR = 24000
+SECONDS_PER_CHAR = 0.065  # ~ parlato italiano a velocità normale
+
+LINES = [
+    "Sei tornato, finalmente.",
+    "Il mare oggi è più scuro del solito, non trovi?",
+    "Non posso restare qui un giorno di più: tutto mi ricorda quello che ho perduto.",
+    "Ascolta. Lo senti anche tu, il richiamo dell'acqua?",
+    "Ho aspettato tanto, e adesso che sei qui non so più cosa dirti.",
+    "Domani partirà la nave, e con lei se ne andrà l'ultima possibilità.",
+    "No!",
+    "Dimmi la verità, una volta sola, e poi non te lo chiederò mai più.",
+    "La libertà di scegliere: è questo che mi hai dato, e non lo dimenticherò.",
+    "Forse hai ragione tu. Forse è solo un'ombra, un ricordo che non vuole andarsene.",
+]
+
+
+class FakeModel:
+    """ModelManager finto: audio sintetico (tono + rumore, durata ∝ caratteri)
+    dopo `latency` + durata/`rtf` secondi. Una generate alla volta per modello,
+    come il vero; le entry point batch pagano la battuta più lunga del batch."""
+
+    def __init__(self, latency: float, rtf: float):
+        self.latency, self.rtf = latency, rtf
+        self._gen_locks = {"design": threading.Lock(), "base": threading.Lock()}
+
+    def _audio(self, text):
+        n = max(1, int(len(text) * SECONDS_PER_CHAR * SR))
+        rng = np.random.default_rng(len(text))
+        t = np.arange(n, dtype="float32") / SR
+        y = 0.3 * np.sin(2 * np.pi * 170 * t) + 0.02 * rng.standard_normal(n)
+        return y.astype("float32")
+
+    def _generate(self, kind, texts):
+        wavs = [self._audio(t) for t in texts]
+        with self._gen_locks[kind]:
+            time.sleep(self.latency + max(len(w) for w in wavs) / SR / self.rtf)
+        return wavs
+
+    def generate_design(self, text, language, voice_description, temperature=None):
+        return self._generate("design", [text])[0], SR
+
+    def generate_clone(self, text, language, ref_audio, ref_text,
+                       speed_factor=1.0, temperature=None):
+        return self._generate("base", [text])[0], SR
+
+    def generate_design_batch(self, texts, language, voice_description, temperature=None):
+        return self._generate("design", texts), SR
+
+    def generate_clone_batch(self, texts, language, ref_audio, ref_text, temperature=None):
+        return self._generate("base", texts), SR
+
+
+def _workspace(root: Path) -> list[str]:
+    """Copia le voci di config/ in root/config (campioni mancanti → tono
+    sintetico in root/samples), redirige OUTPUT/cache. Ritorna gli id voce."""
+    cfg, samples = root / "config", root / "samples"
+    for d in (cfg, samples, root / "OUTPUT", root / "cache"):
+        d.mkdir(parents=True, exist_ok=True)
+    ids = []
+    for src in sorted(appconfig.CONFIG_DIR.glob("*.json")):
+        data = json.loads(src.read_text(encoding="utf-8"))
+        rel = data.get("prompt_speech_path")
+        if rel:
+            p = Path(rel) if Path(rel).is_absolute() else appconfig.PROJECT_ROOT / rel
+            if not p.exists():
+                p = samples / f"{src.stem}.wav"
+                t = np.arange(3 * SR, dtype="float32") / SR
+                sf.write(p, (0.2 * np.sin(2 * np.pi * 150 * t)).astype("float32"), SR)
+            data["prompt_speech_path"] = str(p)
+        data.pop("emotion_samples", None)  # campioni emotivi: stessi problemi di path
+        (cfg / src.name).write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        ids.append(src.stem)
+    appconfig.CONFIG_DIR, appconfig.SAMPLES_DIR = cfg, samples
+    appconfig.OUTPUT_DIR, appconfig.CACHE_DIR = root / "OUTPUT", root / "cache"
+    return ids
+
+
+def _serve(app):
+    import uvicorn
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port,
+                                           log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def _wait(client, jid, poll):
+    while True:
+        job = client.get(f"/api/jobs/{jid}").json()
+        if job["status"] in ("done", "error"):
+            return job
+        time.sleep(poll)
+
+
+class Bench:
+    def __init__(self, base_url, voices, args):
+        import httpx
+        self.url, self.voices, self.args = base_url, voices, args
+        self.rng = random.Random(0)
+        self._local = threading.local()
+        self._n = 0
+        self._lock = threading.Lock()
+        self._httpx = httpx
+
+    def _client(self):
+        if not hasattr(self._local, "c"):
+            self._local.c = self._httpx.Client(base_url=self.url, timeout=600)
+        return self._local.c
+
+    def _uid(self) -> int:
+        with self._lock:
+            self._n += 1
+            return self._n
+
+    def _scene(self, n):
+        """Battute di una scena: personaggi a turno, testi unici (niente hit di cache)."""
+        uid = self._uid()
+        with self._lock:  # rng condiviso tra i client
+            cast = self.rng.sample(self.voices, k=min(3, len(self.voices)))
+            texts = [self.rng.choice(LINES) for _ in range(n)]
+        return [{"voice_id": cast[i % len(cast)], "text": f"{t} ({uid}.{i})",
+                 "name": f"bench_{uid}_{i}"} for i, t in enumerate(texts)]
+
+    def _submit(self, path, body):
+        c = self._client()
+        t0 = time.perf_counter()
+        r = c.post(path, json=body)
+        if r.status_code != 200:
+            return {"status": "error", "error": r.text, "wait": None}, time.perf_counter() - t0
+        job = _wait(c, r.json()["job_id"], self.args.poll_ms / 1000)
+        return job, time.perf_counter() - t0
+
+    def generate(self):
+        line = self._scene(1)[0]
+        return "/api/generate", {"text": line["text"], "voice_id": line["voice_id"],
+                                 "format": self.args.format}
+
+    def batch(self):
+        return "/api/batch", {"items": self._scene(self.args.scene_lines),
+                              "format": self.args.format}
+
+    def teatro(self):
+        # clip della scena generati qui, prima della misura: si misura lo stitch
+        lines = self._scene(self.args.scene_lines)
+        job, _ = self._submit("/api/batch", {"items": lines, "format": "wav"})
+        if job["status"] != "done":
+            raise RuntimeError(f"generazione dei clip fallita: {job['error']}")
+        blocks = [{"voice_id": line["voice_id"], "text": line["text"],
+                   "clip": Path(p).name, "pause_after": 0.4}
+                  for line, p in zip(lines, job["result"])]
+        return "/api/teatro", {"blocks": blocks, "title": f"scena_{self._uid()}",
+                               "format": self.args.format}
+
+    def run(self, workload: str) -> dict:
+        make = getattr(self, workload)
+        with ThreadPoolExecutor(self.args.clients) as pool:  # richieste preparate prima
+            reqs = list(pool.map(lambda _: make(), range(self.args.requests + 1)))
+        self._submit(*reqs.pop())  # warm-up: pool DSP, import, prima scrittura
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(self.args.clients) as pool:
+            results = list(pool.map(lambda req: self._submit(*req), reqs))
+        wall = time.perf_counter() - t0
+        ok = [(job, lat) for job, lat in results if job["status"] == "done"]
+        lat = np.array([lat for _, lat in ok]) if ok else np.zeros(1)
+        waits = np.array([job["wait"] or 0.0 for job, _ in ok]) if ok else np.zeros(1)
+        errors = [job.get("error") for job, _ in results if job["status"] != "done"]
+        return {
+            "requests": len(results), "errors": len(errors),
+            "first_error": errors[0] if errors else None,
+            "wall_s": round(wall, 3), "jobs_per_s": round(len(ok) / wall, 3),
+            "latency_s": {f"p{q}": round(float(np.percentile(lat, q)), 4)
+                          for q in (50, 95, 99)},
+            "queue_wait_s": {"mean": round(float(waits.mean()), 4),
+                             "p95": round(float(np.percentile(waits, 95)), 4)},
+        }
+
+
+def _peak_rss_mb(who) -> float:
+    kb = resource.getrusage(who).ru_maxrss
+    return round(kb / 2**20 if sys.platform == "darwin" else kb / 2**10, 1)  # macOS: byte
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--workloads", nargs="+", default=["generate", "batch", "teatro"],
+                    choices=["generate", "batch", "teatro"])
+    ap.add_argument("--requests", type=int, default=40, help="richieste per workload")
+    ap.add_argument("--clients", type=int, default=4, help="client concorrenti")
+    ap.add_argument("--latency", type=float, default=0.2, help="latenza fissa del modello (s)")
+    ap.add_argument("--rtf", type=float, default=8.0,
+                    help="real-time factor del modello (s di audio per s)")
+    ap.add_argument("--scene-lines", type=int, default=12, help="battute per scena/batch")
+    ap.add_argument("--format", default="wav", choices=["wav", "mp3", "ogg", "opus"])
+    ap.add_argument("--poll-ms", type=float, default=5.0)
+    ap.add_argument("--out", type=Path)
+    args = ap.parse_args(argv)
+
+    from app import dsp_pool
+    from app.main import create_app
+    root = Path(tempfile.mkdtemp(prefix="gassmann-bench-"))
+    try:
+        voices = _workspace(root)
+        server, url = _serve(create_app(model_manager=FakeModel(args.latency, args.rtf)))
+        bench = Bench(url, voices, args)
+        results = {}
+        for w in args.workloads:
+            results[w] = r = bench.run(w)
+            print(f"{w:9s} {r['requests']:>4d} req  {r['jobs_per_s']:>7.2f} job/s  "
+                  f"p50 {r['latency_s']['p50']:.3f}s  p95 {r['latency_s']['p95']:.3f}s  "
+                  f"p99 {r['latency_s']['p99']:.3f}s  coda {r['queue_wait_s']['mean']:.3f}s  "
+                  f"errori {r['errors']}", flush=True)
+        server.should_exit = True
+        dsp_pool.default_pool.shutdown()  # RUSAGE_CHILDREN conta i worker terminati
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    report = {"args": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+              "workloads": results,
+              "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_SELF),
+              "dsp_workers_peak_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN)}
+    print(f"picco RSS: {report['peak_rss_mb']} MB (worker DSP {report['dsp_workers_peak_rss_mb']} MB)")
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
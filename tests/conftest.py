@@ -5,16 +5,18 @@ from app import config as appconfig
 
 @pytest.fixture
 def tmp_dirs(tmp_path, monkeypatch):
-    """Reindirizza config/output/samples a directory temporanee."""
+    """Reindirizza config/output/samples/cache a directory temporanee."""
     cfg = tmp_path / "config"
     out = tmp_path / "OUTPUT"
     samp = tmp_path / "VOICE_SAMPLES"
-    for d in (cfg, out, samp):
+    cache = tmp_path / "cache"
+    for d in (cfg, out, samp, cache):
         d.mkdir()
     monkeypatch.setattr(appconfig, "CONFIG_DIR", cfg)
     monkeypatch.setattr(appconfig, "OUTPUT_DIR", out)
     monkeypatch.setattr(appconfig, "SAMPLES_DIR", samp)
-    return {"config": cfg, "output": out, "samples": samp}
+    monkeypatch.setattr(appconfig, "CACHE_DIR", cache)
+    return {"config": cfg, "output": out, "samples": samp, "cache": cache}
 
 
 def _write(cfg_dir, name, data):
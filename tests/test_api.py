@@ -1,4 +1,5 @@
 import io
+import time
 import numpy as np
 import soundfile as sf
 from fastapi.testclient import TestClient
@@ -76,6 +77,26 @@ def test_teatro_reuses_clip_no_regen(tmp_dirs, monkeypatch):
     assert r.status_code == 200
     job = _poll(client, r.json()["job_id"])
     assert job["status"] == "done", job
+    # clip e scena pinnati: la retention non li tocca
+    pinned = {e["name"] for e in client.get("/api/outputs").json()["items"] if e["pinned"]}
+    assert pinned == {"battuta0.wav", "scena.wav"}
+
+
+def test_retention_admin_and_pin(tmp_dirs, monkeypatch):
+    from app import config as appconfig
+    sf.write(tmp_dirs["output"] / "clip.wav", np.zeros(2400, dtype="float32"), 24000)
+    client = _client(tmp_dirs)
+    assert client.post("/api/outputs/clip.wav/pin").json() == {"pinned": True}
+    assert client.post("/api/outputs/manca.wav/pin").status_code == 404
+    monkeypatch.setattr(appconfig, "OUTPUT_MAX_MB", 0)
+    monkeypatch.setattr(appconfig, "OUTPUT_MAX_AGE_DAYS", 1e-9)
+    monkeypatch.setattr(appconfig, "RETENTION_GRACE_S", 0)
+    assert client.post("/api/admin/retention/sweep").json()["removed"] == 0  # pinnato
+    client.delete("/api/outputs/clip.wav/pin")
+    res = client.post("/api/admin/retention/sweep").json()
+    assert res["files"] == ["clip.wav"] and res["reclaimed"] > 0
+    stats = client.get("/api/admin/retention").json()
+    assert stats["usage"]["files"] == 0 and stats["removed"] >= 1
 
 
 def test_create_clone_endpoint(tmp_dirs):
@@ -90,3 +111,174 @@ def test_create_clone_endpoint(tmp_dirs):
     )
     assert r.status_code == 200
     assert r.json()["id"] == "nuova"
+
+
+def test_queue_stats_endpoint(tmp_dirs):
+    r = _client(tmp_dirs).get("/api/queue")
+    assert r.status_code == 200
+    assert set(r.json()) == {"design", "base", "cpu"}
+
+
+def test_batch_per_item_voices(tmp_dirs):
+    """Render di scena via /api/batch: ogni item può avere la sua voce."""
+    _write(tmp_dirs["config"], "narr", {"language": "Italian", "voice_description": "x"})
+    _write(tmp_dirs["config"], "altra", {"language": "Italian", "voice_description": "y"})
+    client = _client(tmp_dirs)
+    r = client.post("/api/batch", json={"items": [
+        {"text": "uno", "voice_id": "narr"}, {"text": "due", "voice_id": "altra"}]})
+    assert r.status_code == 200
+    job = _poll(client, r.json()["job_id"])
+    assert job["status"] == "done", job
+    assert [p.rsplit("/", 1)[-1] for p in job["result"]] == ["uno_by_narr.wav", "due_by_altra.wav"]
+    r = client.post("/api/batch", json={"items": [{"text": "tre"}]})
+    assert r.status_code == 404  # nessuna voce né per item né di default
+
+
+def test_preprocess_preview_and_batch_up_front(tmp_dirs, monkeypatch):
+    from app import pipeline
+    _write(tmp_dirs["config"], "narr", {"language": "Italian", "voice_description": "x"})
+    client = _client(tmp_dirs)
+    r = client.post("/api/preprocess", json={"texts": ["ATP a pH 7", "ciao"]})
+    assert r.json() == {"texts": ["A T P a P H 7", "ciao"]}
+    seen = []
+    monkeypatch.setattr(pipeline, "preprocess_many",
+                        lambda texts: seen.append(list(texts)) or [t.upper() for t in texts])
+    r = client.post("/api/batch", json={"voice_id": "narr", "biochem": True,
+                                        "items": [{"text": "uno"}, {"text": "due"}]})
+    job = _poll(client, r.json()["job_id"])
+    assert job["status"] == "done", job
+    assert seen == [["uno", "due"]]
+    assert [p.rsplit("/", 1)[-1] for p in job["result"]] == ["UNO_by_narr.wav",
+                                                             "DUE_by_narr.wav"]
+
+
+def test_outputs_index_endpoint(tmp_dirs):
+    _write(tmp_dirs["config"], "narr", {"language": "Italian", "voice_description": "x"})
+    client = _client(tmp_dirs)
+    for text in ("uno", "due"):
+        jid = client.post("/api/generate", json={"text": text, "voice_id": "narr"}).json()["job_id"]
+        assert _poll(client, jid)["status"] == "done"
+    page = client.get("/api/outputs", params={"voice": "narr", "limit": 1}).json()
+    assert len(page["items"]) == 1 and page["next"]
+    assert page["items"][0]["voice_id"] == "narr" and page["items"][0]["text_hash"]
+    rest = client.get("/api/outputs", params={"limit": 1, "cursor": page["next"]}).json()
+    assert {page["items"][0]["name"], rest["items"][0]["name"]} == {
+        "uno_by_narr.wav", "due_by_narr.wav"}
+    (tmp_dirs["output"] / "uno_by_narr.wav").unlink()
+    assert client.post("/api/outputs/reconcile").json()["removed"] == 1
+    assert client.get("/api/outputs", params={"since": "ieri"}).status_code == 400
+
+
+def test_stream_sentences(tmp_dirs):
+    """Streaming: header WAV + un chunk PCM16 per frase (FakeMM: 2400 campioni)."""
+    _write(tmp_dirs["config"], "narr", {"language": "Italian", "voice_description": "x"})
+    client = _client(tmp_dirs)
+    r = client.post("/api/stream", json={"text": "Prima frase. Seconda frase!",
+                                         "voice_id": "narr"})
+    assert r.status_code == 200
+    assert r.content[:4] == b"RIFF" and r.content[8:12] == b"WAVE"
+    assert len(r.content) == 44 + 2 * 2 * 2400
+    job = _poll(client, r.headers["x-job-id"])
+    assert job["result"]["segments"] == 2
+    r = client.get("/api/stream", params={"text": "Ciao.", "voice_id": "narr"})
+    assert r.status_code == 200 and len(r.content) == 44 + 2 * 2400
+    assert client.post("/api/stream", json={"text": "x", "voice_id": "manca"}).status_code == 404
+
+
+def test_stream_error_before_audio_is_500(tmp_dirs, monkeypatch):
+    _write(tmp_dirs["config"], "narr", {"language": "Italian", "voice_description": "x"})
+    def boom(*a, **k):
+        raise RuntimeError("modello esploso")
+    monkeypatch.setattr(FakeMM, "generate_design", boom)
+    r = _client(tmp_dirs).post("/api/stream", json={"text": "Ciao.", "voice_id": "narr"})
+    assert r.status_code == 500 and "modello esploso" in r.json()["detail"]
+
+
+def test_stream_without_audio_is_500(tmp_dirs, monkeypatch):
+    from app import pipeline
+    _write(tmp_dirs["config"], "narr", {"language": "Italian", "voice_description": "x"})
+    monkeypatch.setattr(pipeline, "iter_generation", lambda *a, **k: iter(()))
+    r = _client(tmp_dirs).post("/api/stream", json={"text": "Ciao.", "voice_id": "narr"})
+    assert r.status_code == 500
+
+
+def test_stream_cancelled_while_queued_returns(tmp_dirs, monkeypatch):
+    """Stream annullato mentre è in coda: il worker lo salta e non mette nulla
+    in chunks, la richiesta deve rispondere lo stesso."""
+    import threading
+    _write(tmp_dirs["config"], "narr", {"language": "Italian", "voice_description": "x"})
+    gate = threading.Event()
+    real = FakeMM.generate_design
+    monkeypatch.setattr(FakeMM, "generate_design",
+                        lambda self, *a, **k: gate.wait(10) and real(self, *a, **k))
+    client = _client(tmp_dirs)
+    busy = client.post("/api/generate", json={"text": "occupa", "voice_id": "narr"}).json()
+    out = {}
+    t = threading.Thread(target=lambda: out.update(r=client.post(
+        "/api/stream", json={"text": "Ciao.", "voice_id": "narr"})))
+    t.start()
+    try:
+        for _ in range(200):
+            queued = [j for j in client.get("/api/jobs", params={"status": "queued"}).json()["items"]
+                      if j["kind"] is None]
+            if queued:
+                break
+            time.sleep(0.02)
+        assert client.post(f"/api/jobs/{queued[0]['id']}/cancel").json() == {"cancelled": True}
+        t.join(5)
+        assert out["r"].status_code == 499
+    finally:
+        gate.set()
+    assert _poll(client, busy["job_id"])["status"] == "done"
+
+
+def test_job_events_sse(tmp_dirs):
+    _write(tmp_dirs["config"], "narr", {"language": "Italian", "voice_description": "x"})
+    client = _client(tmp_dirs)
+    jid = client.post("/api/generate", json={"text": "ciao", "voice_id": "narr"}).json()["job_id"]
+    import json
+    with client.stream("GET", f"/api/jobs/{jid}/events") as r:
+        assert r.headers["content-type"].startswith("text/event-stream")
+        events = [json.loads(line[5:]) for line in r.iter_lines() if line.startswith("data:")]
+    assert events[-1]["status"] == "done"
+    assert client.get("/api/jobs/nope/events").status_code == 404
+
+
+def test_health_ready(tmp_dirs):
+    r = _client(tmp_dirs).get("/api/health/ready")  # FakeMM: nessun warm-up
+    assert r.status_code == 200 and r.json()["ready"] is True
+
+
+def test_job_trace_and_metrics(tmp_dirs):
+    import time
+    _write(tmp_dirs["config"], "narr", {"language": "Italian", "voice_description": "x"})
+    client = _client(tmp_dirs)
+    jid = client.post("/api/generate", json={"text": "ciao", "voice_id": "narr"}).json()["job_id"]
+    for _ in range(100):
+        job = client.get(f"/api/jobs/{jid}").json()
+        if job["status"] in ("done", "error"):
+            break
+        time.sleep(0.02)
+    assert job["status"] == "done"
+    spans = job["trace"]["spans"]
+    assert {"plan", "inference", "trim", "encode_soundfile"} <= set(spans)
+    assert job["trace"]["audio_seconds"] == {"design": 0.1}  # 2400 campioni a 24 kHz
+    text = client.get("/api/metrics").text
+    assert 'gassmann_phase_seconds_count{phase="inference"}' in text
+    assert 'gassmann_realtime_factor_bucket{voice_type="design",le="+Inf"}' in text
+    assert 'gassmann_lane_queued{lane="design"} 0' in text
+
+
+def test_jobs_listing_and_persistence(tmp_dirs):
+    _write(tmp_dirs["config"], "narr", {"language": "Italian", "voice_description": "x"})
+    client = _client(tmp_dirs)
+    jid = client.post("/api/generate", json={"text": "ciao", "voice_id": "narr"}).json()["job_id"]
+    assert _poll(client, jid)["status"] == "done"
+    items = client.get("/api/jobs", params={"kind": "generate"}).json()["items"]
+    assert [j["id"] for j in items] == [jid]
+    assert client.get("/api/jobs", params={"status": "error"}).json()["items"] == []
+    assert client.get("/api/jobs", params={"cursor": "x|y"}).status_code == 400
+    assert client.post(f"/api/jobs/{jid}/cancel").json() == {"cancelled": False}  # già finito
+    assert client.post("/api/jobs/nope/cancel").status_code == 404
+    # nuova app sullo stesso CACHE_DIR (riavvio): il job finito è ancora lì
+    assert _client(tmp_dirs).get(f"/api/jobs/{jid}").json()["status"] == "done"
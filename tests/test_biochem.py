@@ -0,0 +1,115 @@
+"""Golden test del preprocessore biochimico: l'output del matcher compilato
+deve restare identico a quello delle vecchie passate re.sub chiave per chiave
+(corpus generato con l'implementazione originale, stranezze comprese).
+Run: python -m tests.test_biochem"""
+from app import pipeline
+from app.biochem_text_preprocessor import (
+    BiochemTextPreprocessor, get_preprocessor, preprocess_biochem_text,
+)
+
+GOLDEN = [
+    ('The reaction requires ATP and Mg2+ ions at pH 7.4.',
+     'The reaction requires A T P and Mg 2+ ions at P H 7.4.'),
+    ('Ca2+ activates the enzyme, while H2O acts as a substrate.',
+     'Ca 2+ activates the enzyme, while H two O acts as a substrate.'),
+    ('The concentration of NADH was 5 mM in the solution.',
+     'The concentration of N A D H was 5 millimolar in the solution.'),
+    ('DNA polymerase synthesizes RNA from nucleotides like ATP, GTP, CTP, and UTP.',
+     'D N A polymerase synthesizes R N A from nucleotides like A T P, G T P, C T P, and U T P.'),
+    ('The Km value for this enzyme is 10^-7 M.',
+     'The K  molar value for this enzyme is 10 to the power of negative 7  molar.'),
+    ('Fe2+ can be oxidized to Fe3+ in the presence of O2.',
+     'Fe 2+ can be oxidized to Fe 3+ in the presence of O two.'),
+    ('The protein contains Cys, Met, and His residues.',
+     'The protein contains Cysteine, Methionine, and Histidine residues.'),
+    ('NAD+ e NADP+ sono coenzimi; NADPH e FADH2 sono ridotti.',
+     'NAD+ e NADP+ sono coenzimi; N A D P H e F A D H two sono ridotti.'),
+    ('Na+K+ATPasi scambia Na+ e K+ attraverso la membrana.',
+     'sodium ionK+ATPasi scambia Na+ e K+ attraverso la membrana.'),
+    ('Cl-ion e OH-group: H+ in eccesso abbassa il pH.',
+     'chloride ionion e hydroxide iongroup: H+ in eccesso abbassa il P H.'),
+    ('H2SO4, HNO3 e HCl sono acidi forti; NH3 e CH4 no.',
+     'H two S O four, H N O three e H C L sono acidi forti; N H three e C H four no.'),
+    ('mRNA, tRNA, rRNA e cDNA derivano dal DNA.',
+     'messenger R N A, transfer R N A, ribosomal R N A e complementary D N A derivano dal D N A.'),
+    ("La CoA lega l'acetile: acetil-CoA entra nel ciclo.",
+     "La Coenzyme A lega l'acetile: acetil-Coenzyme A entra nel ciclo."),
+    ('Vmax e kcat si misurano con HPLC, NMR, UV e IR.',
+     'V max e K cat si misurano con H P L C, N  molar R, U V e I R.'),
+    ("PKA e PKC fosforilano; la PCR e l'ELISA sono tecniche; SDS-PAGE separa.",
+     "protein kinase A e protein kinase C fosforilano; la P C R e l'E L I S A sono tecniche; S D S PAGE separa."),
+    ('Proteina di 55 kDa, plasmide di 3 kb, frammento di 500 bp a 37°C e 4ºC.',
+     'Proteina di 55 kilodaltons, plasmide di 3 kilobase pairs, frammento di 500 base pairs a 37degrees Celsius e 4ºC.'),
+    ('Soluzione 10 mg/mL, 5 μg/mL, 2 ng/mL, 100 μM, 20 nM, 1 M.',
+     'Soluzione 10 milligrams per milliliter, 5 micrograms per milliliter, 2 nanograms per milliliter, 100 micromolar, 20 nanomolar, 1  molar.'),
+    ("Volume 5 mL e 20 μL; lunghezza d'onda 280 nm, cellule di 10 μm.",
+     "Volume 5 milliliters e 20 microliters; lunghezza d'onda 280 nanometers, cellule di 10 micrometers."),
+    ('H3PO4 e C6H12O6 sono formule generiche; Ca3(PO4)2 pure.',
+     'H 3PO 4 e C 6H 12O 6 sono formule generiche; Ca 3(PO 4)2 pure.'),
+    ('e^-x decresce; 2^10 = 1024; x^2 è il quadrato.',
+     'e^-x decresce; 2 to the power of 10 = 1024; x to the power of 2 è il quadrato.'),
+    ('Zn2+, Cu2+ e Mn2+ sono cofattori.',
+     'Zn 2+, Cu 2+ e Mn 2+ sono cofattori.'),
+    ('Ala-Gly-Ser è un tripeptide; Trp, Tyr e Phe sono aromatici.',
+     'Alanine-Glycine-Serine è un tripeptide; Tryptophan, Tyrosine e Phenylalanine sono aromatici.'),
+    ('Asn, Asp, Gln, Glu, Ile, Leu, Lys, Pro, Thr, Val, Arg.',
+     'Asparagine, Aspartate, Glutamine, Glutamate, Isoleucine, Leucine, Lysine, Proline, Threonine, Valine, Arginine.'),
+    ('ADP+Pi forma ATP; AMP ciclico; GDP e GTP.',
+     'A D P+Pi forma A T P; A  molar P ciclico; G D P e G T P.'),
+    ('Testo   con   spazi   multipli\ne  a capo\tcon tab.',
+     'Testo con spazi multipli e a capo con tab.'),
+    ('Nessun termine tecnico in questa frase italiana.',
+     'Nessun termine tecnico in questa frase italiana.'),
+    ('MgATP, ATPase, pHmetro, Kmax, DNAsi: parole composte restano.',
+     'MgATP, ATPase, pHmetro, Kmax, DNAsi: parole composte restano.'),
+    ('O2- e H2O2 sono specie reattive; CO2 e N2 sono gas; H2 brucia.',
+     'O two- e H 2O 2 sono specie reattive; C O two e N two sono gas; H two brucia.'),
+    ('Misura: 3 M NaCl, 0.5 M di Tris, pKa 8.1.',
+     'Misura: 3  molar NaCl, 0.5  molar di Tris, P K A 8.1.'),
+    ('Da 10 Da a 100 kDa; UV-vis; IR-spettro.',
+     'daltons 10 daltons a 100 kilodaltons; U V-vis; I R-spettro.'),
+    ('',
+     ''),
+]
+
+
+def test_golden_corpus():
+    pre = BiochemTextPreprocessor()
+    for text, expected in GOLDEN:
+        assert pre.preprocess(text) == expected, text
+
+
+def test_singleton_and_pipeline_hook():
+    assert get_preprocessor() is get_preprocessor()
+    text, expected = GOLDEN[0]
+    assert pipeline._preprocess_biochem(text) == expected
+    assert preprocess_biochem_text(text) == expected
+
+
+def test_custom_mappings_rebuild_matcher():
+    pre = BiochemTextPreprocessor()
+    assert pre.preprocess("GFP e ATP") == "GFP e A T P"
+    pre.add_custom_mappings({"GFP": "green fluorescent protein"}, "acronyms")
+    assert pre.preprocess("GFP e ATP") == "green fluorescent protein e A T P"
+    assert get_preprocessor().preprocess("GFP") == "GFP"  # istanza condivisa intatta
+
+
+def test_memo_and_preprocess_many():
+    pre = BiochemTextPreprocessor(cache_size=2)
+    texts = ["ATP e ADP", "pH 7", "ATP e ADP", "pH 7"]
+    assert pre.preprocess_many(texts) == ["A T P e A D P", "P H 7"] * 2
+    assert (pre.hits, pre.misses) == (0, 2)  # duplicati risolti nella chiamata
+    pre.preprocess("ATP e ADP")
+    assert pre.hits == 1
+    pre.preprocess("DNA")  # terzo testo: esce il meno recente ("pH 7")
+    assert "pH 7" not in pre._memo and len(pre._memo) == 2
+    pre.add_custom_mappings({"ADP": "adenosina difosfato"}, "chemical_formulas")
+    assert pre.preprocess("ATP e ADP") == "A T P e adenosina difosfato"
+
+
+if __name__ == "__main__":
+    test_golden_corpus()
+    test_singleton_and_pipeline_hook()
+    test_custom_mappings_rebuild_matcher()
+    test_memo_and_preprocess_many()
+    print("ok")
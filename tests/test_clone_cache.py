@@ -1,7 +1,8 @@
-"""Regression: generate_clone NON deve riusare un prompt cachato tra battute.
-Il prompt item riusato si corrompe dopo la prima generate (la voce cambia tra
-un rigenera e l'altro). Ogni generate deve ricevere ref_audio/ref_text freschi.
-Run: python -m app.tests.test_clone_cache"""
+"""Regression: il voice_clone_prompt cachato non deve mai arrivare corrotto al
+modello. Il prompt item riusato si corrompe dopo la prima generate (la voce
+cambia tra un rigenera e l'altro): la cache tiene un master e passa a ogni
+generate una copia fresca, quindi l'identità della voce resta stabile.
+Run: python -m tests.test_clone_cache"""
 import os
 import tempfile
 
@@ -10,34 +11,88 @@ import numpy as np
 from app.model_manager import ModelManager
 
 
+class _Item:
+    def __init__(self, spk):
+        self.ref_spk_embedding = spk
+
+
 class _FakeBase:
     def __init__(self):
-        self.ref_audios = []
-
-    def generate_voice_clone(self, text, language, ref_audio, ref_text, **kw):
-        # nessun voice_clone_prompt: ref passato diretto, ri-encoding ogni volta
-        assert "voice_clone_prompt" not in kw, "prompt cachato re-introdotto"
-        self.ref_audios.append(ref_audio)
-        return [np.zeros(2400, dtype="float32")], 24000
+        self.encodes = 0
+        self.voices = []  # embedding visto da ogni generate = "identità" della voce
 
+    def create_voice_clone_prompt(self, ref_audio, ref_text, **kw):
+        self.encodes += 1
+        return [_Item(np.full(256, 0.5, dtype="float32"))]
 
-def _gen(mm, path):
-    mm.generate_clone(text="ciao", language="Italian", ref_audio=path, ref_text="rif")
+    def generate_voice_clone(self, text, language, voice_clone_prompt=None, **kw):
+        assert "ref_audio" not in kw, "ref ri-codificato nonostante la cache"
+        texts = text if isinstance(text, list) else [text]
+        assert len(voice_clone_prompt) == len(texts)
+        for item in voice_clone_prompt:
+            self.voices.append(item.ref_spk_embedding.copy())
+            item.ref_spk_embedding *= 3  # simula la corruzione in place del prompt
+        return [np.zeros(2400, dtype="float32") for _ in texts], 24000
 
 
-def main():
+def _sample():
     fd, path = tempfile.mkstemp(suffix=".wav")
+    os.write(fd, b"RIFF0000")
     os.close(fd)
+    return path
+
+
+def test_prompt_reused_without_corruption():
+    path = _sample()
     try:
         mm = ModelManager()
         fake = _FakeBase()
         mm._base = fake  # evita di caricare il modello reale
-        _gen(mm, path); _gen(mm, path); _gen(mm, path)
-        assert fake.ref_audios == [path, path, path], fake.ref_audios
+        for _ in range(3):
+            mm.generate_clone(text="ciao", language="Italian", ref_audio=path, ref_text="rif")
+        mm.generate_clone_batch(["a", "b"], language="Italian", ref_audio=path, ref_text="rif")
+        assert fake.encodes == 1, "il ref va codificato una volta sola"
+        assert len(fake.voices) == 5
+        assert all(np.array_equal(v, fake.voices[0]) for v in fake.voices), \
+            "la voce cambia tra una generate e l'altra"
+    finally:
+        os.unlink(path)
+
+
+def test_prompt_reencoded_when_sample_or_text_changes():
+    path = _sample()
+    try:
+        mm = ModelManager()
+        fake = _FakeBase()
+        mm._base = fake
+        mm.generate_clone(text="x", language="Italian", ref_audio=path, ref_text="rif")
+        mm.generate_clone(text="x", language="Italian", ref_audio=path, ref_text="altro")
+        with open(path, "ab") as f:
+            f.write(b"nuovo campione")  # size/mtime cambiano → chiave diversa
+        mm.generate_clone(text="x", language="Italian", ref_audio=path, ref_text="rif")
+        assert fake.encodes == 3
+    finally:
+        os.unlink(path)
+
+
+def test_prompt_cache_evicts_by_memory():
+    path = _sample()
+    try:
+        mm = ModelManager()
+        fake = _FakeBase()
+        mm._base = fake
+        mm.clone_prompts.max_bytes = 1500  # ~1 prompt da 1 KB
+        mm.generate_clone(text="x", language="Italian", ref_audio=path, ref_text="a")
+        mm.generate_clone(text="x", language="Italian", ref_audio=path, ref_text="b")
+        assert len(mm.clone_prompts) == 1
+        mm.generate_clone(text="x", language="Italian", ref_audio=path, ref_text="b")
+        assert fake.encodes == 2  # "b" è ancora in cache, "a" evicted
     finally:
         os.unlink(path)
-    print("ok")
 
 
 if __name__ == "__main__":
-    main()
+    test_prompt_reused_without_corruption()
+    test_prompt_reencoded_when_sample_or_text_changes()
+    test_prompt_cache_evicts_by_memory()
+    print("ok")
@@ -0,0 +1,40 @@
+"""Pool di processi DSP: stesso risultato dell'in-process, audio via shared memory."""
+import os
+
+import numpy as np
+
+from app.dsp_pool import DSPPool
+
+
+def _tone(sr=24000, secs=1.0):
+    t = np.arange(int(sr * secs), dtype="float32") / sr
+    return (0.9 * np.sin(2 * np.pi * 220 * t)).astype("float32")
+
+
+def _segments():
+    return set(os.listdir("/dev/shm")) if os.path.isdir("/dev/shm") else set()
+
+
+def test_pool_matches_in_process():
+    sr, y = 24000, _tone()
+    local, pool = DSPPool(processes=0), DSPPool(processes=1)
+    before = _segments()
+    try:
+        for n_steps, rate, gain in [(1.5, 1.05, 1.3), (0.0, 0.9, 1.0), (-2.0, 1.0, 0.8)]:
+            a = local.pitch_tempo(y, sr, n_steps, rate, gain)
+            b = pool.pitch_tempo(y, sr, n_steps, rate, gain)
+            assert b.shape == a.shape == (int(round(len(y) / rate)),)
+            assert np.allclose(a, b, atol=1e-6)
+            assert b.max() <= 1.0 and b.min() >= -1.0
+    finally:
+        pool.shutdown()
+    assert pool.stats()["tasks"] == 3 and local.stats()["local_tasks"] == 3
+    assert _segments() == before  # segmenti liberati
+
+
+def test_gain_only_stays_in_process():
+    pool = DSPPool(processes=1)
+    out = pool.pitch_tempo(_tone(), 24000, gain=2.0)
+    assert out.max() <= 1.0
+    assert pool.stats() == {"processes": 1, "running": False, "tasks": 0,
+                            "local_tasks": 0, "restarts": 0}
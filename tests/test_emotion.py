@@ -23,6 +23,23 @@ def test_dsp_changes_and_clips():
     assert set(EMOTION_DSP) <= set(ALLOWED_EMOTIONS)
 
 
+def test_pitch_tempo_single_pass_matches_two_pass():
+    """Pitch + tempo fusi in un'unica STFT: stessa durata e stessa frequenza
+    dominante di pitch_shift seguito da time_stretch."""
+    import librosa
+    from app.pipeline import pitch_tempo
+    sr = 24000
+    t = np.arange(sr, dtype="float32") / sr
+    y = (0.5 * np.sin(2 * np.pi * 220 * t)).astype("float32")
+    two = librosa.effects.time_stretch(
+        librosa.effects.pitch_shift(y, sr=sr, n_steps=2.0), rate=1.1)
+    one = pitch_tempo(y, sr, 2.0, 1.1)
+    assert len(one) == len(two)
+    peak = lambda a: np.abs(np.fft.rfft(a)).argmax() * sr / len(a)
+    assert abs(peak(one) - peak(two)) < 2.0  # Hz (≈247 Hz attesi)
+
+
 if __name__ == "__main__":
     test_dsp_changes_and_clips()
+    test_pitch_tempo_single_pass_matches_two_pass()
     print("ok")
@@ -0,0 +1,41 @@
+"""Encoder in-process (libsndfile), fallback in pipe a ffmpeg e scelta del backend."""
+import sys
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from app import encoders
+
+
+def _tone(sr=24000, secs=1.0):
+    t = np.arange(int(sr * secs), dtype="float32") / sr
+    return (0.3 * np.sin(2 * np.pi * 220 * t)).astype("float32")
+
+
+@pytest.mark.parametrize("fmt", ["wav", "mp3", "ogg", "opus"])
+def test_native_roundtrip(tmp_path, fmt):
+    if not encoders.native(fmt):
+        pytest.skip(f"libsndfile senza {fmt}")
+    path = encoders.encode(_tone(), 24000, tmp_path / "clip", fmt)
+    assert path.endswith(encoders.extension(fmt))
+    assert list(tmp_path.iterdir()) == [tmp_path / f"clip{encoders.extension(fmt)}"]  # niente WAV
+    assert abs(sf.info(path).duration - 1.0) < 0.08
+
+
+def test_ffmpeg_pipe_backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(encoders, "ffmpeg_cmd", lambda sr, ch, dst, fmt: [
+        sys.executable, "-c",
+        f"import sys; open({dst!r}, 'wb').write(sys.stdin.buffer.read())"])
+    y = _tone(secs=0.5)
+    path = encoders.encode(y, 24000, tmp_path / "clip", "mp3", via="ffmpeg")
+    assert np.array_equal(np.frombuffer(open(path, "rb").read(), dtype="<f4"), y)
+
+
+def test_backend_choice(monkeypatch):
+    assert encoders.backend("wav") == "soundfile"
+    monkeypatch.setattr(encoders, "native", lambda fmt: False)
+    monkeypatch.setattr(encoders, "ffmpeg_cmd", lambda *a: ["ffmpeg"])
+    assert encoders.backend("mp3") == "ffmpeg"
+    with pytest.raises(ValueError):
+        encoders.extension("flac")
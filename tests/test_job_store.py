@@ -0,0 +1,73 @@
+import threading
+import time
+
+from app import config as appconfig
+from app.job_store import JobStore
+from app.jobs import JobQueue
+from tests.test_jobs import _wait
+
+
+def test_finished_job_read_back_from_store(tmp_path):
+    q = JobQueue(lanes={"base": 1}, store=JobStore(tmp_path / "jobs.sqlite"))
+    jid = q.submit(lambda p: {"path": "x.wav"}, kind="generate", payload={"text": "ciao"})
+    job = _wait(q, jid)
+    assert job["status"] == "done" and job["result"] == {"path": "x.wav"}
+    assert jid not in q._jobs  # finito: lo serve lo store
+    assert q.subscribe(jid).get(timeout=1)["status"] == "done"
+    # un'altra coda sullo stesso database (riavvio) lo vede ancora
+    assert JobQueue(store=JobStore(tmp_path / "jobs.sqlite")).get(jid)["kind"] == "generate"
+
+
+def test_resume_requeues_unfinished_jobs(tmp_path):
+    path = tmp_path / "jobs.sqlite"
+    gate = threading.Event()
+    q = JobQueue(lanes={"base": 1}, store=JobStore(path))
+    q.submit(lambda p: gate.wait(5), kind="generate", payload={"text": "uno"})
+    queued = q.submit(lambda p: "mai", kind="generate", payload={"text": "due"})
+    stream = q.submit(lambda p: "mai")  # senza kind: non ripristinabile
+    # "riavvio": nuova coda sullo stesso database, la vecchia resta bloccata
+    q2 = JobQueue(lanes={"base": 1}, store=JobStore(path))
+    counts = q2.resume({"generate": lambda payload: lambda p: payload["text"].upper()})
+    assert counts == {"resumed": 2, "failed": 1}
+    assert _wait(q2, queued)["result"] == "DUE"
+    assert q2.get(stream)["error"] == "interrotto dal riavvio del server"
+    gate.set()
+
+
+def test_progress_batched_and_listing(tmp_path, monkeypatch):
+    monkeypatch.setattr(appconfig, "JOB_FLUSH_S", 3600.0)
+    store = JobStore(tmp_path / "jobs.sqlite")
+    q = JobQueue(lanes={"base": 1, "cpu": 1}, store=store)
+    gate = threading.Event()
+
+    def work(progress):
+        for i in range(50):
+            progress(i / 50)
+        gate.wait(5)
+        return "ok"
+
+    jid = q.submit(work, kind="batch", payload={})
+    while q.get(jid)["progress"] < 0.98:
+        time.sleep(0.01)
+    assert store.get(jid)["progress"] == 0.0  # 50 callback, nessuna scrittura
+    q._flush()
+    assert store.get(jid)["progress"] == 0.98
+    gate.set()
+    _wait(q, jid)
+    other = q.submit(lambda p: "ok", lane="cpu", kind="teatro", payload={})
+    _wait(q, other)
+    page = q.list(limit=1)
+    assert [j["id"] for j in page["items"]] == [other]
+    assert [j["id"] for j in q.list(cursor=page["next"])["items"]] == [jid]
+    assert [j["id"] for j in q.list(lane="base")["items"]] == [jid]
+    assert q.list(kind="nope")["items"] == []
+
+
+def test_prune_finished_after_ttl(tmp_path):
+    for store in (JobStore(tmp_path / "jobs.sqlite"), None):
+        q = JobQueue(lanes={"base": 1}, store=store)
+        jid = q.submit(lambda p: "ok")
+        _wait(q, jid)
+        assert q.prune() == 0
+        assert q.prune(now=time.time() + appconfig.JOB_TTL_S + 1) == 1
+        assert q.get(jid) is None
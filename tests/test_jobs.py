@@ -38,3 +38,91 @@ def test_progress_updates():
     jid = q.submit(work)
     job = _wait(q, jid)
     assert job["progress"] == 1.0  # forzato a 1 al termine
+
+
+def test_lanes_run_independently():
+    """Uno stitch in corsia cpu non aspetta una generazione lunga in corsia base."""
+    import threading
+    q = JobQueue()
+    gate = threading.Event()
+    slow = q.submit(lambda progress: gate.wait(5), lane="base")
+    while q.get(slow)["status"] != "running":
+        time.sleep(0.01)
+    fast = q.submit(lambda progress: "scena.wav", lane="cpu")
+    assert _wait(q, fast)["status"] == "done"
+    assert q.get(slow)["status"] == "running"
+    gate.set()
+    assert _wait(q, slow)["status"] == "done"
+
+
+def test_priority_jumps_queue():
+    import threading
+    from app.jobs import PRIORITY_BATCH, PRIORITY_INTERACTIVE
+    q = JobQueue(lanes={"base": 1})
+    gate, order = threading.Event(), []
+    q.submit(lambda progress: gate.wait(5))  # occupa l'unico worker
+    batch = q.submit(lambda progress: order.append("batch"), priority=PRIORITY_BATCH)
+    regen = q.submit(lambda progress: order.append("regen"), priority=PRIORITY_INTERACTIVE)
+    gate.set()
+    _wait(q, batch)
+    _wait(q, regen)
+    assert order == ["regen", "batch"]
+    stats = q.stats()["base"]
+    assert stats["done"] == 3 and stats["queued"] == 0
+    assert q.get(batch)["wait"] >= q.get(regen)["wait"]
+
+
+def test_unknown_lane_rejected():
+    q = JobQueue(lanes={"base": 1})
+    try:
+        q.submit(lambda progress: None, lane="gpu")
+        assert False, "atteso ValueError"
+    except ValueError:
+        pass
+
+
+def test_subscribe_pushes_progress_and_end():
+    import threading
+    q = JobQueue()
+    gate = threading.Event()
+
+    def work(progress):
+        gate.wait(5)
+        progress(0.5)
+        return "ok"
+
+    jid = q.submit(work)
+    sub = q.subscribe(jid)
+    gate.set()
+    seen = []
+    while not seen or seen[-1]["status"] not in ("done", "error"):
+        seen.append(sub.get(timeout=5))
+    assert 0.5 in [s["progress"] for s in seen]
+    assert seen[-1]["status"] == "done" and seen[-1]["result"] == "ok"
+    q.unsubscribe(jid, sub)
+    assert q.subscribe("nope") is None
+
+
+def test_cancel_queued_and_running():
+    import threading
+    q = JobQueue(lanes={"base": 1})
+    started, steps = threading.Event(), []
+
+    def work(progress):
+        started.set()
+        while not q.cancel_requested():  # come run_generation_many tra micro-batch
+            steps.append(1)
+            time.sleep(0.01)
+        raise RuntimeError("interrotto")
+
+    running = q.submit(work)
+    queued = q.submit(lambda progress: steps.append("mai"))
+    started.wait(5)
+    assert q.cancel(queued)
+    assert q.get(queued)["error"] == "annullato"
+    assert q.cancel(running)
+    job = _wait(q, running)
+    assert job["status"] == "error" and job["error"] == "annullato"
+    assert "mai" not in steps and not q.cancel(running)
+    stats = q.stats()["base"]
+    assert stats["running"] == 0 and stats["done"] == 2
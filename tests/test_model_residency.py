@@ -0,0 +1,95 @@
+"""Residenza dei modelli: budget con eviction LRU, scarico per inattività,
+prefetch e mai scarico di un modello che sta generando."""
+import threading
+import time
+
+import numpy as np
+
+from app import tracing
+from app.model_manager import ModelManager
+
+GB = 2**30
+
+
+class _Tensor:
+    def __init__(self, nbytes):
+        self.n = nbytes
+
+    def element_size(self):
+        return 1
+
+    def nelement(self):
+        return self.n
+
+
+class _Model:
+    def __init__(self, nbytes):
+        self._p = [_Tensor(nbytes)]
+
+    def parameters(self):
+        return self._p
+
+    def generate_voice_design(self, text, language, instruct, **kw):
+        return [np.zeros(240, dtype="float32")], 24000
+
+
+class _MM(ModelManager):
+    def __init__(self, **kw):
+        super().__init__(**kw)
+        self.loads = []
+
+    def _load(self, repo):
+        self.loads.append(repo)
+        return _Model(3 * GB)
+
+
+def test_budget_evicts_lru():
+    mm = _MM(budget_bytes=5 * GB)
+    before = tracing.MODEL_EVICTIONS.value(model="design", reason="budget")
+    mm.design()
+    mm.base()  # non entrano entrambi: via il design (LRU)
+    assert list(mm.residency()["models"]) == ["base"]
+    assert tracing.MODEL_EVICTIONS.value(model="design", reason="budget") == before + 1
+    mm.generate_design("ciao", "Italian", "x")  # ricarica design, scarica base
+    assert list(mm.residency()["models"]) == ["design"] and len(mm.loads) == 3
+
+
+def test_no_budget_keeps_both():
+    mm = _MM(budget_bytes=0)
+    mm.design(), mm.base()
+    assert set(mm.residency()["models"]) == {"design", "base"}
+
+
+def test_busy_model_is_not_evicted():
+    mm = _MM(budget_bytes=5 * GB)
+    mm.design()
+    with mm._gen_locks["design"]:  # design in generazione
+        mm.base()  # carica sopra budget invece di scaricare un modello in uso
+        assert set(mm.residency()["models"]) == {"design", "base"}
+    mm._make_room(0)  # generazione finita: si rientra nel budget
+    assert len(mm.residency()["models"]) == 1
+
+
+def test_idle_reap():
+    mm = _MM(idle_s=60)
+    mm.base()
+    assert mm.reap_idle(now=time.monotonic() + 10) == []
+    assert mm.reap_idle(now=time.monotonic() + 120) == ["base"]
+    assert mm.residency()["models"] == {}
+
+
+def test_prefetch_only_evicts_idle_models():
+    mm = _MM(budget_bytes=5 * GB)
+    mm.base()
+    with mm._gen_locks["base"]:  # base occupato: il prefetch non ci sta, rinuncia
+        mm.prefetch(["design"])
+        for t in threading.enumerate():
+            if t.name == "gassmann-prefetch-design":
+                t.join(5)
+        assert list(mm.residency()["models"]) == ["base"]
+    mm.prefetch(["design"])  # base inattivo e non richiesto dalla coda → scambio
+    for _ in range(100):
+        if "design" in mm.residency()["models"]:
+            break
+        time.sleep(0.01)
+    assert list(mm.residency()["models"]) == ["design"]
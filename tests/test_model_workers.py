@@ -0,0 +1,52 @@
+"""Worker pool: processi modello separati, audio in shared memory, affinità per voce."""
+import os
+
+import numpy as np
+
+from app.model_workers import ModelWorkerPool
+
+
+class FakeWorkerMM:
+    """ModelManager finto del worker: l'audio porta il pid del processo."""
+
+    def _audio(self, text):
+        return np.full(100 * len(text), os.getpid(), dtype="float64")
+
+    def generate_design(self, text, language, voice_description, temperature=None):
+        return self._audio(text), 24000
+
+    def generate_clone(self, text, language, ref_audio, ref_text,
+                       speed_factor=1.0, temperature=None):
+        return self._audio(text), 24000
+
+    def generate_clone_batch(self, texts, language, ref_audio, ref_text, temperature=None):
+        return [self._audio(t) for t in texts], 24000
+
+    def residency(self):
+        return {"models": {"base": {"bytes": 1, "idle_s": 0}}, "budget_bytes": 0, "idle_s": 0}
+
+
+def _segments():
+    return set(os.listdir("/dev/shm")) if os.path.isdir("/dev/shm") else set()
+
+
+def test_pool_affinity_and_shared_memory():
+    pool = ModelWorkerPool(workers=2, factory="tests.test_model_workers:FakeWorkerMM")
+    before = _segments()
+    try:
+        a1, sr = pool.generate_clone("ciao", "Italian", "a.wav", "x")
+        a2, _ = pool.generate_clone("buongiorno", "Italian", "a.wav", "x")
+        assert sr == 24000 and len(a1) == 400 and len(a2) == 1000
+        assert a1[0] == a2[0] != os.getpid()  # stesso worker, altro processo
+        wavs, _ = pool.generate_clone_batch(["a", "bb"], "Italian", "a.wav", "x")
+        assert [len(w) for w in wavs] == [100, 200] and wavs[0][0] == a1[0]
+        # una voce assegnata all'altro worker gira in un altro processo
+        other = next(f"v{i}.wav" for i in range(100)
+                     if pool.worker_for(("clone", f"v{i}.wav", "x"))
+                     != pool.worker_for(("clone", "a.wav", "x")))
+        b, _ = pool.generate_clone("ciao", "Italian", other, "x")
+        assert b[0] != a1[0]
+        assert set(pool.residency()["models"]) == {"base@0", "base@1"}
+    finally:
+        pool.shutdown()
+    assert _segments() == before  # segmenti rimossi dal processo API
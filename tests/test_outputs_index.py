@@ -0,0 +1,52 @@
+"""Indice di OUTPUT: paginazione a cursore, filtri e reconcile dei file
+cambiati fuori dall'app."""
+import os
+
+import numpy as np
+import soundfile as sf
+
+from app.outputs_index import OutputsIndex
+
+
+def _clip(out, name, mtime, n=2400):
+    p = out / name
+    sf.write(str(p), np.zeros(n, dtype="float32"), 24000)
+    os.utime(p, (mtime, mtime))
+    return p
+
+
+def test_record_and_paginate(tmp_dirs):
+    out = tmp_dirs["output"]
+    idx = OutputsIndex()
+    for i in range(5):
+        idx.record(_clip(out, f"t{i}_by_narr.wav", 1000 + i), voice_id="narr", text=f"t{i}")
+    idx.record(_clip(out, "altro_by_lida.wav", 2000), voice_id="lida", text="altro")
+    page = idx.list(limit=4)
+    assert [e["name"] for e in page["items"]] == [
+        "altro_by_lida.wav", "t4_by_narr.wav", "t3_by_narr.wav", "t2_by_narr.wav"]
+    assert page["items"][0]["duration"] == 0.1 and page["items"][0]["format"] == "wav"
+    rest = idx.list(limit=4, cursor=page["next"])
+    assert [e["name"] for e in rest["items"]] == ["t1_by_narr.wav", "t0_by_narr.wav"]
+    assert rest["next"] is None
+    assert len(idx.list(voice="narr")["items"]) == 5
+    assert [e["name"] for e in idx.list(since=1003, until=1500)["items"]] == [
+        "t4_by_narr.wav", "t3_by_narr.wav"]
+    assert idx.list(since="1970-01-01")["items"]
+
+
+def test_reconcile_external_changes(tmp_dirs):
+    out = tmp_dirs["output"]
+    _clip(out, "vecchio_by_narr.wav", 1000)
+    idx = OutputsIndex()
+    # indice nuovo: il primo uso importa i file già presenti
+    assert [e["voice_id"] for e in idx.list()["items"]] == ["narr"]
+    _clip(out, "copiato.wav", 3000, n=4800)
+    _clip(out, "vecchio_by_narr.wav", 2000, n=24000)  # sovrascritto fuori dall'app
+    idx.record(_clip(out, "sparito.wav", 1500))
+    (out / "sparito.wav").unlink()
+    (out / "note.txt").write_text("non audio")
+    assert idx.reconcile() == {"added": 1, "updated": 1, "removed": 1, "total": 2}
+    items = {e["name"]: e for e in idx.list()["items"]}
+    assert set(items) == {"copiato.wav", "vecchio_by_narr.wav"}
+    assert items["vecchio_by_narr.wav"]["duration"] == 1.0
+    assert idx.reconcile() == {"added": 0, "updated": 0, "removed": 0, "total": 2}
@@ -88,3 +88,90 @@ def test_pipeline_out_name_sanitized(tmp_dirs):
     # il file finisce dentro OUTPUT_DIR, senza componenti di path
     assert str(appconfig.OUTPUT_DIR) in out
     assert "etc/evil" not in out
+
+
+def test_run_generation_many_keeps_order(tmp_dirs):
+    """Inferenza in fila, stadi 2-3 sul pool CPU: i path tornano nell'ordine
+    delle richieste e il progress arriva a 1."""
+    _write(tmp_dirs["config"], "narr", {
+        "language": "Italian", "voice_description": "x"})
+    mm, seen = FakeMM(), []
+    reqs = [dict(text=f"frase {i}", voice_id="narr", out_name=f"item_{i}",
+                 speed=0.8 if i % 2 else None) for i in range(5)]
+    outs = pipeline.run_generation_many(mm, reqs, progress=seen.append)
+    assert [o.rsplit("/", 1)[-1] for o in outs] == [f"item_{i}.wav" for i in range(5)]
+    assert [c[1] for c in mm.calls] == [f"frase {i}" for i in range(5)]
+    assert seen[-1] == 1.0
+
+
+def test_run_generation_many_bad_voice_fails_before_model(tmp_dirs):
+    mm = FakeMM()
+    try:
+        pipeline.run_generation_many(mm, [dict(text="x", voice_id="manca")])
+        assert False, "atteso ValueError"
+    except ValueError:
+        pass
+    assert mm.calls == []
+
+
+class FakeBatchMM(FakeMM):
+    def generate_design_batch(self, texts, language, voice_description, temperature=None):
+        self.calls.append(("design_batch", list(texts)))
+        return [np.zeros(2400, dtype="float32") for _ in texts], 24000
+
+
+def test_micro_batches_group_by_voice_and_limit_padding(tmp_dirs):
+    plan = lambda text, desc="x": {"type": "design", "language": "Italian",
+                                   "temperature": None, "voice_description": desc,
+                                   "text": text}
+    plans = [plan("a" * 10), plan("b" * 10, desc="y"), plan("c" * 11),
+             plan("d" * 100), plan("e" * 12)]
+    batches = pipeline._micro_batches(plans, max_size=8, max_waste=0.3)
+    # voce diversa → batch a sé; il testo lungo 100 sprecherebbe troppo padding
+    assert sorted(map(sorted, batches)) == [[0, 2, 4], [1], [3]]
+    assert all(len(b) <= 2 for b in pipeline._micro_batches(plans, max_size=2))
+
+
+def test_run_generation_many_uses_batch_entry_point(tmp_dirs):
+    _write(tmp_dirs["config"], "narr", {
+        "language": "Italian", "voice_description": "x"})
+    mm = FakeBatchMM()
+    reqs = [dict(text=f"frase {i}", voice_id="narr", out_name=f"b_{i}") for i in range(3)]
+    outs = pipeline.run_generation_many(mm, reqs)
+    assert mm.calls == [("design_batch", ["frase 0", "frase 1", "frase 2"])]
+    assert [o.rsplit("/", 1)[-1] for o in outs] == ["b_0.wav", "b_1.wav", "b_2.wav"]
+
+
+def test_segment_text_budget_and_boundaries():
+    text = "Prima frase breve. Seconda frase, con una virgola; e un punto e virgola. " \
+           + "parola " * 40
+    segs = pipeline.segment_text(text, max_chars=60)
+    assert all(len(s) <= 60 for s in segs)
+    assert " ".join(segs).split() == text.split()  # nessuna parola persa
+    assert segs[0] == "Prima frase breve."
+    assert pipeline.segment_text("Corta.", max_chars=60) == ["Corta."]
+
+
+def test_long_text_segments_retry_and_join(tmp_dirs, monkeypatch):
+    """Testo lungo → un generate per segmento, il segmento che fallisce una volta
+    viene ritentato da solo, l'audio finale è la somma meno i crossfade."""
+    from app import config as appconfig
+    monkeypatch.setattr(appconfig, "SEGMENT_MAX_CHARS", 20)
+    _write(tmp_dirs["config"], "narr", {"language": "Italian", "voice_description": "x"})
+
+    class FlakyMM(FakeMM):
+        failed = False
+
+        def generate_design(self, text, language, voice_description, temperature=None):
+            if text.startswith("Due") and not FlakyMM.failed:
+                FlakyMM.failed = True
+                raise RuntimeError("errore transitorio")
+            return super().generate_design(text, language, voice_description, temperature)
+
+    mm, seen = FlakyMM(), []
+    out = pipeline.run_generation(mm, text="Uno uno uno. Due due due. Tre tre tre.",
+                                  voice_id="narr", progress=seen.append)
+    assert [c[1] for c in mm.calls] == ["Uno uno uno.", "Due due due.", "Tre tre tre."]
+    xf = int(24000 * appconfig.SEGMENT_CROSSFADE_MS / 1000)
+    assert len(sf.read(out)[0]) == 3 * 2400 - 2 * xf
+    assert seen[-1] == 1.0
@@ -0,0 +1,83 @@
+"""Check: la cache dei render evita il modello sui rigenera identici e resta
+nel budget di dimensione."""
+import numpy as np
+import soundfile as sf
+
+from app import pipeline, render_cache
+from tests.conftest import _write
+from tests.test_pipeline import FakeMM
+
+
+def test_identical_request_hits_cache(tmp_dirs):
+    _write(tmp_dirs["config"], "narr", {"language": "Italian", "voice_description": "x"})
+    cache = render_cache.default_cache
+    hits0 = cache.stats()["hits"]
+    mm = FakeMM()
+    first = pipeline.run_generation(mm, text="ciao", voice_id="narr")
+    again = pipeline.run_generation(mm, text="ciao", voice_id="narr")
+    assert again == first and len(mm.calls) == 1
+    assert cache.stats()["hits"] == hits0 + 1
+
+    # parametro diverso → render diverso; temperature → mai cachato
+    pipeline.run_generation(mm, text="ciao", voice_id="narr", pitch=2.0)
+    pipeline.run_generation(mm, text="ciao", voice_id="narr", temperature=0.9)
+    pipeline.run_generation(mm, text="ciao", voice_id="narr", temperature=0.9)
+    assert len(mm.calls) == 4
+
+
+def test_sample_content_is_part_of_key(tmp_dirs):
+    sample = tmp_dirs["samples"] / "z.wav"
+    sf.write(sample, np.zeros(2400, dtype="float32"), 24000)
+    _write(tmp_dirs["config"], "z", {
+        "mode": "voice_clone", "language": "Italian",
+        "prompt_speech_path": str(sample), "ref_text": "rif"})
+    mm = FakeMM()
+    pipeline.run_generation(mm, text="testo", voice_id="z")
+    pipeline.run_generation(mm, text="testo", voice_id="z")
+    assert len(mm.calls) == 1
+    sf.write(sample, np.ones(4800, dtype="float32") * 0.1, 24000)  # campione sostituito
+    pipeline.run_generation(mm, text="testo", voice_id="z")
+    assert len(mm.calls) == 2
+
+
+def test_lru_eviction_by_size(tmp_dirs):
+    cache = render_cache.RenderCache(max_bytes=250)
+    out = tmp_dirs["output"]
+    for i in range(3):
+        (out / f"f{i}.wav").write_bytes(b"x" * 100)
+        cache.put(f"k{i}", str(out / f"f{i}.wav"))
+    cache.get("k1", out / "again.wav")       # k1 usato di recente → resta
+    (out / "f3.wav").write_bytes(b"x" * 100)
+    cache.put("k3", str(out / "f3.wav"))
+    stats = cache.stats()
+    assert stats["bytes"] <= 250 and stats["evictions"] == 2
+    assert cache.get("k0", out / "x.wav") is None
+    assert cache.get("k1", out / "y.wav") is not None
+
+
+def test_hits_do_not_rewrite_index(tmp_dirs, monkeypatch):
+    cache = render_cache.RenderCache()
+    out = tmp_dirs["output"]
+    for i in range(2):
+        (out / f"f{i}.wav").write_bytes(b"x" * 100)
+        cache.put(f"k{i}", str(out / f"f{i}.wav"))
+    saves = []
+    real_save = cache._save
+    monkeypatch.setattr(cache, "_save", lambda root: saves.append(1) or real_save(root))
+    for _ in range(20):
+        assert cache.get("k0", out / "hit.wav") is not None
+    assert saves == []  # hit: LRU aggiornato solo in memoria
+    cache.flush()
+    assert saves == [1]
+    # l'ordine salvato sopravvive: k0 (usato per ultimo) è in coda
+    reloaded = render_cache.RenderCache()
+    reloaded.stats()
+    assert list(reloaded._index) == ["k1", "k0"]
+
+
+def test_file_digest_memo_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(render_cache, "_DIGEST_MEMO", 3)
+    for i in range(5):
+        (tmp_path / f"{i}.bin").write_bytes(bytes([i]))
+        render_cache.file_digest(tmp_path / f"{i}.bin")
+    assert len(render_cache._digests) <= 3
@@ -0,0 +1,73 @@
+"""Retention di OUTPUT: età massima, budget LRU, pin e periodo di grazia."""
+import os
+
+import numpy as np
+import soundfile as sf
+
+from app.outputs_index import OutputsIndex
+from app.retention import RetentionManager
+
+NOW = 10_000_000.0
+DAY = 86400
+
+
+def _clip(idx, out, name, accessed, n=24000):
+    p = out / name
+    sf.write(str(p), np.zeros(n, dtype="float32"), 24000)  # ~48 KB
+    os.utime(p, (accessed, accessed))
+    idx.record(p)
+    idx._conn().execute("UPDATE outputs SET accessed = ? WHERE name = ?", (accessed, name))
+    return p
+
+
+def test_max_age_keeps_pinned(tmp_dirs):
+    out, idx = tmp_dirs["output"], OutputsIndex()
+    _clip(idx, out, "vecchio.wav", NOW - 40 * DAY)
+    _clip(idx, out, "scena.wav", NOW - 40 * DAY)
+    _clip(idx, out, "recente.wav", NOW - DAY)
+    idx.set_pinned(["scena.wav"])
+    res = RetentionManager(idx, max_bytes=0, max_age=30 * DAY).sweep(now=NOW)
+    assert res["files"] == ["vecchio.wav"] and res["reclaimed"] > 40_000
+    assert sorted(p.name for p in out.iterdir()) == ["recente.wav", "scena.wav"]
+
+
+def test_budget_evicts_least_recently_accessed(tmp_dirs):
+    out, idx = tmp_dirs["output"], OutputsIndex()
+    for i, name in enumerate(["a.wav", "b.wav", "c.wav", "d.wav"]):
+        _clip(idx, out, name, NOW - 1000 + i * 100)
+    idx._conn().execute("UPDATE outputs SET accessed = ? WHERE name = 'a.wav'", (NOW - 500,))
+    _clip(idx, out, "nuovo.wav", NOW - 10)  # dentro il periodo di grazia
+    size = (out / "a.wav").stat().st_size
+    mgr = RetentionManager(idx, max_bytes=int(3.5 * size), max_age=0)
+    res = mgr.sweep(now=NOW)
+    # a.wav è stato riascoltato: escono b e c (meno recenti), nuovo.wav è in grazia
+    assert res["files"] == ["b.wav", "c.wav"]
+    assert sorted(p.name for p in out.iterdir()) == ["a.wav", "d.wav", "nuovo.wav"]
+    assert mgr.stats()["reclaimed"] == 2 * size
+    assert mgr.sweep(now=NOW)["removed"] == 0
+
+
+def test_disabled_by_default(tmp_dirs):
+    out, idx = tmp_dirs["output"], OutputsIndex()
+    _clip(idx, out, "vecchio.wav", NOW - 400 * DAY)
+    assert RetentionManager(idx).sweep(now=NOW)["removed"] == 0
+
+
+def test_failed_unlink_not_counted(tmp_dirs, monkeypatch):
+    from pathlib import Path
+    out, idx = tmp_dirs["output"], OutputsIndex()
+    _clip(idx, out, "occupato.wav", NOW - 40 * DAY)
+    _clip(idx, out, "vecchio.wav", NOW - 40 * DAY)
+    real_unlink = Path.unlink
+
+    def unlink(self, missing_ok=False):
+        if self.name == "occupato.wav":
+            raise PermissionError("in uso")
+        real_unlink(self, missing_ok=missing_ok)
+    monkeypatch.setattr(Path, "unlink", unlink)
+    mgr = RetentionManager(idx, max_bytes=0, max_age=30 * DAY)
+    res = mgr.sweep(now=NOW)
+    assert res["files"] == ["vecchio.wav"] and res["removed"] == 1
+    assert mgr.removed == 1 and res["reclaimed"] == idx.usage()["bytes"]  # stessa taglia
+    assert (out / "occupato.wav").exists()
+    assert [e["name"] for e in idx.least_recent(NOW)] == ["occupato.wav"]
@@ -8,7 +8,7 @@ import soundfile as sf
 from app.pipeline import stitch_scene
 
 
-def test_stitch_lengths():
+def test_stitch_lengths(tmp_dirs):
     sr = 24000
     a = np.ones(sr, dtype="float32")          # 1s
     b = np.ones(sr // 2, dtype="float32")     # 0.5s
@@ -26,6 +26,148 @@ def test_stitch_lengths():
             os.remove(out)
 
 
+def test_stitch_rereads_only_changed_clips(tmp_dirs, monkeypatch):
+    from app import pipeline
+    sr = 24000
+    paths = []
+    for i, n in enumerate((sr, sr // 2, sr // 4)):
+        p = tmp_dirs["output"] / f"c{i}.wav"
+        sf.write(p, np.full(n, 0.1 * (i + 1), dtype="float32"), sr)
+        paths.append(str(p))
+    pipeline.clip_cache.clear()
+    reads = []
+    real_read = pipeline.sf.read
+    monkeypatch.setattr(pipeline.sf, "read",
+                        lambda p, **kw: reads.append(os.path.basename(p)) or real_read(p, **kw))
+    pipeline.stitch_scene(paths, [0.25, 0.5], "scena", fmt="wav")
+    assert reads == ["c0.wav", "c1.wav", "c2.wav"]
+    sf.write(paths[1], np.full(sr, -0.2, dtype="float32"), sr)  # battuta rigenerata
+    os.utime(paths[1], ns=(0, 123))  # mtime diverso anche su fs a bassa risoluzione
+    reads.clear()
+    out = pipeline.stitch_scene(paths, [0.25, 0.5], "scena", fmt="wav")
+    assert reads == ["c1.wav"]
+    scene, _ = real_read(out, dtype="float32")
+    expected = np.concatenate([np.full(sr, 0.1), np.zeros(sr // 4), np.full(sr, -0.2),
+                               np.zeros(sr // 2), np.full(sr // 4, 0.3)])
+    assert np.allclose(scene, expected, atol=1e-4)
+
+
+def test_stitch_streams_with_bounded_memory(tmp_dirs, monkeypatch):
+    """La scena non passa mai intera in RAM: picco ≈ un clip, non la scena."""
+    import tracemalloc
+    from app import pipeline
+    sr, n = 24000, 12000
+    paths = []
+    for i in range(30):
+        p = tmp_dirs["output"] / f"l{i}.wav"
+        sf.write(p, np.full(n, 0.01 * (i + 1), dtype="float32"), sr)
+        paths.append(str(p))
+    monkeypatch.setattr(pipeline, "clip_cache", pipeline._ClipCache(max_bytes=1))
+    tracemalloc.start()
+    try:
+        out = pipeline.stitch_scene(paths, [1.0] * 30, "lunga", fmt="wav")
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    scene, _ = sf.read(out, dtype="float32")
+    assert len(scene) == 30 * (n + sr)
+    assert np.allclose(scene[sr + n:sr + 2 * n], 0.02, atol=1e-4)
+    assert peak < 6 * (n + sr) * 4  # la scena float32 intera sarebbe 30x
+
+
+def test_stitch_mp3_pipe(tmp_dirs, monkeypatch):
+    """mp3 senza encoder in-process: il PCM va in pipe a ffmpeg, nessun WAV intermedio."""
+    import sys
+    from app import encoders, pipeline
+    sr = 24000
+    p = tmp_dirs["output"] / "a.wav"
+    sf.write(p, np.full(sr // 2, 0.5, dtype="float32"), sr)
+    monkeypatch.setattr(encoders, "native", lambda fmt: False)
+    # "encoder" finto: salva i byte ricevuti su stdin al path di destinazione
+    monkeypatch.setattr(encoders, "ffmpeg_cmd", lambda sr, ch, dst, fmt: [
+        sys.executable, "-c",
+        f"import sys; open({dst!r}, 'wb').write(sys.stdin.buffer.read())"])
+    out = pipeline.stitch_scene([str(p)], [0.25], "scena", fmt="mp3")
+    assert out.endswith("scena.mp3")
+    assert not (tmp_dirs["output"] / "scena.wav").exists()
+    pcm = np.frombuffer(open(out, "rb").read(), dtype="<f4")
+    assert len(pcm) == sr // 2 + sr // 4
+    assert np.allclose(pcm[:sr // 2], 0.5, atol=1e-4) and not pcm[sr // 2:].any()
+
+
+def test_stitch_mp3_native(tmp_dirs):
+    import pytest
+    from app import encoders, pipeline
+    if not encoders.native("mp3"):
+        pytest.skip("libsndfile senza mp3")
+    sr = 24000
+    p = tmp_dirs["output"] / "a.wav"
+    sf.write(p, np.full(sr, 0.25, dtype="float32"), sr)
+    out = pipeline.stitch_scene([str(p)] * 3, [0.5] * 3, "scena", fmt="mp3")
+    assert out.endswith("scena.mp3") and not (tmp_dirs["output"] / "scena.wav").exists()
+    assert abs(sf.info(out).duration - 4.5) < 0.1
+
+
+def test_incremental_rerender_matches_full(tmp_dirs):
+    """Battuta cambiata/aggiunta/tolta: prefisso e suffisso invariati copiati dal
+    WAV precedente, risultato identico byte per byte a un render da zero."""
+    import json
+    from app import pipeline
+    sr, out = 24000, tmp_dirs["output"]
+    rng = np.random.default_rng(0)
+
+    def clip(name, n):
+        sf.write(out / name, rng.uniform(-0.5, 0.5, n).astype("float32"), sr)
+        return str(out / name)
+
+    lines = [clip(f"r{i}.wav", 6000 + 1000 * i) for i in range(6)]
+    pauses = [0.2, 0.5, 0.0, 0.3, 0.1, 0.4]
+    pipeline.stitch_scene(lines, pauses, "scena")
+    manifest = tmp_dirs["cache"] / "scenes" / "scena.wav.json"
+    assert json.loads(manifest.read_text())["reused"] == 0
+
+    variants = [
+        (lines[:2] + [clip("nuova.wav", 9000)] + lines[3:], pauses),       # cambio in mezzo
+        (lines + [clip("coda.wav", 3000)], pauses + [0.0]),                # battuta aggiunta
+        (lines[1:], pauses[1:]),                                           # prima battuta tolta
+        (lines, pauses[:3] + [0.8] + pauses[4:]),                          # pausa cambiata
+    ]
+    for clips, ps in variants:
+        pipeline.stitch_scene(lines, pauses, "scena")  # torna alla versione base
+        pipeline.stitch_scene(clips, ps, "scena")
+        assert json.loads(manifest.read_text())["reused"] > 0
+        pipeline.stitch_scene(clips, ps, "da_zero")
+        assert (out / "scena.wav").read_bytes() == (out / "da_zero.wav").read_bytes()
+        (out / "da_zero.wav").unlink()
+
+
 if __name__ == "__main__":
     test_stitch_lengths()
     print("ok")
+
+
+def test_concurrent_stitches_of_same_scene(tmp_dirs):
+    """Due job Teatro con lo stesso titolo sulla corsia cpu (2 worker): gli
+    stitch si serializzano, niente .tmp condiviso né manifest incrociati."""
+    import json
+    from concurrent.futures import ThreadPoolExecutor
+    from app import pipeline
+    sr, out = 24000, tmp_dirs["output"]
+    rng = np.random.default_rng(1)
+    lines = []
+    for i in range(8):
+        sf.write(out / f"c{i}.wav", rng.uniform(-0.5, 0.5, 12000).astype("float32"), sr)
+        lines.append(str(out / f"c{i}.wav"))
+    pipeline.stitch_scene(lines, [0.1] * 8, "scena")  # manifest: i successivi sono incrementali
+    versions = [(lines[:4] + lines[5:], [0.1] * 7), (lines[:3] + lines[4:], [0.1] * 7)] * 4
+    with ThreadPoolExecutor(2) as pool:
+        list(pool.map(lambda v: pipeline.stitch_scene(v[0], v[1], "scena"), versions))
+    assert not list(out.glob("*.tmp"))
+    # ultimo render incrementale sopra lo stato lasciato dagli stitch concorrenti:
+    # se manifest e WAV non fossero coerenti il risultato differirebbe da zero
+    clips, ps = versions[0]
+    pipeline.stitch_scene(clips, ps, "scena")
+    pipeline.stitch_scene(clips, ps, "da_zero")
+    manifest = json.loads((tmp_dirs["cache"] / "scenes" / "scena.wav.json").read_text())
+    assert [c["name"] for c in manifest["clips"]] == [os.path.basename(c) for c in clips]
+    assert (out / "scena.wav").read_bytes() == (out / "da_zero.wav").read_bytes()
@@ -0,0 +1,33 @@
+"""Span per fase: trace del job (anche dai thread del pool) e istogrammi Prometheus."""
+from concurrent.futures import ThreadPoolExecutor
+
+from app import tracing
+
+
+def test_spans_go_to_trace_and_histogram():
+    h = tracing.Histogram("t_seconds", "test", ("phase",), buckets=(0.1, 1.0))
+    h.observe(0.05, phase="a")
+    h.observe(0.5, phase="a")
+    h.observe(5.0, phase="a")
+    lines = h.render()
+    assert 't_seconds_bucket{phase="a",le="0.1"} 1' in lines
+    assert 't_seconds_bucket{phase="a",le="1"} 2' in lines
+    assert 't_seconds_bucket{phase="a",le="+Inf"} 3' in lines
+    assert 't_seconds_count{phase="a"} 3' in lines
+
+    before = tracing.PHASES.count(phase="t_work")
+    with tracing.trace() as tr, ThreadPoolExecutor(2) as pool:
+        with tracing.span("t_work"):
+            pass
+        pool.submit(tracing.bind(tracing.traced("t_work")(lambda: None))).result()
+        pool.submit(tracing.traced("t_work")(lambda: None)).result()  # senza bind: fuori
+    assert tr.summary()["spans"]["t_work"]["count"] == 2
+    assert tracing.PHASES.count(phase="t_work") == before + 3
+
+
+def test_finish_job_rtf():
+    with tracing.trace() as tr:
+        tracing.record_audio("clone", 6.0)
+    summary = tracing.finish_job(tr, "base", "done", 2.0)
+    assert summary["audio_seconds"] == {"clone": 6.0} and summary["seconds"] == 2.0
+    assert tracing.RTF.count(voice_type="clone") >= 1
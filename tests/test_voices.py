@@ -81,3 +81,42 @@ def test_create_clone_writes_config_and_wav(tmp_dirs):
     assert sample is not None and sample.exists()
     data, sr = sf.read(sample)
     assert sr == 24000  # convertito a 24k
+
+
+def test_registry_parses_once_and_sees_external_edits(tmp_dirs, monkeypatch):
+    _write(tmp_dirs["config"], "narr", {"language": "Italian", "voice_description": "x"})
+    parsed = []
+    real_loads = json.loads
+    monkeypatch.setattr(voices.json, "loads", lambda s, **kw: parsed.append(1) or real_loads(s, **kw))
+    voices.list_voices()
+    voices.get_voice("narr")
+    voices.load_config("narr")
+    voices.get_voice("narr")
+    assert len(parsed) == 1, "config riletto senza che il file sia cambiato"
+
+    # modifica esterna (editor): rilevata dallo stat, riletta una volta
+    _write(tmp_dirs["config"], "narr", {"language": "English", "voice_description": "y!"})
+    assert voices.get_voice("narr")["language"] == "English"
+    # file aggiunto/rimosso fuori dall'app
+    _write(tmp_dirs["config"], "nuova", {"voice_description": "z"})
+    assert {v["id"] for v in voices.list_voices()} == {"narr", "nuova"}
+    (tmp_dirs["config"] / "nuova.json").unlink()
+    assert voices.get_voice("nuova") is None
+
+
+def test_registry_indexes_and_copies(tmp_dirs):
+    _write(tmp_dirs["config"], "a_docente", {
+        "mode": "voice_clone", "language": "Italian",
+        "prompt_speech_path": "VOICE_SAMPLES/a.wav", "ref_text": "x"})
+    _write(tmp_dirs["config"], "b", {
+        "mode": "voice_clone", "language": "English",
+        "prompt_speech_path": "VOICE_SAMPLES/a.wav", "ref_text": "x"})
+    reg = voices.registry
+    assert reg.ids(tag="docente") == {"a_docente"}
+    assert reg.ids(language="English") == {"b"}
+    assert reg.ids(sample="VOICE_SAMPLES/a.wav") == {"a_docente", "b"}
+    # il chiamante può modificare la copia senza sporcare l'indice
+    voices.load_config("b")["ref_text"] = "sporco"
+    assert voices.load_config("b")["ref_text"] == "x"
+    voices.update_voice("b", tags=["narratore"])
+    assert reg.ids(tag="narratore") == {"b"}
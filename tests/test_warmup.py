@@ -0,0 +1,45 @@
+"""Warm-up allo startup: fasi cronometrate per modello e readiness."""
+from app.warmup import Warmup
+
+
+class _MM:
+    def __init__(self):
+        self.warmed = []
+
+    def warmup(self, kind):
+        if kind == "design":
+            raise RuntimeError("pesi mancanti")
+        self.warmed.append(kind)
+        return {"import": 0.01, "load": 0.5, "first_inference": 0.2}
+
+
+class _Pool:
+    started = False
+
+    def start(self):
+        self.started = True
+
+
+def test_warmup_phases_and_ready():
+    mm, pool = _MM(), _Pool()
+    w = Warmup(mm, models=["base"], pool=pool)
+    assert not w.ready and w.report()["components"]["base"]["status"] == "pending"
+    w.run()
+    rep = w.report()
+    assert w.ready and rep["ready"] and pool.started and mm.warmed == ["base"]
+    assert set(rep["components"]["base"]["phases"]) == {"import", "load", "first_inference"}
+    assert rep["components"]["dsp"]["status"] == "ready"
+
+
+def test_warmup_error_keeps_not_ready():
+    w = Warmup(_MM(), models=["design", "base"], pool=None)
+    w.run()
+    rep = w.report()
+    assert not rep["ready"]
+    assert rep["components"]["design"]["status"] == "error"
+    assert "pesi mancanti" in rep["components"]["design"]["error"]
+    assert rep["components"]["base"]["status"] == "ready"  # gli altri proseguono
+
+
+def test_no_components_is_ready():
+    assert Warmup(None, models=(), pool=None).ready